@@ -0,0 +1,249 @@
+import os
+import json
+import typing
+from pathlib import Path
+
+import numpy
+import scipy.spatial
+import typeguard
+
+from gmshio import read_pos
+
+# Header of each run : magic, number of nodes, of triangles and of parameters, size of the run in bytes (header included)
+RUN_HEADER = numpy.dtype([('magic','S4'),('nodes','<u4'),('triangles','<u4'),('parameters','<u4'),('size','<u8')])
+RUN_MAGIC = b'RUN1'
+
+# Fields of the field maps (.pos files written by the Map post-operation)
+FIELDS = ['v','j','losses']
+
+def _padded(size : int) -> int:
+    return (size + 7) // 8 * 8
+
+@typeguard.typechecked
+def read_maps(workdir : Path, outputfiles : str) -> typing.Dict[str,numpy.ndarray]:
+    """
+    Mesh and fields of the field maps (v, j and losses .pos files in the GmshParsed format) :
+        * 'nodes'     : coordinates of the nodes (m,2)
+        * 'triangles' : nodes of the triangles (n,3)
+        * 'v'         : potential at the nodes (m,)
+        * 'j'         : current density on the triangles (n,2)
+        * 'losses'    : density of losses on the triangles (n,)
+    The current density and the losses are constant on the triangles (P1 potential).
+    """
+    pos = {name : read_pos(workdir / f"{name}{outputfiles}.pos") for name in FIELDS}
+    nodes, triangles = numpy.unique(pos['v']['triangles'].reshape(-1,2),axis=0,return_inverse=True)
+    triangles = triangles.reshape(-1,3)
+
+    v = numpy.zeros(nodes.shape[0])
+    v[triangles.reshape(-1)] = pos['v']['values'].reshape(-1)
+    return {
+        'nodes'     : nodes,
+        'triangles' : triangles,
+        'v'         : v,
+        'j'         : numpy.mean(pos['j']['values'][:,:,0:2],axis=1),
+        'losses'    : numpy.mean(pos['losses']['values'][:,:,0],axis=1),
+    }
+
+class FieldArchive(object):
+    """
+    Append-only archive of the mesh and field maps of evaluations, in a single memory-mapped file.
+
+    The file starts with a header (magic, length and JSON description : names of the parameters and
+    type of the fields), followed by one block per run, aligned on 8 bytes:
+        * header (see RUN_HEADER)
+        * parameters, float64 (p,)
+        * coordinates of the nodes, float64 (m,2)
+        * triangles, int32 (n,3)
+        * potential at the nodes (m,), current density (n,2) and losses (n,) on the triangles, float32 by default
+    The index of the runs is rebuilt from their headers when the archive is opened, a run that was only
+    partially written (interrupted run) is dropped, and overwritten when opened for appending. Opened read-only,
+    the archive can be read while another process appends to it (the runs appended since are not seen).
+    Runs are read as views on the memory-mapped file, without copy nor parsing.
+    """
+
+    MAGIC = b'ELEC0041'
+
+    @typeguard.typechecked
+    def __init__(self,*, path : typing.Union[str,Path], names : typing.List[str], dtype : str = 'float32', mode : str = 'a'):
+        """
+        Initialize archive:
+            * file of the archive
+            * names of the parameters of the runs
+            * type of the fields, 'float32' or 'float64'
+            * 'a' to append to the archive (created if needed), or 'r' to read an existing archive only
+        """
+        assert dtype in ['float32','float64'],dtype
+        assert mode in ['a','r'],mode
+        self.path = Path(path)
+        self.names = names
+        self.dtype = numpy.dtype(dtype)
+        self.mode = mode
+        description = json.dumps({'names' : names,'dtype' : dtype}).encode()
+
+        if mode == 'a' and (not self.path.exists() or self.path.stat().st_size == 0):
+            header = self.MAGIC + numpy.uint32(len(description)).tobytes() + description
+            self.path.write_bytes(header + b'\0' * (_padded(len(header)) - len(header)))
+        with open(self.path,'rb') as f:
+            assert f.read(len(self.MAGIC)) == self.MAGIC,f"{self.path} is not a field archive"
+            length = int(numpy.frombuffer(f.read(4),dtype='<u4')[0])
+            existing = json.loads(f.read(length))
+        if existing != {'names' : names,'dtype' : dtype}:
+            raise ValueError(f"{self.path} holds another archive : {existing}")
+        self._start = _padded(len(self.MAGIC) + 4 + length)
+
+        self._map : typing.Optional[numpy.memmap] = None
+        self._index()
+
+    def __getstate__(self):
+        """
+        Do not ship the memory map to worker processes.
+        """
+        state = self.__dict__.copy()
+        state['_map'] = None
+        return state
+
+    def _index(self):
+        """
+        Offsets of the complete runs, the file is truncated after the last one when appending.
+        """
+        self.offsets : typing.List[int] = []
+        size = self.path.stat().st_size
+        offset = self._start
+        with open(self.path,'r+b' if self.mode == 'a' else 'rb') as f:
+            while offset + RUN_HEADER.itemsize <= size:
+                f.seek(offset)
+                header = numpy.frombuffer(f.read(RUN_HEADER.itemsize),dtype=RUN_HEADER)[0]
+                if header['magic'] != RUN_MAGIC or int(header['size']) <= RUN_HEADER.itemsize or offset + int(header['size']) > size:
+                    break
+                self.offsets.append(offset)
+                offset += int(header['size'])
+            if self.mode == 'a':
+                f.truncate(offset)
+        self._end = offset
+        self._map = None
+
+    def _layout(self,nodes : int, triangles : int, parameters : int) -> typing.List[typing.Tuple[str,numpy.dtype,tuple]]:
+        return [
+            ('parameters',numpy.dtype('<f8'),(parameters,)),
+            ('nodes'     ,numpy.dtype('<f8'),(nodes,2)),
+            ('triangles' ,numpy.dtype('<i4'),(triangles,3)),
+            ('v'         ,self.dtype        ,(nodes,)),
+            ('j'         ,self.dtype        ,(triangles,2)),
+            ('losses'    ,self.dtype        ,(triangles,)),
+        ]
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @typeguard.typechecked
+    def append(self,*, parameters : typing.Dict[str,float], nodes : numpy.ndarray, triangles : numpy.ndarray, v : numpy.ndarray, j : numpy.ndarray, losses : numpy.ndarray) -> int:
+        """
+        Append a run (see read_maps for the arrays). Returns its index.
+        """
+        assert self.mode == 'a',f"{self.path} is opened read-only"
+        values = {
+            'parameters' : numpy.array([parameters[name] for name in self.names]),
+            'nodes' : nodes, 'triangles' : triangles, 'v' : v, 'j' : j, 'losses' : losses,
+        }
+        layout = self._layout(nodes.shape[0],triangles.shape[0],len(self.names))
+        chunks = []
+        for name,dtype,shape in layout:
+            data = numpy.ascontiguousarray(values[name],dtype=dtype).reshape(shape).tobytes()
+            chunks.append(data + b'\0' * (_padded(len(data)) - len(data)))
+
+        header = numpy.zeros(1,dtype=RUN_HEADER)
+        header[0] = (RUN_MAGIC,nodes.shape[0],triangles.shape[0],len(self.names),RUN_HEADER.itemsize + sum(len(c) for c in chunks))
+        with open(self.path,'r+b') as f:
+            f.seek(self._end)
+            f.write(header.tobytes() + b''.join(chunks))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.offsets.append(self._end)
+        self._end += int(header[0]['size'])
+        self._map = None
+        return len(self.offsets) - 1
+
+    @typeguard.typechecked
+    def run(self,i : int) -> typing.Dict[str,numpy.ndarray]:
+        """
+        Parameters, mesh and fields of a run, as read-only views on the file.
+        """
+        if self._map is None:
+            self._map = numpy.memmap(self.path,dtype=numpy.uint8,mode='r',shape=(self._end,))
+        offset = self.offsets[i]
+        header = self._map[offset:offset + RUN_HEADER.itemsize].view(RUN_HEADER)[0]
+        offset += RUN_HEADER.itemsize
+
+        arrays = {}
+        for name,dtype,shape in self._layout(int(header['nodes']),int(header['triangles']),int(header['parameters'])):
+            size = int(numpy.prod(shape)) * dtype.itemsize
+            arrays[name] = self._map[offset:offset + size].view(dtype).reshape(shape)
+            offset += _padded(size)
+        return arrays
+
+    @typeguard.typechecked
+    def holds(self,i : int, parameters : typing.Dict[str,float]) -> bool:
+        """
+        Whether run i exists and was computed for these parameters.
+        """
+        return 0 <= i < len(self) and numpy.array_equal(self.run(i)['parameters'],[parameters[name] for name in self.names])
+
+    @property
+    def parameters(self) -> numpy.ndarray:
+        """
+        Parameters of the runs (runs,p).
+        """
+        return numpy.array([self.run(i)['parameters'] for i in range(len(self))]).reshape(-1,len(self.names))
+
+    def hot_spots(self) -> typing.Dict[str,numpy.ndarray]:
+        """
+        Largest current density of each run (runs,) and the centroid of its triangle (runs,2).
+        """
+        magnitude, location = numpy.zeros(len(self)), numpy.zeros((len(self),2))
+        for i in range(len(self)):
+            run = self.run(i)
+            norm = numpy.hypot(run['j'][:,0],run['j'][:,1])
+            k = int(numpy.argmax(norm))
+            magnitude[i] = norm[k]
+            location[i] = numpy.mean(run['nodes'][run['triangles'][k]],axis=0)
+        return {'j' : magnitude,'location' : location}
+
+    def losses(self) -> numpy.ndarray:
+        """
+        Losses of each run integrated over its triangles (runs,).
+        """
+        totals = numpy.zeros(len(self))
+        for i in range(len(self)):
+            run = self.run(i)
+            x, y = run['nodes'][run['triangles'],0], run['nodes'][run['triangles'],1]
+            area = 0.5 * numpy.abs((x[:,1] - x[:,0]) * (y[:,2] - y[:,0]) - (x[:,2] - x[:,0]) * (y[:,1] - y[:,0]))
+            totals[i] = numpy.sum(area * run['losses'])
+        return totals
+
+    @typeguard.typechecked
+    def difference(self,i : int, k : int, field : str = 'j') -> numpy.ndarray:
+        """
+        Field of run k minus that of run i, on the mesh of run i : on the triangles (j, losses),
+        from the triangle of run k with the nearest centroid, or at the nodes (v), from the nearest node.
+        """
+        assert field in FIELDS,field
+        a, b = self.run(i), self.run(k)
+        if field == 'v':
+            points, reference = a['nodes'], b['nodes']
+        else:
+            points, reference = numpy.mean(a['nodes'][a['triangles']],axis=1), numpy.mean(b['nodes'][b['triangles']],axis=1)
+        _, nearest = scipy.spatial.cKDTree(reference).query(points)
+        return b[field][nearest].astype(numpy.float64) - a[field]
+
+    @typeguard.typechecked
+    def nearest(self,i : int) -> int:
+        """
+        Run whose parameters are the nearest to those of run i, relative to the spread of the parameters in the archive.
+        """
+        assert len(self) >= 2,"At least two runs are needed"
+        X = self.parameters
+        spread = numpy.ptp(X,axis=0)
+        distance = numpy.linalg.norm((X - X[i]) / numpy.where(spread > 0.0,spread,1.0),axis=1)
+        distance[i] = numpy.inf
+        return int(numpy.argmin(distance))
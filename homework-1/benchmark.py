@@ -0,0 +1,238 @@
+"""
+Benchmarks of the evaluation pipeline.
+
+Run from the root of the repository (GMSH and GETDP must be installed, see requirements.system.gmsh.and.getdp.txt):
+    python homework-1/benchmark.py --output benchmark.json
+    python homework-1/benchmark.py --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import typing
+import logging
+import argparse
+import platform
+import subprocess
+import tracemalloc
+
+import numpy
+import typeguard
+
+import optimization
+import geometry
+import metrics
+from store import ResultStore
+
+# Mesh constants scaled by the refinement ratio
+MESH_PARAMETERS_FILE = optimization.HOMEWORK_1 / 'mesh.parameters.geo'
+
+# Phases whose latency is reported
+PHASES = ['time_mesh','time_solve','time_read','time_assembly','time_linear','time_record']
+
+@typeguard.typechecked
+def percentiles(values : typing.Iterable[float]) -> typing.Dict[str,float]:
+    """
+    Mean, median, 90th and 99th percentiles (and count) of the finite values.
+    """
+    values = numpy.array(list(values),dtype=numpy.float64)
+    values = values[numpy.isfinite(values)]
+    if values.size == 0:
+        return {'count' : 0}
+    p50, p90, p99 = numpy.percentile(values,[50.0,90.0,99.0])
+    return {'count' : int(values.size), 'mean' : float(numpy.mean(values)), 'p50' : float(p50), 'p90' : float(p90), 'p99' : float(p99)}
+
+def _points(problem : optimization.Problem, n : int, seed : int) -> numpy.ndarray:
+    """
+    Random points within the bounds of the problem.
+    """
+    low  = numpy.array([v[1] for v in problem.input_parameters.values()])
+    high = numpy.array([v[2] for v in problem.input_parameters.values()])
+    return numpy.random.default_rng(seed).uniform(low,high,size=(n,low.size))
+
+@typeguard.typechecked
+def throughput(*, problem_kwargs : dict, evaluations : int, seed : int = 0) -> dict:
+    """
+    Serial evaluations (no cache) : evaluations per second and latency of each phase.
+    """
+    sink = []
+    problem = optimization.problem_homework_1(**problem_kwargs,metrics_sink=sink.append)
+    points = _points(problem,evaluations,seed)
+
+    started_at = time.perf_counter()
+    for x in points:
+        problem(x)
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        'evaluations'             : evaluations,
+        'elapsed'                 : elapsed,
+        'evaluations_per_second'  : evaluations / elapsed,
+        'phases'                  : {phase : percentiles([m.get(phase,float('nan')) for m in sink]) for phase in PHASES},
+    }
+
+@typeguard.typechecked
+def mesh_scaling(*, problem_kwargs : dict, ratios : typing.List[float], repeats : int = 1) -> typing.List[dict]:
+    """
+    Latency of an evaluation at the nominal point for each mesh refinement ratio (the smaller, the finer).
+    """
+    defaults = geometry.constants(MESH_PARAMETERS_FILE)
+    results = []
+    for ratio in ratios:
+        sink = []
+        problem = optimization.problem_homework_1(
+            **problem_kwargs,
+            mesh_parameters = {k : ratio * v for k,v in defaults.items()},
+            metrics_sink    = sink.append,
+        )
+        for _ in range(repeats):
+            problem.nominal()
+        elapsed = [sum(m[phase] for phase in ['time_mesh','time_solve','time_read']) for m in sink]
+        results.append({
+            'ratio'              : ratio,
+            'number_of_nodes'    : problem.number_of_nodes,
+            'number_of_elements' : problem.number_of_elements,
+            'elapsed'            : percentiles(elapsed),
+            'phases'             : {phase : percentiles([m.get(phase,float('nan')) for m in sink]) for phase in PHASES},
+        })
+        logging.info(f"> Benchmark : ratio {ratio} with {problem.number_of_elements} elements in {numpy.median(elapsed)} s")
+    return results
+
+@typeguard.typechecked
+def worker_scaling(*, problem_kwargs : dict, workers : typing.List[int], evaluations : int, seed : int = 0) -> typing.List[dict]:
+    """
+    Wall time of a batch of evaluations (evaluate_many, no cache) for each number of workers,
+    and speedup w.r.t. the first number of workers.
+    """
+    results = []
+    for n in workers:
+        problem = optimization.problem_homework_1(**problem_kwargs)
+        points = _points(problem,evaluations,seed)
+        started_at = time.perf_counter()
+        problem.evaluate_many(points=points,workers=n)
+        elapsed = time.perf_counter() - started_at
+        results.append({
+            'workers'                : n,
+            'elapsed'                : elapsed,
+            'evaluations_per_second' : evaluations / elapsed,
+            'speedup'                : results[0]['elapsed'] / elapsed if results else 1.0,
+        })
+        logging.info(f"> Benchmark : {n} workers, {evaluations / elapsed} evaluations per second")
+    return results
+
+@typeguard.typechecked
+def database_growth(*, rows : int, checkpoints : int = 5) -> dict:
+    """
+    Memory of a database filled with rows like those of problem_homework_1 (full problem),
+    at regularly spaced numbers of rows, and the rate at which rows are appended.
+    """
+    row = {
+        'currents' : numpy.zeros(4), 'voltages' : numpy.zeros(4), 'losses' : numpy.zeros(1),
+        'DO_y' : 0.0, 'DO_a' : 0.0, 'DO_b' : 0.0, 'number_of_nodes' : 0, 'number_of_elements' : 0,
+        **{k : 0.0 for k in metrics.METRICS},
+    }
+    marks = set(numpy.linspace(rows / checkpoints,rows,checkpoints).astype(int).tolist())
+
+    tracemalloc.start()
+    store = ResultStore()
+    growth = []
+    started_at = time.perf_counter()
+    for i in range(1,rows + 1):
+        store.append(row)
+        if i in marks:
+            growth.append({'rows' : i, 'bytes' : store.nbytes, 'traced_bytes' : tracemalloc.get_traced_memory()[0]})
+    elapsed = time.perf_counter() - started_at
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'rows'                : rows,
+        'bytes_per_row'       : 8 * sum(store[name].shape[1] for name in store.columns),
+        'appends_per_second'  : rows / elapsed,
+        'peak_traced_bytes'   : peak,
+        'growth'              : growth,
+    }
+
+def environment() -> dict:
+    """
+    Description of the machine and of the code that was benchmarked.
+    """
+    try:
+        commit = subprocess.check_output(['git','rev-parse','HEAD'],stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit'    : commit,
+        'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python'    : sys.version.split()[0],
+        'numpy'     : numpy.__version__,
+        'platform'  : platform.platform(),
+        'cpu_count' : os.cpu_count(),
+    }
+
+@typeguard.typechecked
+def run(*, quick : bool = False, solver : str = "getdp") -> dict:
+    """
+    Run all the benchmarks on the symmetric problem. Quick runs use fewer evaluations and levels.
+    """
+    problem_kwargs = {'filenamebase' : "busbar.sym", 'outputfiles' : ".sym", 'coef_I_inobj' : 2.0, 'solver' : solver}
+    return {
+        'environment'     : environment(),
+        'solver'          : solver,
+        'throughput'      : throughput(problem_kwargs=problem_kwargs,evaluations=4 if quick else 20),
+        'mesh_scaling'    : mesh_scaling(problem_kwargs=problem_kwargs,ratios=[4.0,2.0] if quick else [4.0,2.0,1.0,0.5],repeats=1 if quick else 3),
+        'worker_scaling'  : worker_scaling(problem_kwargs=problem_kwargs,workers=[1,2] if quick else [1,2,4,8],evaluations=4 if quick else 16),
+        'database_growth' : database_growth(rows=1000 if quick else 100000),
+    }
+
+@typeguard.typechecked
+def flatten(results : typing.Union[dict,list], prefix : str = '') -> typing.Dict[str,float]:
+    """
+    Numeric values of the results keyed by their path, e.g. 'mesh_scaling[ratio=2.0].elapsed.p50'.
+    Entries of lists are identified by their first key (ratio, workers, rows).
+    """
+    values = {}
+    items = results.items() if isinstance(results,dict) else [
+        (f"[{next(iter(item.keys()))}={next(iter(item.values()))}]" if isinstance(item,dict) else f"[{i}]",item) for i,item in enumerate(results)
+    ]
+    for k,v in items:
+        key = f"{prefix}{k}" if not prefix or str(k).startswith('[') else f"{prefix}.{k}"
+        if isinstance(v,(dict,list)):
+            values.update(flatten(v,key))
+        elif isinstance(v,(int,float)) and not isinstance(v,bool):
+            values[key] = float(v)
+    return values
+
+@typeguard.typechecked
+def compare(before : dict, after : dict) -> typing.List[typing.Tuple[str,float,float,float]]:
+    """
+    Values present in both results, with their relative change (after / before - 1).
+    """
+    before, after = flatten(before), flatten(after)
+    return [
+        (k,before[k],after[k],after[k] / before[k] - 1.0 if before[k] != 0.0 else float('nan'))
+        for k in before if k in after and not k.startswith('environment')
+    ]
+
+def main(argv : typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output',default='benchmark.json',help="JSON file to which the results are written")
+    parser.add_argument('--quick',action='store_true',help="fewer evaluations and levels")
+    parser.add_argument('--solver',default="getdp",choices=["getdp","native","native-iterative"])
+    parser.add_argument('--compare',nargs=2,metavar=('BEFORE','AFTER'),help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        before, after = [json.loads(open(file).read()) for file in args.compare]
+        for k,b,a,change in compare(before,after):
+            print(f"{k:60s} {b:14.6g} {a:14.6g} {100.0 * change:+8.1f}%")
+        return
+
+    results = run(quick=args.quick,solver=args.solver)
+    with open(args.output,'w') as f:
+        json.dump(results,f,indent=4)
+    logging.info(f"> Benchmark : results written to {args.output}")
+
+if __name__ == "__main__":
+
+    main()
@@ -158,13 +158,32 @@ PostProcessing {
 PostOperation {
   { Name Map; NameOfPostProcessing EleKin_v;
      Operation {
-       Print[ v, OnElementsOf Dom_Hgrad_v_Ele, File "v.pos" ];
-       Print[ j, OnElementsOf Dom_Hgrad_v_Ele, File "j.pos" ];
-       Print[ losses, OnElementsOf Dom_Hgrad_v_Ele, File "losses.pos" ];
+       Print[ v, OnElementsOf Dom_Hgrad_v_Ele, File "v.pos", Format GmshParsed ];
+       Print[ j, OnElementsOf Dom_Hgrad_v_Ele, File "j.pos", Format GmshParsed ];
+       Print[ losses, OnElementsOf Dom_Hgrad_v_Ele, File "losses.pos", Format GmshParsed ];
        Print[ I, OnRegion Sur_Electrodes_Ele, File "I.txt" , Format Table];
        Print[ U, OnRegion Sur_Electrodes_Ele, File "U.txt" , Format Table];
        Print[ R, OnRegion ElectrodeIn, Format Table];
        Print[ integrated_losses, OnGlobal , File "integrated.losses.txt", Format Table];
      }
   }
+
+  // Scalar quantities only (used during optimization, no field maps written)
+  { Name Scalars; NameOfPostProcessing EleKin_v;
+     Operation {
+       Print[ I, OnRegion Sur_Electrodes_Ele, File "I.txt" , Format Table];
+       Print[ U, OnRegion Sur_Electrodes_Ele, File "U.txt" , Format Table];
+       Print[ integrated_losses, OnGlobal   , File "integrated.losses.txt", Format Table];
+     }
+  }
+
+  // Current density for the adaptive refinement (see refinement.py), with the scalar quantities
+  { Name Refinement; NameOfPostProcessing EleKin_v;
+     Operation {
+       Print[ j, OnElementsOf Dom_Hgrad_v_Ele, File "j.refinement.pos", Format GmshParsed ];
+       Print[ I, OnRegion Sur_Electrodes_Ele, File "I.txt" , Format Table];
+       Print[ U, OnRegion Sur_Electrodes_Ele, File "U.txt" , Format Table];
+       Print[ integrated_losses, OnGlobal   , File "integrated.losses.txt", Format Table];
+     }
+  }
 }
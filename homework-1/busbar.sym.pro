@@ -157,13 +157,32 @@ PostProcessing {
 PostOperation {
   { Name Map; NameOfPostProcessing EleKin_v;
      Operation {
-       Print[ v, OnElementsOf Dom_Hgrad_v_Ele, File "v.sym.pos" ];
-       Print[ j, OnElementsOf Dom_Hgrad_v_Ele, File "j.sym.pos" ];
-       Print[ losses, OnElementsOf Dom_Hgrad_v_Ele, File "losses.sym.pos" ];
+       Print[ v, OnElementsOf Dom_Hgrad_v_Ele, File "v.sym.pos", Format GmshParsed ];
+       Print[ j, OnElementsOf Dom_Hgrad_v_Ele, File "j.sym.pos", Format GmshParsed ];
+       Print[ losses, OnElementsOf Dom_Hgrad_v_Ele, File "losses.sym.pos", Format GmshParsed ];
        Print[ I, OnRegion Sur_Electrodes_Ele, File "I.sym.txt" , Format Table];
        Print[ U, OnRegion Sur_Electrodes_Ele, File "U.sym.txt" , Format Table];
        Print[ R, OnRegion ElectrodeIn       , File "R.sym.txt" , Format Table];
        Print[ integrated_losses, OnGlobal   , File "integrated.losses.sym.txt", Format Table];
      }
   }
+
+  // Scalar quantities only (used during optimization, no field maps written)
+  { Name Scalars; NameOfPostProcessing EleKin_v;
+     Operation {
+       Print[ I, OnRegion Sur_Electrodes_Ele, File "I.sym.txt" , Format Table];
+       Print[ U, OnRegion Sur_Electrodes_Ele, File "U.sym.txt" , Format Table];
+       Print[ integrated_losses, OnGlobal   , File "integrated.losses.sym.txt", Format Table];
+     }
+  }
+
+  // Current density for the adaptive refinement (see refinement.py), with the scalar quantities
+  { Name Refinement; NameOfPostProcessing EleKin_v;
+     Operation {
+       Print[ j, OnElementsOf Dom_Hgrad_v_Ele, File "j.refinement.sym.pos", Format GmshParsed ];
+       Print[ I, OnRegion Sur_Electrodes_Ele, File "I.sym.txt" , Format Table];
+       Print[ U, OnRegion Sur_Electrodes_Ele, File "U.sym.txt" , Format Table];
+       Print[ integrated_losses, OnGlobal   , File "integrated.losses.sym.txt", Format Table];
+     }
+  }
 }
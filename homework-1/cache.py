@@ -0,0 +1,122 @@
+import os
+from pathlib import Path
+import typing
+import hashlib
+import logging
+import tempfile
+import zipfile
+
+import numpy
+import typeguard
+
+class EvaluationCache(object):
+    """
+    Persistent, content-addressed cache of evaluations.
+
+    Each entry is a .npz file named after a hash of everything that defines an evaluation.
+    Entries are evicted in least-recently-used order when the cache grows beyond its size.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,directory : typing.Union[str,Path], max_bytes : int = 256 * 1024**2):
+        """
+        Initialize cache:
+            * directory in which entries are stored (created if needed)
+            * maximum size of the cache on disk in bytes
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True,exist_ok=True)
+
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    @typeguard.typechecked
+    def key(*,files : typing.List[Path], input_parameters_values : typing.Dict[str,float], mesh_parameters : dict, **names : str) -> str:
+        """
+        Hash the content of the files, the parameter values (at full precision)
+        and the names (problem, post-operation, ...) that define an evaluation.
+        """
+        h = hashlib.sha256()
+        for file in files:
+            h.update(file.name.encode())
+            h.update(file.read_bytes())
+        for parameters in [input_parameters_values,mesh_parameters]:
+            for k,v in sorted(parameters.items()):
+                h.update(f"{k}={float(v).hex()};".encode())
+        for k,v in sorted(names.items()):
+            h.update(f"{k}={v};".encode())
+        return h.hexdigest()
+
+    def _path(self,key : str) -> Path:
+        return self.directory / f"{key}.npz"
+
+    @typeguard.typechecked
+    def get(self,key : str) -> typing.Optional[dict]:
+        """
+        Return the evaluation stored under key, or None.
+        An entry that cannot be read (e.g. truncated by a full disk) is a miss, and is removed.
+        """
+        path = self._path(key)
+        try:
+            with numpy.load(path) as data:
+                evaluation = {}
+                for k in data.files:
+                    if '.' in k:
+                        group, name = k.split('.',1)
+                        evaluation.setdefault(group,{})[name] = data[k] if group in ['fields','maps','solution'] else data[k].item()
+                    else:
+                        evaluation[k] = data[k].item()
+            # Mark as recently used (the entry may have been evicted concurrently since)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (zipfile.BadZipFile,ValueError,EOFError,OSError) as e:
+            logging.warning(f"> Cache entry {path.name} is corrupted, removing it : {type(e).__name__} {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+        logging.debug(f"> Cache hit for {key}")
+        return evaluation
+
+    @typeguard.typechecked
+    def put(self,key : str, evaluation : dict):
+        """
+        Store an evaluation under key : scalar entries, and dictionaries of arrays (fields, maps, solution) or scalars (metrics).
+        """
+        data = {}
+        for k,v in evaluation.items():
+            if isinstance(v,dict):
+                data.update({f"{k}.{name}" : numpy.asarray(value) for name,value in v.items()})
+            else:
+                data[k] = numpy.asarray(v)
+
+        # Write to a temporary file first, such that concurrent readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory,suffix='.npz.tmp')
+        with os.fdopen(fd,'wb') as f:
+            numpy.savez(f,**data)
+        os.replace(tmp,self._path(key))
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove least-recently-used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        for p in self.directory.glob('*.npz'):
+            # Entries may be evicted concurrently by another process
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime,stat.st_size,p))
+        entries.sort(key=lambda e : e[0])
+        size = sum(e[1] for e in entries)
+        for _,entry_size,path in entries:
+            if size <= self.max_bytes: break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+            logging.debug(f"> Cache evicted {path.name}")
+
+    def __len__(self):
+        return len(list(self.directory.glob('*.npz')))
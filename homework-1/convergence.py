@@ -0,0 +1,200 @@
+import os
+import time
+import typing
+import logging
+import concurrent.futures
+
+import numpy
+import pandas
+import scipy.optimize
+import typeguard
+
+import optimization
+import geometry
+
+# Mesh constants scaled by the refinement ratio
+MESH_PARAMETERS_FILE = optimization.HOMEWORK_1 / 'mesh.parameters.geo'
+
+def _evaluate_level(factory : typing.Callable, factory_kwargs : dict, mesh_parameters : dict, x : typing.List[float]) -> dict:
+    """
+    Evaluate a refinement level (runs in a worker process).
+    """
+    started_at = time.time()
+    problem = factory(**factory_kwargs,mesh_parameters=mesh_parameters)
+    evaluation = optimization._evaluate_in_scratch(problem,problem._parameters(x))
+    evaluation['elapsed'] = time.time() - started_at
+    return evaluation
+
+class ConvergenceStudy(object):
+    """
+    Mesh convergence study of a problem.
+
+    Each level scales the default mesh constants by a ratio (the smaller, the finer).
+    Levels are evaluated concurrently, and refined adaptively until the relative change of the
+    currents and losses between the two finest levels is below a tolerance. The discretization
+    error is estimated by Richardson extrapolation, f(h) = f0 + C h^p with h proportional to the ratio.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        factory : typing.Callable = optimization.problem_homework_1,
+        factory_kwargs : dict = {'filenamebase' : "busbar.sym", 'outputfiles' : ".sym", 'coef_I_inobj' : 2.0},
+        x : typing.Optional[typing.List[float]] = None,
+        mesh_parameters : typing.Optional[typing.Dict[str,float]] = None,
+        tolerance : float = 1e-4,
+        refinement : float = 1.25,
+        workers : typing.Optional[int] = None,
+    ):
+        """
+        Initialize study:
+            * function creating the problem for some mesh parameters (e.g. problem_homework_1)
+            * its keyword arguments
+            * point at which the problem is evaluated (defaults to the nominal point)
+            * mesh constants for a ratio of 1 (defaults to mesh.parameters.geo)
+            * relative change between the two finest levels at which refinement stops
+            * ratio between the mesh sizes of successive adaptive levels
+            * number of concurrent evaluations (defaults to the number of cores)
+        """
+        self.factory = factory
+        self.factory_kwargs = factory_kwargs
+        self.x = x if x is not None else [v[0] for v in factory(**factory_kwargs).input_parameters.values()]
+        self.mesh_parameters = mesh_parameters if mesh_parameters is not None else geometry.constants(MESH_PARAMETERS_FILE)
+        self.tolerance = tolerance
+        self.refinement = refinement
+        self.workers = workers
+
+        # Evaluated levels, sorted from the coarsest to the finest
+        self.levels : typing.List[dict] = []
+
+    @typeguard.typechecked
+    def evaluate(self,ratios : typing.List[float]):
+        """
+        Evaluate the levels of the given ratios concurrently (already evaluated ratios are skipped).
+        """
+        ratios = [r for r in ratios if r not in [level['ratio'] for level in self.levels]]
+        if not ratios: return
+        logging.info(f"> Convergence : evaluating ratios {ratios}")
+
+        mesh_parameters = [{k : r * v for k,v in self.mesh_parameters.items()} for r in ratios]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            evaluations = list(executor.map(
+                _evaluate_level,
+                [self.factory] * len(ratios),
+                [self.factory_kwargs] * len(ratios),
+                mesh_parameters,
+                [self.x] * len(ratios),
+            ))
+
+        for ratio,parameters,evaluation in zip(ratios,mesh_parameters,evaluations):
+            self.levels.append({
+                'ratio'              : ratio,
+                'mesh_parameters'    : parameters,
+                'elapsed'            : evaluation['elapsed'],
+                'number_of_nodes'    : evaluation['number_of_nodes'],
+                'number_of_elements' : evaluation['number_of_elements'],
+                **evaluation['fields'],
+            })
+        self.levels.sort(key=lambda level : -level['ratio'])
+
+    def _quantities(self) -> numpy.ndarray:
+        """
+        Currents, input voltage and losses of each level (levels,quantities).
+        """
+        return numpy.array([
+            numpy.concatenate([level['currents'],level['voltages'][0:1],level['losses']]) for level in self.levels
+        ])
+
+    def change(self) -> float:
+        """
+        Largest relative change of the quantities between the two finest levels (infinite with fewer than two levels).
+        """
+        if len(self.levels) < 2:
+            return float('inf')
+        q = self._quantities()
+        return float(numpy.max(numpy.abs(q[-1] - q[-2]) / numpy.maximum(numpy.abs(q[-1]),1e-300)))
+
+    @typeguard.typechecked
+    def run(self,ratios : typing.List[float] = [4.0,2.0,1.0], max_levels : int = 8, batch : int = 2) -> dict:
+        """
+        Evaluate the initial ratios, then refine until the change between the two finest levels
+        is below the tolerance (or there are max_levels levels).
+        Each refinement evaluates the next batch of finer ratios concurrently, the finer ones being spent
+        if the first one already converges (they still improve the extrapolation).
+        Returns the extrapolation (see extrapolate).
+        """
+        assert batch >= 1,batch
+        self.evaluate(ratios)
+        while self.change() > self.tolerance and len(self.levels) < max_levels:
+            logging.info(f"> Convergence : relative change {self.change()} above {self.tolerance}, refining")
+            finest = self.levels[-1]['ratio']
+            self.evaluate([finest / self.refinement**k for k in range(1,min(batch,max_levels - len(self.levels)) + 1)])
+        return self.extrapolate()
+
+    def extrapolate(self) -> dict:
+        """
+        Richardson extrapolation from the three finest levels, for each quantity:
+            * 'value' : extrapolated value (h -> 0)
+            * 'order' : observed order of convergence (2, that of P1 elements for these quantities, if it cannot be observed)
+            * 'error' : estimated relative error of each level (levels,quantities)
+        """
+        assert len(self.levels) >= 2,"At least two levels are needed"
+        q = self._quantities()
+        h = numpy.array([level['ratio'] for level in self.levels])
+
+        values, orders = numpy.zeros(q.shape[1]), numpy.zeros(q.shape[1])
+        for i in range(q.shape[1]):
+            p = 2.0
+            if len(self.levels) >= 3:
+                (h3,h2,h1), (f3,f2,f1) = h[-3:], q[-3:,i]
+                if (f2 - f1) * (f3 - f2) > 0 and abs(f3 - f2) > 0:
+                    g = lambda p : (h2**p - h1**p) / (h3**p - h2**p) - (f2 - f1) / (f3 - f2)
+                    if g(0.1) * g(6.0) < 0:
+                        p = scipy.optimize.brentq(g,0.1,6.0)
+            C = (q[-2,i] - q[-1,i]) / (h[-2]**p - h[-1]**p) if h[-2] != h[-1] else 0.0
+            values[i] = q[-1,i] - C * h[-1]**p
+            orders[i] = p
+
+        return {
+            'value' : values,
+            'order' : orders,
+            'error' : numpy.abs(q - values) / numpy.maximum(numpy.abs(values),1e-300),
+        }
+
+    @typeguard.typechecked
+    def noise(self,ratio : float = 1.0) -> float:
+        """
+        Estimated relative error of the currents at an evaluated ratio (see extrapolate), e.g. the noise
+        of the currents between designs meshed with these constants (see gradient.relative_step).
+        """
+        ratios = [level['ratio'] for level in self.levels]
+        assert ratio in ratios,f"Ratio {ratio} not evaluated"
+        currents = len(self.levels[0]['currents'])
+        return float(numpy.max(self.extrapolate()['error'][ratios.index(ratio),0:currents]))
+
+    @typeguard.typechecked
+    def recommend(self,target : float) -> dict:
+        """
+        Cheapest evaluated level whose estimated relative error is below target for every quantity.
+        """
+        error = numpy.max(self.extrapolate()['error'],axis=1)
+        candidates = [i for i in range(len(self.levels)) if error[i] <= target]
+        if not candidates:
+            raise RuntimeError(f"No level reaches a relative error of {target}, the finest has {error[-1]}")
+        best = min(candidates,key=lambda i : self.levels[i]['number_of_elements'])
+        logging.info(f"> Convergence : ratio {self.levels[best]['ratio']} has an estimated error of {error[best]}")
+        return {**self.levels[best],'error' : float(error[best])}
+
+    def to_dataframe(self) -> pandas.DataFrame:
+        """
+        One row per level, with the estimated error if it can be computed.
+        """
+        df = pandas.DataFrame([
+            {k : v for k,v in level.items() if k not in ['currents','voltages','losses','mesh_parameters']} for level in self.levels
+        ])
+        df['current-left'  ] = [level['currents'][1] for level in self.levels]
+        df['current-center'] = [level['currents'][2] for level in self.levels]
+        df['voltage-input' ] = [level['voltages'][0] for level in self.levels]
+        df['losses'        ] = [level['losses'  ][0] for level in self.levels]
+        if len(self.levels) >= 2:
+            df['error'] = numpy.max(self.extrapolate()['error'],axis=1)
+        return df
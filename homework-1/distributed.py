@@ -0,0 +1,429 @@
+"""
+Evaluations distributed over several machines.
+
+The coordinator runs in the process of the optimization (see Coordinator, given as the scheduler of the problem),
+workers run on any machine with GMSH and GETDP (e.g. the docker image of the repository):
+    ELEC0041_TOKEN=<token> python homework-1/distributed.py --host <coordinator> --port <port>
+
+Trust model : workers authenticate with a token shared with the coordinator (see Coordinator), such that a client
+that merely reaches the port gets no job. Nothing else is protected : messages (files of the problem, token, results)
+are plain text, the coordinator trusts the evaluations of the workers, and the workers run GMSH and GETDP on the
+files sent by the coordinator, which can run any command. Only listen on a trusted network (or tunnel the port,
+e.g. over SSH), and only run workers for a coordinator that is trusted.
+"""
+import os
+import hmac
+import json
+import time
+import uuid
+import secrets
+import socket
+import typing
+import logging
+import argparse
+import tempfile
+import threading
+import itertools
+import collections
+import socketserver
+from pathlib import Path
+
+import numpy
+import typeguard
+
+import optimization
+from scheduler import Scheduler, EvaluationFailed
+
+# Environment variable holding the token shared by the coordinator and the workers
+TOKEN_VARIABLE = 'ELEC0041_TOKEN'
+
+# Settings of the problem that a worker needs to rebuild it
+SETTINGS = ['outputfiles','problem','postpro','input_parameters','coef_I_inobj','mesh_parameters','mesher','solver','timeouts']
+
+def send(stream, message : dict):
+    """
+    Write a message as a line of JSON.
+    """
+    stream.write(json.dumps(message) + '\n')
+    stream.flush()
+
+def receive(stream) -> typing.Optional[dict]:
+    """
+    Read a message (None at the end of the stream).
+    """
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+# Groups of arrays of an evaluation
+ARRAYS = ['fields','solution']
+
+def encode(evaluation : dict) -> dict:
+    """
+    Evaluation (see Problem._evaluate) as JSON values.
+    """
+    return {**evaluation,**{group : {k : numpy.asarray(v).tolist() for k,v in evaluation[group].items()} for group in ARRAYS if group in evaluation}}
+
+def decode(evaluation : dict) -> dict:
+    return {**evaluation,**{group : {k : numpy.array(v,dtype=numpy.float64) for k,v in evaluation[group].items()} for group in ARRAYS if group in evaluation}}
+
+@typeguard.typechecked
+def describe(problem) -> dict:
+    """
+    Content of the .geo/.pro files (and their includes, and the background mesh), their names and
+    the settings of a problem, from which a worker evaluates it without the files of the coordinator.
+    Files are named by their path relative to the common directory of the .geo/.pro files and their includes
+    (see Problem._tree), the background mesh goes next to the .geo file.
+    """
+    root, tree = problem._tree()
+    files = {file.as_posix() : (root / file).read_text() for file in tree}
+    geo_file, pro_file = [Path(os.path.abspath(file)).relative_to(root).as_posix() for file in [problem.geo_file,problem.pro_file]]
+    background_mesh = None
+    if getattr(problem,'background_mesh',None) is not None:
+        background_mesh = (Path(geo_file).parent / Path(problem.background_mesh).name).as_posix()
+        files[background_mesh] = Path(problem.background_mesh).read_text()
+    return {
+        'files'           : files,
+        'geo_file'        : geo_file,
+        'pro_file'        : pro_file,
+        'background_mesh' : background_mesh,
+        'settings'        : {k : getattr(problem,k) for k in SETTINGS},
+    }
+
+class Coordinator(Scheduler):
+    """
+    Scheduler distributing the evaluations of a problem to workers over TCP (see Worker).
+
+    Messages are lines of JSON. A worker first says hello with the token of the coordinator, which welcomes it,
+    or denies it and closes the connection if the token differs (see the trust model of the module). It then pulls a job (description of the problem, see describe, and the values of
+    the parameters), sends heartbeats while evaluating it, then sends the evaluation or the error.
+    A job whose worker disconnects or stops sending heartbeats is put back in the queue for another worker;
+    failed jobs are retried, then either raise EvaluationFailed or, if a penalty is given, are reported as None
+    (see scheduler.Scheduler). Jobs that are no longer needed (see run) are removed from the queue,
+    those already running are left to complete and their result is discarded.
+    """
+
+    # Workers run the evaluations, with any meshing and solver backends
+    executables = False
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        host : str = "127.0.0.1",
+        port : int = 0,
+        heartbeat : float = 1.0,
+        timeout : typing.Optional[float] = None,
+        retries : int = 0,
+        penalty : typing.Optional[float] = None,
+        token : typing.Optional[str] = None,
+    ):
+        """
+        Initialize coordinator, which listens until it is closed:
+            * address on which workers connect (defaults to the loopback, "0.0.0.0" for all interfaces)
+            * port on which workers connect (defaults to a free port, see self.address)
+            * interval between the heartbeats of the workers [s]
+            * time without heartbeat after which a job is lost and queued again (defaults to 5 heartbeats) [s]
+            * number of times a failed job is retried
+            * objective of the points that failed (defaults to None, i.e. failures raise EvaluationFailed)
+            * token of the workers (defaults to the environment variable ELEC0041_TOKEN, or a random one, see self.token)
+        """
+        super().__init__(concurrency=None,retries=retries,penalty=penalty)
+        self.token = token if token is not None else os.environ.get(TOKEN_VARIABLE,secrets.token_hex(16))
+        self.heartbeat = heartbeat
+        self.timeout = timeout if timeout is not None else 5.0 * heartbeat
+
+        self.condition = threading.Condition()
+        self.jobs : typing.Dict[int,dict] = {}
+        self.queue : typing.Deque[int] = collections.deque()
+        self.running : typing.Dict[int,typing.Tuple[str,float]] = {}
+        self.ids = itertools.count()
+        self.closed = False
+
+        coordinator = self
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                coordinator._serve(self.rfile,self.wfile)
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = Server((host,port),Handler)
+        self.address = self.server.server_address
+        self.threads = [threading.Thread(target=target,daemon=True) for target in [self.server.serve_forever,self._monitor]]
+        for thread in self.threads: thread.start()
+        logging.info(f"> Coordinator : listening on {self.address}")
+
+    def _serve(self,rfile,wfile):
+        """
+        Messages of a worker connection.
+        """
+        worker = None
+        stream = _Stream(rfile,wfile)
+        try:
+            while True:
+                message = receive(stream)
+                if message is None: break
+                if worker is None:
+                    # Nothing but the hello of a worker with the token is served
+                    if message.get('type') != 'hello' or not hmac.compare_digest(str(message.get('token')),self.token):
+                        logging.warning("> Coordinator : connection refused, wrong token or no hello")
+                        send(stream,{'type' : 'denied'})
+                        return
+                    worker = message['worker']
+                    send(stream,{'type' : 'welcome'})
+                    logging.info(f"> Coordinator : worker {worker} connected")
+                elif message['type'] == 'request':
+                    send(stream,self._next(worker))
+                elif message['type'] == 'heartbeat':
+                    self._heartbeat(message['job'],worker)
+                elif message['type'] == 'result':
+                    self._complete(message['job'],decode(message['evaluation']))
+                elif message['type'] == 'error':
+                    self._fail(message['job'],message['error'])
+        except (OSError,ValueError) as e:
+            logging.warning(f"> Coordinator : connection of worker {worker} failed : {e}")
+        finally:
+            logging.info(f"> Coordinator : worker {worker} disconnected")
+            self._lost(lambda job,w : w == worker)
+
+    def _next(self,worker : str) -> dict:
+        """
+        Next job for a worker, or wait (or shutdown when the coordinator is closed).
+        """
+        with self.condition:
+            if self.closed:
+                return {'type' : 'shutdown'}
+            while self.queue:
+                job = self.queue.popleft()
+                if job in self.jobs and self.jobs[job]['state'] == 'queued':
+                    self.jobs[job]['state'] = 'running'
+                    self.running[job] = (worker,time.monotonic())
+                    return {'type' : 'job','job' : job,**self.jobs[job]['message']}
+            return {'type' : 'wait','delay' : self.heartbeat}
+
+    def _heartbeat(self,job : int, worker : str):
+        with self.condition:
+            if job in self.running and self.running[job][0] == worker:
+                self.running[job] = (worker,time.monotonic())
+
+    def _requeue(self,job : int):
+        self.running.pop(job,None)
+        if self.jobs[job]['state'] == 'running':
+            self.jobs[job]['state'] = 'queued'
+            self.queue.appendleft(job)
+
+    def _complete(self,job : int, evaluation : dict):
+        with self.condition:
+            self.running.pop(job,None)
+            # A late result of a job queued again is still valid, that of a job no longer needed is discarded
+            if job in self.jobs and self.jobs[job]['state'] in ['queued','running']:
+                self.jobs[job].update(state='done',evaluation=evaluation)
+            self.condition.notify_all()
+
+    def _fail(self,job : int, error : str):
+        with self.condition:
+            if job not in self.jobs: return
+            self.jobs[job]['attempts'] += 1
+            logging.warning(f"> Coordinator : job {job} failed (attempt {self.jobs[job]['attempts']} of {self.retries + 1}) : {error}")
+            if self.jobs[job]['attempts'] <= self.retries:
+                self._requeue(job)
+            elif self.jobs[job]['state'] == 'running':
+                self.running.pop(job,None)
+                self.jobs[job].update(state='failed',error=error)
+            self.condition.notify_all()
+
+    def _lost(self,predicate : typing.Callable[[int,str],bool]):
+        """
+        Queue again the running jobs that satisfy predicate(job,worker).
+        """
+        with self.condition:
+            for job,(worker,_) in list(self.running.items()):
+                if predicate(job,worker):
+                    logging.warning(f"> Coordinator : job {job} of worker {worker} lost, queued again")
+                    self._requeue(job)
+            self.condition.notify_all()
+
+    def _monitor(self):
+        """
+        Queue again the jobs whose worker stopped sending heartbeats.
+        """
+        while not self.closed:
+            time.sleep(self.heartbeat / 2.0)
+            now = time.monotonic()
+            self._lost(lambda job,worker : now - self.running[job][1] > self.timeout)
+
+    @typeguard.typechecked
+    def run(self,problem,points : typing.List[typing.Dict[str,float]], stop : typing.Optional[typing.Callable[[dict],bool]] = None, done : typing.Optional[typing.Callable[[int,dict],None]] = None) -> typing.List[typing.Optional[dict]]:
+        """
+        Evaluate the points on the workers, blocking until all are done.
+        Each evaluation is given to done along with the index of its point as soon as it is received.
+        When an evaluation satisfies stop (e.g. the objective is small enough), the others are cancelled.
+        Returns the evaluation of each point (None if it failed under a penalty policy or was cancelled).
+        """
+        description = describe(problem)
+        with self.condition:
+            jobs = []
+            for x in points:
+                job = next(self.ids)
+                self.jobs[job] = {'message' : {**description,'input_parameters_values' : x},'state' : 'queued','attempts' : 0}
+                self.queue.append(job)
+                jobs.append(job)
+            logging.info(f"> Coordinator : {len(jobs)} jobs queued")
+
+            checked = set()
+            while any(self.jobs[job]['state'] in ['queued','running'] for job in jobs):
+                self.condition.wait(self.heartbeat)
+                for job in [job for job in jobs if self.jobs[job]['state'] == 'done' and job not in checked]:
+                    checked.add(job)
+                    if done is not None:
+                        done(jobs.index(job),self.jobs[job]['evaluation'])
+                    if stop is not None and stop(self.jobs[job]['evaluation']):
+                        logging.info(f"> Coordinator : stop condition met, cancelling the other jobs")
+                        for other in jobs:
+                            if self.jobs[other]['state'] in ['queued','running']:
+                                self.jobs[other]['state'] = 'cancelled'
+                                self.running.pop(other,None)
+
+            states = {job : self.jobs.pop(job) for job in jobs}
+
+        # Jobs done while the last ones were finishing
+        if done is not None:
+            for j,job in enumerate(jobs):
+                if job not in checked and states[job]['state'] == 'done':
+                    done(j,states[job]['evaluation'])
+
+        failed = [job for job in jobs if states[job]['state'] == 'failed']
+        if failed and self.penalty is None:
+            raise EvaluationFailed(f"Evaluation of {states[failed[0]]['message']['input_parameters_values']} failed : {states[failed[0]]['error']}")
+        return [states[job].get('evaluation') if states[job]['state'] == 'done' else None for job in jobs]
+
+    def close(self):
+        """
+        Stop listening, connected workers are told to shut down when they ask for a job.
+        """
+        with self.condition:
+            self.closed = True
+        self.server.shutdown()
+        self.server.server_close()
+
+class _Stream(object):
+    """
+    Text stream over the binary files of a socket.
+    """
+    def __init__(self,rfile,wfile):
+        self.rfile, self.wfile = rfile, wfile
+        self.lock = threading.Lock()
+
+    def readline(self) -> str:
+        return self.rfile.readline().decode()
+
+    def write(self,text : str):
+        with self.lock:
+            self.wfile.write(text.encode())
+
+    def flush(self):
+        with self.lock:
+            self.wfile.flush()
+
+class Worker(object):
+    """
+    Stateless worker : pulls jobs from a coordinator, evaluates them in a scratch directory
+    (see evaluate) and sends back the evaluations (with the name of the worker), with heartbeats while evaluating.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        host : str = "127.0.0.1",
+        port : int,
+        name : typing.Optional[str] = None,
+        heartbeat : float = 1.0,
+        token : typing.Optional[str] = None,
+    ):
+        """
+        Initialize worker:
+            * address of the coordinator
+            * port of the coordinator
+            * name of the worker (defaults to the host name and a random suffix)
+            * interval between heartbeats [s]
+            * token of the coordinator (defaults to the environment variable ELEC0041_TOKEN)
+        """
+        self.host = host
+        self.port = port
+        self.token = token if token is not None else os.environ.get(TOKEN_VARIABLE)
+        assert self.token is not None,f"No token given, nor in the environment variable {TOKEN_VARIABLE}"
+        self.name = name if name is not None else f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.heartbeat = heartbeat
+
+    def evaluate(self,job : dict) -> dict:
+        """
+        Write the files of the job in a scratch directory, rebuild the problem there and evaluate it.
+        """
+        with tempfile.TemporaryDirectory(prefix='elec0041-worker-') as tmp:
+            for name,content in job['files'].items():
+                assert not Path(name).is_absolute() and '..' not in Path(name).parts,f"File {name} outside of the scratch directory"
+                (Path(tmp) / name).parent.mkdir(parents=True,exist_ok=True)
+                (Path(tmp) / name).write_text(content)
+            problem = optimization.Problem(
+                geo_file        = Path(tmp) / job['geo_file'],
+                pro_file        = Path(tmp) / job['pro_file'],
+                background_mesh = Path(tmp) / job['background_mesh'] if job['background_mesh'] is not None else None,
+                **job['settings'],
+            )
+            return problem._evaluate(input_parameters_values=job['input_parameters_values'],workdir=problem.workdir)
+
+    def _heartbeats(self,stream,job : int, done : threading.Event):
+        while not done.wait(self.heartbeat):
+            send(stream,{'type' : 'heartbeat','job' : job})
+
+    def run(self,max_jobs : typing.Optional[int] = None) -> int:
+        """
+        Evaluate jobs until the coordinator shuts down or disconnects (or max_jobs are done).
+        Returns the number of jobs done.
+        """
+        done = 0
+        with socket.create_connection((self.host,self.port)) as connection:
+            stream = _Stream(connection.makefile('rb'),connection.makefile('wb'))
+            send(stream,{'type' : 'hello','worker' : self.name,'token' : self.token})
+            message = receive(stream)
+            if message is None or message['type'] != 'welcome':
+                raise PermissionError(f"Coordinator {self.host}:{self.port} refused the token")
+            while max_jobs is None or done < max_jobs:
+                send(stream,{'type' : 'request'})
+                message = receive(stream)
+                if message is None or message['type'] == 'shutdown':
+                    break
+                if message['type'] == 'wait':
+                    time.sleep(message['delay'])
+                    continue
+
+                logging.info(f"> Worker {self.name} : job {message['job']} with {message['input_parameters_values']}")
+                evaluated = threading.Event()
+                heartbeats = threading.Thread(target=self._heartbeats,args=(stream,message['job'],evaluated),daemon=True)
+                heartbeats.start()
+                try:
+                    evaluation = self.evaluate(message)
+                except Exception as e:
+                    reply = {'type' : 'error','job' : message['job'],'error' : f"{type(e).__name__} {e}"}
+                else:
+                    reply = {'type' : 'result','job' : message['job'],'evaluation' : {**encode(evaluation),'worker' : self.name}}
+                finally:
+                    evaluated.set()
+                    heartbeats.join()
+                send(stream,reply)
+                done += 1
+        return done
+
+def main(argv : typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host',default="127.0.0.1",help="address of the coordinator")
+    parser.add_argument('--port',type=int,required=True,help="port of the coordinator")
+    parser.add_argument('--name',default=None,help="name of the worker")
+    parser.add_argument('--heartbeat',type=float,default=1.0,help="interval between heartbeats [s]")
+    parser.add_argument('--token',default=None,help=f"token of the coordinator (defaults to ${TOKEN_VARIABLE}, prefer it to keep the token out of the process list)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    Worker(host=args.host,port=args.port,name=args.name,heartbeat=args.heartbeat,token=args.token).run()
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,137 @@
+from pathlib import Path
+import typing
+import re
+
+import numpy
+import typeguard
+
+@typeguard.typechecked
+def constants(file : typing.Union[str,Path], overrides : typing.Dict[str,float] = {}) -> typing.Dict[str,float]:
+    """
+    Evaluate the constants defined with DefineConstant in a .geo/.pro file and the files it includes, e.g.
+        DefineConstant[ DO_x = {CP_width / 2.0, Name "..."} ];
+    Overrides take precedence over the default values, like -setnumber does.
+    """
+    values = dict(overrides)
+
+    def parse(file : Path):
+        content = re.sub(r'//[^\n]*','',file.read_text())
+        pattern = r'Include\s*"([^"]+)"|(\w+)\s*=\s*\{\s*([^,{}]+?)\s*,\s*Name'
+        for include,name,expression in re.findall(pattern,content):
+            if include:
+                parse(file.parent / include)
+            elif name not in values:
+                values[name] = float(eval(expression,{'__builtins__' : {}},dict(values)))
+
+    parse(Path(file))
+    return values
+
+class InfeasibleDesign(ValueError):
+    """
+    The design optimization ellipse cannot be built (see Feasibility).
+    """
+
+class Feasibility(object):
+    """
+    Analytic check that the design optimization ellipse can be built, before meshing.
+
+    The ellipse of center (DO_x,DO_y), half vertical axis DO_a and half horizontal axis DO_b must leave
+    a copper ligament of at least a given width to the input/output holes (circles of radius IO_radius at
+    (I_x,I_y), (I_x,O_height) and (I_x +/- O_spacing,O_height)) and to the plate edges, and must not be degenerate
+    (too small axes or too elongated). Distances to the holes are computed from points sampled on the ellipse.
+    All checks are vectorized over the designs.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        geo_file : typing.Union[str,Path],
+        ligament : float = 1e-3,
+        min_axis : float = 5e-4,
+        max_aspect : float = 10.0,
+        penalty : typing.Optional[float] = None,
+        samples : int = 256,
+    ):
+        """
+        Initialize checker:
+            * .geo file defining the geometrical constants (e.g. busbar.geo, includes geometry.parameters.geo)
+            * minimum width of copper between the ellipse and the holes or the plate edges [m]
+            * minimum half axis of the ellipse [m]
+            * maximum ratio between the axes of the ellipse
+            * objective of infeasible designs, increased by their violation of the constraints
+              (defaults to None, i.e. infeasible designs raise InfeasibleDesign)
+            * number of points sampled on the ellipse
+        """
+        self.constants = constants(geo_file)
+        self.ligament = ligament
+        self.min_axis = min_axis
+        self.max_aspect = max_aspect
+        self.penalty = penalty
+
+        theta = numpy.linspace(0.0,2.0 * numpy.pi,samples,endpoint=False)
+        self._cos, self._sin = numpy.cos(theta), numpy.sin(theta)
+
+        c = self.constants
+        self.holes = {
+            'input'         : (c['I_x']                  ,c['I_y']     ),
+            'output_center' : (c['I_x']                  ,c['O_height']),
+            'output_left'   : (c['I_x'] - c['O_spacing'] ,c['O_height']),
+            'output_right'  : (c['I_x'] + c['O_spacing'] ,c['O_height']),
+        }
+
+    @typeguard.typechecked
+    def margins(self,parameters : typing.Dict[str,typing.Any]) -> typing.Dict[str,numpy.ndarray]:
+        """
+        Margin of each constraint for each design (feasible if all are non-negative) [m]:
+            * hole names : copper width between the ellipse and the hole, minus the ligament
+            * 'plate_bottom', 'plate_top', 'plate_side' : same with the plate edges
+            * 'axis' : smallest half axis minus the minimum half axis
+            * 'aspect' : smallest half axis times the maximum aspect ratio, minus the largest half axis
+        Parameters (DO_y, DO_a, DO_b and optionally DO_x) are scalars or arrays of designs.
+        """
+        values = {k : numpy.asarray(parameters.get(k,self.constants[k]),dtype=numpy.float64) for k in ['DO_x','DO_y','DO_a','DO_b']}
+        x, y, a, b = numpy.broadcast_arrays(*[numpy.atleast_1d(values[k]) for k in ['DO_x','DO_y','DO_a','DO_b']])
+        c = self.constants
+
+        # Points on the ellipses (designs,samples)
+        px = x[:,None] + b[:,None] * self._cos[None,:]
+        py = y[:,None] + a[:,None] * self._sin[None,:]
+
+        margins = {}
+        for name,(hx,hy) in self.holes.items():
+            distance = numpy.min(numpy.hypot(px - hx,py - hy),axis=1) - c['IO_radius']
+            # A hole inside the ellipse is not detected by the distance of the boundaries
+            inside = ((hx - x) / b)**2 + ((hy - y) / a)**2 < 1.0
+            margins[name] = numpy.where(inside,-distance - 2.0 * c['IO_radius'],distance) - self.ligament
+        margins['plate_bottom'] = y - a - self.ligament
+        margins['plate_top'   ] = c['CP_height'] - (y + a) - self.ligament
+        margins['plate_side'  ] = numpy.minimum(x - b,c['CP_width'] - (x + b)) - self.ligament
+        margins['axis'        ] = numpy.minimum(a,b) - self.min_axis
+        margins['aspect'      ] = self.max_aspect * numpy.minimum(a,b) - numpy.maximum(a,b)
+        return margins
+
+    @typeguard.typechecked
+    def feasible(self,parameters : typing.Dict[str,typing.Any]) -> numpy.ndarray:
+        """
+        Whether each design is feasible.
+        """
+        return numpy.all(numpy.stack(list(self.margins(parameters).values())) >= 0.0,axis=0)
+
+    @typeguard.typechecked
+    def violation(self,parameters : typing.Dict[str,typing.Any]) -> numpy.ndarray:
+        """
+        Sum of the constraint violations of each design, relative to the ligament (0 if feasible).
+        """
+        return numpy.sum(numpy.clip(-numpy.stack(list(self.margins(parameters).values())),0.0,None),axis=0) / self.ligament
+
+    @typeguard.typechecked
+    def check(self,parameters : typing.Dict[str,float]) -> typing.Optional[float]:
+        """
+        None for a feasible design, otherwise its penalized objective (or raise InfeasibleDesign if there is no penalty).
+        """
+        margins = {k : float(v[0]) for k,v in self.margins(parameters).items()}
+        violated = {k : v for k,v in margins.items() if v < 0.0}
+        if not violated:
+            return None
+        if self.penalty is None:
+            raise InfeasibleDesign(f"Design {parameters} violates {violated}")
+        return self.penalty * (1.0 + float(self.violation(parameters)[0]))
@@ -0,0 +1,185 @@
+import re
+from pathlib import Path
+import typing
+
+import numpy
+import typeguard
+
+# Number of nodes of the GMSH element types used in this project
+NODES_PER_ELEMENT = {
+    1  : 2, # 2-node line
+    2  : 3, # 3-node triangle
+    3  : 4, # 4-node quadrangle
+    15 : 1, # 1-node point
+}
+
+# Number of components of the values of the GmshParsed triangles (scalar and vector)
+COMPONENTS = {'S' : 1, 'V' : 3}
+
+class Mesh(object):
+    """
+    Mesh read from a GMSH .msh file (format 4.1, ASCII).
+
+    The lines of the file are kept, such that the mesh can be written back with
+    displaced nodes while everything else (entities, physical groups, elements) is unchanged.
+    """
+
+    def __init__(self,*,lines : typing.List[str]):
+        self.lines = lines
+
+        # Nodes
+        self.node_tags   : numpy.ndarray = None
+        self.coordinates : numpy.ndarray = None
+        self.node_entity : numpy.ndarray = None   # (dim,tag) of the entity each node is classified on
+        self._coordinate_lines : typing.List[int] = []
+
+        # Physical tags of each entity (dim,tag)
+        self.physicals : typing.Dict[typing.Tuple[int,int],typing.List[int]] = {}
+
+        # Elements per block : (dim, entity tag, element type, node tags (m,k))
+        self.blocks : typing.List[typing.Tuple[int,int,int,numpy.ndarray]] = []
+
+        self._parse()
+
+    def _section(self,name : str) -> int:
+        """
+        Index of the first line of a section.
+        """
+        return self.lines.index(f"${name}") + 1
+
+    def _parse(self):
+        version = self.lines[self._section('MeshFormat')].split()
+        if version[0] != '4.1' or version[1] != '0':
+            raise ValueError(f"Only the MSH 4.1 ASCII format is supported, got {version}")
+
+        # Entities and their physical tags
+        if '$Entities' in self.lines:
+            i = self._section('Entities')
+            counts = [int(x) for x in self.lines[i].split()]
+            i += 1
+            for dim,count in enumerate(counts):
+                for _ in range(count):
+                    tokens = self.lines[i].split()
+                    # Points have their coordinates, other entities their bounding box
+                    offset = 4 if dim == 0 else 7
+                    n = int(tokens[offset])
+                    self.physicals[(dim,int(tokens[0]))] = [int(x) for x in tokens[offset + 1:offset + 1 + n]]
+                    i += 1
+
+        # Nodes
+        i = self._section('Nodes')
+        blocks, total = [int(x) for x in self.lines[i].split()[0:2]]
+        i += 1
+        tags, coordinates, entities = [], [], []
+        for _ in range(blocks):
+            dim, tag, parametric, n = [int(x) for x in self.lines[i].split()]
+            i += 1
+            tags.extend(int(x) for x in self.lines[i:i + n])
+            i += n
+            for line in self.lines[i:i + n]:
+                coordinates.append([float(x) for x in line.split()[0:3]])
+            self._coordinate_lines.extend(range(i,i + n))
+            entities.extend([(dim,tag)] * n)
+            i += n
+        assert len(tags) == total
+        self.node_tags   = numpy.array(tags,dtype=numpy.int64)
+        self.coordinates = numpy.array(coordinates,dtype=numpy.float64).reshape(-1,3)
+        self.node_entity = numpy.array(entities,dtype=numpy.int64).reshape(-1,2)
+
+        # Elements
+        i = self._section('Elements')
+        blocks = int(self.lines[i].split()[0])
+        i += 1
+        for _ in range(blocks):
+            dim, tag, type, n = [int(x) for x in self.lines[i].split()]
+            i += 1
+            data = numpy.array([line.split() for line in self.lines[i:i + n]],dtype=numpy.int64).reshape(n,-1)
+            self.blocks.append((dim,tag,type,data[:,1:]))
+            i += n
+
+    @property
+    def lookup(self) -> numpy.ndarray:
+        """
+        Map node tag to index in the node arrays (-1 for unused tags).
+        """
+        if not hasattr(self,'_lookup'):
+            self._lookup = numpy.full(self.node_tags.max() + 1,-1,dtype=numpy.int64)
+            self._lookup[self.node_tags] = numpy.arange(self.node_tags.size)
+        return self._lookup
+
+    @typeguard.typechecked
+    def elements(self,*,physical : int, type : int) -> numpy.ndarray:
+        """
+        Connectivity (m,k) of the elements of a type in a physical group, as indices in the node arrays.
+        """
+        data = [
+            block[3] for block in self.blocks
+            if block[2] == type and physical in self.physicals.get((block[0],block[1]),[])
+        ]
+        if not data:
+            return numpy.empty((0,NODES_PER_ELEMENT[type]),dtype=numpy.int64)
+        return self.lookup[numpy.vstack(data)]
+
+    @typeguard.typechecked
+    def nodes(self,*,physical : int) -> numpy.ndarray:
+        """
+        Indices of the nodes of the elements of a physical group.
+        """
+        return numpy.unique(numpy.concatenate([
+            self.elements(physical=physical,type=type).reshape(-1) for type in NODES_PER_ELEMENT
+        ]))
+
+    @typeguard.typechecked
+    def write(self,path : typing.Union[str,Path], coordinates : typing.Optional[numpy.ndarray] = None):
+        """
+        Write the mesh, optionally with new node coordinates (n,3) or (n,2).
+        """
+        lines = list(self.lines)
+        if coordinates is not None:
+            assert coordinates.shape[0] == self.coordinates.shape[0]
+            for i,c in zip(self._coordinate_lines,coordinates):
+                tokens = lines[i].split()
+                tokens[0:coordinates.shape[1]] = [repr(float(x)) for x in c]
+                lines[i] = ' '.join(tokens)
+        Path(path).write_text('\n'.join(lines) + '\n')
+
+@typeguard.typechecked
+def read_msh(path : typing.Union[str,Path]) -> Mesh:
+    """
+    Read a .msh file (format 4.1, ASCII).
+    """
+    return Mesh(lines=Path(path).read_text().splitlines())
+
+@typeguard.typechecked
+def read_pos(path : typing.Union[str,Path]) -> dict:
+    """
+    Read the triangles of a view in the GmshParsed format (e.g. written by GETDP with Format GmshParsed):
+        * 'triangles' : coordinates (x,y) of the vertices (n,3,2)
+        * 'values'    : values at the vertices, first time step only (n,3,components)
+    """
+    matches = re.findall(r'([SV])T\(([^)]*)\)\{([^}]*)\}',Path(path).read_text())
+    if not matches:
+        raise ValueError(f"No triangle found in {path}")
+    kinds = set(m[0] for m in matches)
+    assert len(kinds) == 1,f"Scalar and vector triangles mixed in {path}"
+    components = COMPONENTS[kinds.pop()]
+
+    coordinates = numpy.array(','.join(m[1] for m in matches).split(','),dtype=numpy.float64).reshape(-1,3,3)
+    values = numpy.array(','.join(m[2] for m in matches).split(','),dtype=numpy.float64).reshape(len(matches),-1)
+    return {
+        'triangles' : coordinates[:,:,0:2],
+        'values'    : values[:,0:3 * components].reshape(-1,3,components),
+    }
+
+@typeguard.typechecked
+def write_pos(path : typing.Union[str,Path], *, name : str, triangles : numpy.ndarray, values : numpy.ndarray):
+    """
+    Write a scalar view in the GmshParsed format, values (n,3) at the vertices of the triangles (n,3,2),
+    e.g. a background mesh for GMSH (-bgm).
+    """
+    n = triangles.shape[0]
+    data = numpy.hstack([numpy.dstack([triangles,numpy.zeros((n,3,1))]).reshape(n,9),values.reshape(n,3)])
+    with open(path,'w') as f:
+        f.write(f'View "{name}" {{\n')
+        numpy.savetxt(f,data,fmt='ST(' + ','.join(['%.17g'] * 9) + '){' + ','.join(['%.17g'] * 3) + '};')
+        f.write('};\n')
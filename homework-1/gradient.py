@@ -0,0 +1,199 @@
+import time
+import typing
+import logging
+
+import numpy
+import scipy.optimize
+import typeguard
+
+# Gradient-based methods of scipy.optimize.minimize handling bounds
+METHODS = ["L-BFGS-B","SLSQP"]
+
+@typeguard.typechecked
+def relative_step(noise : float, min_step : float = 1e-4, max_step : float = 0.1) -> float:
+    """
+    Step of central differences relative to the range of the parameters, for a relative noise of the currents.
+    The error of a central difference is h^2 |f'''| / 6 (truncation) plus noise / h (noise), minimal for
+    h = (3 noise / |f'''|)^(1/3) ; with the third derivative of the order of the currents over the cube of
+    the ranges, this gives (3 noise)^(1/3) of the ranges.
+    """
+    return float(numpy.clip(numpy.cbrt(3.0 * noise),min_step,max_step))
+
+def mesh_noise(study, mesh_parameters : dict) -> float:
+    """
+    Relative noise of the currents measured by a convergence study (see convergence.ConvergenceStudy.noise)
+    for the given mesh constants, whose ratio to those of the study is evaluated if needed (1 if there are none).
+    """
+    common = [k for k in mesh_parameters if k in study.mesh_parameters]
+    ratio = float(numpy.median([mesh_parameters[k] / study.mesh_parameters[k] for k in common])) if common else 1.0
+    if len(study.levels) < 3:
+        study.run()
+    if ratio not in [level['ratio'] for level in study.levels]:
+        study.evaluate([ratio])
+    return study.noise(ratio)
+
+class GradientOptimizer(object):
+    """
+    Gradient-based optimization of a problem within its bounds (L-BFGS-B, or SLSQP with the geometric constraints).
+
+    The objective |g|, with g = |I1| - coef * |I2| the signed imbalance, is not differentiable where it vanishes,
+    hence (g / I0)^2 is minimized instead (I0 is the input current), with the same minimizers.
+    At each iterate, g is evaluated at the iterate and at the 2 d points of its central differences as a single
+    batch (see Problem.evaluate_many), such that an iteration takes about the time of one evaluation.
+    Steps are relative to the ranges of the parameters, chosen from the mesh noise of the currents
+    (see relative_step and convergence.ConvergenceStudy.noise) ; they are one-sided at the bounds.
+    An iterate whose evaluation failed (see Problem.evaluate_many) gets a penalty objective with a zero gradient,
+    such that the line search backs off from it.
+    """
+
+    # Objective of an iterate that failed, well above that of any design ((g / I0)^2 is at most about 1)
+    PENALTY = 1e3
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        problem,
+        x0 : typing.Optional[typing.List[float]] = None,
+        method : str = "L-BFGS-B",
+        noise : typing.Optional[float] = None,
+        study = None,
+        step : typing.Optional[float] = None,
+        constraints : bool = False,
+        max_iterations : int = 50,
+        tolerance : float = 1e-3,
+        workers : typing.Optional[int] = None,
+    ):
+        """
+        Initialize optimizer:
+            * problem to optimize (its database is used and filled)
+            * initial point (defaults to the nominal point)
+            * method of scipy.optimize.minimize, see METHODS
+            * relative noise of the currents due to the mesh (defaults to None, i.e. measured by the study)
+            * convergence study of the problem (see convergence.ConvergenceStudy), measuring the noise for the
+              mesh constants of the problem (see mesh_noise) if it is not given (defaults to None, i.e. a noise of 1e-4)
+            * step relative to the ranges of the parameters (defaults to relative_step(noise))
+            * respect the geometric constraints of the problem (see Problem.constraints, SLSQP only)
+            * maximum number of iterations
+            * stop when the objective is below this tolerance [A]
+            * number of concurrent evaluations (defaults to the number of cores)
+        """
+        assert method in METHODS,method
+        assert not constraints or method == "SLSQP","Only SLSQP handles the constraints"
+        self.problem = problem
+        self.low  = numpy.array([v[1] for v in problem.input_parameters.values()])
+        self.high = numpy.array([v[2] for v in problem.input_parameters.values()])
+        self.x0 = numpy.array(x0 if x0 is not None else [v[0] for v in problem.input_parameters.values()])
+        self.method = method
+        if step is None and noise is None:
+            noise = mesh_noise(study,problem.mesh_parameters) if study is not None else 1e-4
+            logging.info(f"> Gradient : relative noise of the currents {noise}")
+        self.step = step if step is not None else relative_step(noise)
+        self.constraints = constraints
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.workers = workers
+
+        # Signed imbalance and input current of the points evaluated so far (unit cube)
+        self.known : typing.Dict[tuple,typing.Optional[typing.Tuple[float,float]]] = {}
+        self.batches : typing.List[int] = []
+
+    def _to_unit(self,x : numpy.ndarray) -> numpy.ndarray:
+        return (x - self.low) / (self.high - self.low)
+
+    def _from_unit(self,u : numpy.ndarray) -> numpy.ndarray:
+        return self.low + u * (self.high - self.low)
+
+    def _evaluate(self,points : numpy.ndarray):
+        """
+        Evaluate the points (unit cube) that are not known yet, as a single batch.
+        """
+        missing = list(dict.fromkeys(tuple(u) for u in points.tolist() if tuple(u) not in self.known))
+        if not missing:
+            return
+        self.batches.append(len(missing))
+        currents = self.problem.evaluate_many(points=self._from_unit(numpy.array(missing)),workers=self.workers)
+        for u,c in zip(missing,currents):
+            self.known[u] = (float(numpy.abs(c[1]) - self.problem.coef_I_inobj * numpy.abs(c[2])),float(numpy.abs(c[0]))) if c is not None else None
+
+    def stencil(self,u : numpy.ndarray) -> numpy.ndarray:
+        """
+        The point and its central differences (2 d + 1 points), shifted inside the unit cube at the bounds.
+        """
+        steps = self.step * numpy.eye(u.size)
+        return numpy.vstack([u,numpy.clip(u + steps,0.0,1.0),numpy.clip(u - steps,0.0,1.0)])
+
+    def gradient(self,u : numpy.ndarray) -> typing.Optional[typing.Tuple[float,numpy.ndarray]]:
+        """
+        Signed imbalance at a point (unit cube) relative to the input current, and its gradient
+        (None if the evaluation of the point failed).
+        A perturbed point that failed (see Problem.evaluate_many) falls back to a one-sided difference.
+        """
+        points = self.stencil(u)
+        self._evaluate(points)
+        values = [self.known[tuple(p)] for p in points.tolist()]
+        if values[0] is None:
+            return None
+        g, current = values[0]
+
+        d = u.size
+        gradient = numpy.zeros(d)
+        for i in range(d):
+            (plus, up), (minus, um) = [(points[1 + i + k * d][i],values[1 + i + k * d]) for k in range(2)]
+            if up is None: plus, up = u[i], values[0]
+            if um is None: minus, um = u[i], values[0]
+            if plus != minus:
+                gradient[i] = (up[0] - um[0]) / (plus - minus)
+        return g / current, gradient / current
+
+    def _objective(self,u : numpy.ndarray) -> typing.Tuple[float,numpy.ndarray]:
+        value = self.gradient(u)
+        if value is None:
+            logging.warning(f"> Gradient : evaluation of {self._from_unit(u)} failed, objective {self.PENALTY}")
+            return self.PENALTY, numpy.zeros(u.size)
+        g, gradient = value
+        logging.info(f"> Gradient : objective {numpy.abs(g)} (relative) at {self._from_unit(u)}")
+        return g**2, 2.0 * g * gradient
+
+    def run(self) -> dict:
+        """
+        Run the optimization.
+        Returns the best point, its objective, the number of iterations and evaluations, and the wall time.
+        """
+        started_at = time.perf_counter()
+        kwargs = {}
+        if self.constraints:
+            constraint = self.problem.constraints()
+            kwargs['constraints'] = [scipy.optimize.NonlinearConstraint(lambda u : constraint.fun(self._from_unit(u)),constraint.lb,constraint.ub)]
+
+        def stop(intermediate_result):
+            value = self.known.get(tuple(intermediate_result.x.tolist()))
+            if value is not None and abs(value[0]) < self.tolerance:
+                raise StopIteration
+
+        result = scipy.optimize.minimize(
+            self._objective,
+            x0       = self._to_unit(self.x0),
+            jac      = True,
+            method   = self.method,
+            bounds   = [(0.0,1.0)] * self.x0.size,
+            options  = {'maxiter' : self.max_iterations},
+            callback = stop,
+            **kwargs,
+        )
+
+        # Best point evaluated (satisfying the constraints), the last iterate is not necessarily the best one
+        known = {u : v for u,v in self.known.items() if v is not None}
+        if self.constraints:
+            known = {u : v for u,v in known.items() if numpy.all(constraint.fun(self._from_unit(numpy.array(u))) >= constraint.lb)}
+        if not known:
+            raise RuntimeError("No point evaluated successfully")
+        best = min(known,key=lambda u : abs(known[u][0]))
+        result = {
+            'x'           : self._from_unit(numpy.array(best)),
+            'objective'   : abs(known[best][0]),
+            'iterations'  : int(result.nit),
+            'evaluations' : sum(self.batches),
+            'batches'     : len(self.batches),
+            'elapsed'     : time.perf_counter() - started_at,
+        }
+        logging.info(f"> Gradient : best point is {result}")
+        return result
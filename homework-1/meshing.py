@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+import typing
+import logging
+
+import typeguard
+
+# The GMSH Python API is only needed by the in-process meshing backend
+try:
+    import gmsh
+except ImportError:
+    gmsh = None
+
+class GmshSession(object):
+    """
+    Long-lived GMSH session driven through its Python API.
+
+    Compared to running the GMSH executable for each mesh, this saves the process startup,
+    and node/element counts and warnings are read as structured data instead of parsing text.
+    The GMSH library holds a global state, hence there is one session per process (see session()).
+    """
+
+    def __init__(self):
+        if gmsh is None:
+            raise ImportError("The GMSH Python API is required for the in-process meshing backend (pip install gmsh)")
+        gmsh.initialize()
+        gmsh.option.setNumber("General.Terminal",0)
+        self.pid = os.getpid()
+
+    @typeguard.typechecked
+    def mesh(self,*,geo_file : Path, parameters : typing.Dict[str,float], msh_file : Path, background_mesh : typing.Optional[Path] = None) -> dict:
+        """
+        Mesh the geometry in 2D with the given parameters (overriding the DefineConstant's of the .geo)
+        and write it to the .msh file. The mesh size is bounded by the background mesh (.pos view of sizes) if given.
+        Returns the number of nodes and elements, and the warnings issued by GMSH.
+        """
+        gmsh.logger.start()
+        try:
+            # Start over from an empty model, parser variables are reset as well
+            gmsh.clear()
+            for k,v in parameters.items():
+                gmsh.parser.setNumber(k,[v])
+            gmsh.parser.parse(str(geo_file))
+            gmsh.model.geo.synchronize()
+
+            if background_mesh is not None:
+                gmsh.merge(str(background_mesh))
+                field = gmsh.model.mesh.field.add("PostView")
+                gmsh.model.mesh.field.setNumber(field,"ViewTag",gmsh.view.getTags()[-1])
+                gmsh.model.mesh.field.setAsBackgroundMesh(field)
+
+            gmsh.model.mesh.generate(2)
+            gmsh.write(str(msh_file))
+
+            node_tags, _, _ = gmsh.model.mesh.getNodes()
+            _, element_tags, _ = gmsh.model.mesh.getElements()
+        finally:
+            messages = gmsh.logger.get()
+            gmsh.logger.stop()
+
+        for message in messages:
+            logging.debug(message)
+
+        return {
+            'number_of_nodes'    : len(node_tags),
+            'number_of_elements' : sum(len(tags) for tags in element_tags),
+            'warnings'           : [m for m in messages if any(x in m for x in ['Warning','warning','skipping','Skipping'])],
+        }
+
+    def close(self):
+        gmsh.finalize()
+
+# Session of the current process
+_SESSION : typing.Optional[GmshSession] = None
+
+def session() -> GmshSession:
+    """
+    Get the GMSH session of the current process, starting it if needed
+    (a forked worker process does not reuse the session of its parent).
+    """
+    global _SESSION
+    if _SESSION is None or _SESSION.pid != os.getpid():
+        _SESSION = GmshSession()
+    return _SESSION
@@ -0,0 +1,91 @@
+import re
+import sys
+import json
+import time
+import typing
+from pathlib import Path
+import contextlib
+
+import typeguard
+
+# Metrics of each evaluation (NaN when not available for a backend)
+METRICS = [
+    'time_mesh',        # Meshing (GMSH or morphing) [s]
+    'time_solve',       # Solve and post-operation (GETDP or native solver) [s]
+    'time_read',        # Reading the result files [s]
+    'time_record',      # Adding the evaluation to the database and to the archive [s]
+    'time_assembly',    # Assembly reported by the solver [s]
+    'time_linear',      # Linear solve reported by the solver [s]
+    'dofs',             # Number of degrees of freedom
+    'iterations',       # Iterations of the iterative linear solver
+    'solver_memory',    # Memory reported by the solver [MB]
+    'peak_rss',         # Peak resident set size of this process and its children so far [MB]
+    'cache_hit',        # 1 if the evaluation was read from the cache
+]
+
+@typeguard.typechecked
+def parse_getdp(output : str) -> typing.Dict[str,float]:
+    """
+    Extract from the output of GETDP:
+        * wall time of the Generate (assembly) and Solve (linear solve) operations
+        * number of degrees of freedom
+        * largest memory usage reported
+    """
+    metrics = {'time_assembly' : 0.0, 'time_linear' : 0.0}
+    operation = None
+    for line in output.splitlines():
+        if 'Generate[' in line:
+            operation = 'time_assembly'
+        elif 'Solve[' in line:
+            operation = 'time_linear'
+        elif re.search(r'\w+\[',line):
+            operation = None
+        wall = re.search(r'Wall\s*([0-9.eE+-]+)\s*s',line)
+        if wall is not None and operation is not None:
+            metrics[operation] += float(wall.group(1))
+        dofs = re.search(r'([0-9]+)\s+Dofs',line)
+        if dofs is not None:
+            metrics['dofs'] = float(dofs.group(1))
+        memory = re.search(r'Mem(?:ory)?\s*([0-9.]+)\s*Mb',line)
+        if memory is not None:
+            metrics['solver_memory'] = max(metrics.get('solver_memory',0.0),float(memory.group(1)))
+    return metrics
+
+def peak_rss() -> float:
+    """
+    Peak resident set size of this process and of its (terminated) children so far [MB].
+    """
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    # Kilobytes on Linux, bytes on macOS
+    scale = 1.0 / 1024**2 if sys.platform == 'darwin' else 1.0 / 1024
+    return scale * max(
+        resource.getrusage(resource.RUSAGE_SELF    ).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+@contextlib.contextmanager
+def timer(metrics : dict, name : str):
+    """
+    Add the wall time spent in the block to metrics[name].
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics[name] = metrics.get(name,0.0) + time.perf_counter() - started_at
+
+class JsonLinesSink(object):
+    """
+    Metrics sink appending one JSON object per evaluation to a file.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,path : typing.Union[str,Path]):
+        self.path = Path(path)
+
+    def __call__(self,metrics : dict):
+        with open(self.path,'a') as f:
+            f.write(json.dumps(metrics) + '\n')
@@ -0,0 +1,116 @@
+from pathlib import Path
+import typing
+import logging
+
+import numpy
+import typeguard
+
+import gmshio
+
+@typeguard.typechecked
+def triangle_quality(coordinates : numpy.ndarray, triangles : numpy.ndarray) -> numpy.ndarray:
+    """
+    Shape quality 4*sqrt(3)*area / (sum of squared edge lengths) of each triangle,
+    1 for an equilateral triangle, 0 for a degenerate one, and with the sign of the orientation
+    of the triangle (counter-clockwise is positive).
+    """
+    p = coordinates[triangles][:,:,0:2]
+    a, b, c = p[:,1] - p[:,0], p[:,2] - p[:,0], p[:,2] - p[:,1]
+    area = 0.5 * (a[:,0] * b[:,1] - a[:,1] * b[:,0])
+    return 4.0 * numpy.sqrt(3.0) * area / (numpy.sum(a**2,axis=1) + numpy.sum(b**2,axis=1) + numpy.sum(c**2,axis=1))
+
+class MeshMorpher(object):
+    """
+    Morph a reference mesh to a perturbed design optimization hole (ellipse) instead of remeshing.
+
+    The ellipse of center (DO_x,DO_y), half vertical axis DO_a and half horizontal axis DO_b is mapped
+    onto the new one by the affine map p -> c' + S (p - c), with S = diag(DO_b'/DO_b,DO_a'/DO_a).
+    Nodes are displaced by this map, blended by a smooth weight that decreases from 1 on the ellipse
+    to 0 before reaching any other boundary node (electrodes, plate edges), which therefore do not move.
+    Nodes on the symmetry line x = DO_x stay on it.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        reference : gmshio.Mesh,
+        parameters : typing.Dict[str,float],
+        DO_x : float,
+        hole : int = 205,
+        surface : int = 200,
+        min_quality : float = 0.2,
+        margin : float = 0.9,
+    ):
+        """
+        Initialize morpher:
+            * reference mesh
+            * parameters (DO_y, DO_a, DO_b) the reference mesh was created with
+            * X coordinate of the ellipse center
+            * physical tag of the ellipse curve
+            * physical tag of the meshed surface
+            * minimum triangle quality of a morphed mesh, below which a full remesh is needed
+            * fraction of the distance to the closest fixed boundary node over which the displacement is blended
+        """
+        self.reference = reference
+        self.parameters = {k : parameters[k] for k in ['DO_y','DO_a','DO_b']}
+        self.DO_x = DO_x
+        self.min_quality = min_quality
+
+        self.triangles = reference.elements(physical=surface,type=2)
+
+        # Normalized elliptic radius of each node w.r.t. the reference ellipse (1 on the ellipse)
+        self.radius = self._radius(reference.coordinates)
+
+        # Fixed nodes : on a boundary entity (curve or point), not on the ellipse nor on the symmetry line
+        boundary = reference.node_entity[:,0] < 2
+        boundary[reference.nodes(physical=hole)] = False
+        boundary &= numpy.abs(reference.coordinates[:,0] - DO_x) > 1e-9
+        self.support = margin * numpy.min(self.radius[boundary]) if boundary.any() else numpy.inf
+        assert self.support > 1.0,"Other boundaries are too close to the ellipse to morph the mesh"
+
+        # Quality is measured w.r.t. the orientation of the reference triangles, such that inverted ones are negative
+        quality = triangle_quality(reference.coordinates,self.triangles)
+        self.orientation = numpy.sign(quality)
+        self.reference_quality = float(numpy.min(numpy.abs(quality)))
+
+    def _radius(self,coordinates : numpy.ndarray) -> numpy.ndarray:
+        return numpy.sqrt(
+            ((coordinates[:,0] - self.DO_x              ) / self.parameters['DO_b'])**2 +
+            ((coordinates[:,1] - self.parameters['DO_y']) / self.parameters['DO_a'])**2
+        )
+
+    def _weight(self) -> numpy.ndarray:
+        """
+        Smooth blending weight, 1 on the ellipse and 0 beyond the support radius.
+        """
+        t = numpy.clip((self.radius - 1.0) / (self.support - 1.0),0.0,1.0)
+        return 1.0 - t**2 * (3.0 - 2.0 * t)
+
+    @typeguard.typechecked
+    def morph(self,*,parameters : typing.Dict[str,float]) -> typing.Tuple[numpy.ndarray,float]:
+        """
+        Node coordinates of the mesh morphed to the ellipse defined by parameters (DO_y, DO_a, DO_b),
+        and the minimum triangle quality of the morphed mesh.
+        """
+        ref, new = self.parameters, parameters
+        p = self.reference.coordinates
+        target = numpy.copy(p)
+        target[:,0] = self.DO_x    + (p[:,0] - self.DO_x   ) * new['DO_b'] / ref['DO_b']
+        target[:,1] = new['DO_y'] + (p[:,1] - ref['DO_y']) * new['DO_a'] / ref['DO_a']
+
+        coordinates = p + self._weight()[:,None] * (target - p)
+        quality = float(numpy.min(self.orientation * triangle_quality(coordinates,self.triangles)))
+        return coordinates, quality
+
+    @typeguard.typechecked
+    def write(self,*,parameters : typing.Dict[str,float], msh_file : Path) -> bool:
+        """
+        Write the morphed mesh if its quality is acceptable.
+        Returns False if a full remesh is needed instead.
+        """
+        coordinates, quality = self.morph(parameters=parameters)
+        if quality < self.min_quality:
+            logging.info(f"> Morphed mesh quality {quality} below {self.min_quality}, remeshing")
+            return False
+        logging.debug(f"> Morphed mesh quality {quality} (reference {self.reference_quality})")
+        self.reference.write(msh_file,coordinates=coordinates)
+        return True
@@ -0,0 +1,186 @@
+import logging
+import typing
+from pathlib import Path
+
+import numpy
+import scipy.optimize
+import scipy.stats.qmc
+import typeguard
+
+from surrogate import GaussianProcess
+import geometry
+
+class MultiFidelityOptimizer(object):
+    """
+    Multi-fidelity optimization : candidates are screened on a coarse mesh, only the most promising ones
+    are evaluated on the mesh of the problem (fine).
+
+    The signed imbalance |I1| - coef * |I2| on the fine mesh is predicted at the coarse points as
+    the coarse value plus a correction learned from the points evaluated on both meshes
+    (a constant offset until there are enough of them, then a Gaussian process).
+    Each round promotes the coarse points with the smallest predicted objective to the fine mesh, then
+    screens new coarse candidates in a box around the best fine point, shrunk at each round.
+    The minimizer of a Gaussian process fitted to the predicted fine imbalance of all the coarse points
+    is evaluated on both meshes and promoted as well, such that the optimum is not limited to the screened points.
+    The result is the best point evaluated on the fine mesh.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        problem,
+        ratio : float = 4.0,
+        coarse_mesh_parameters : typing.Optional[typing.Dict[str,float]] = None,
+        screening : int = 64,
+        promote : int = 2,
+        refine : int = 16,
+        rounds : int = 5,
+        shrink : float = 0.5,
+        tolerance : float = 1e-3,
+        workers : typing.Optional[int] = None,
+        seed : int = 0,
+    ):
+        """
+        Initialize optimizer:
+            * problem to optimize, at its (fine) mesh constants (its database is used and filled)
+            * ratio applied to the mesh constants of the problem for the coarse mesh (see convergence.ConvergenceStudy)
+            * coarse mesh constants (defaults to those of the problem, or of mesh.parameters.geo, times the ratio)
+            * number of points of the initial coarse Latin hypercube
+            * number of points promoted to the fine mesh at each round (including the minimizer of the model)
+            * number of coarse points screened at each round around the best fine point
+            * maximum number of rounds
+            * factor by which the screening box shrinks at each round
+            * stop when the fine objective is below this tolerance [A]
+            * number of concurrent evaluations (defaults to the number of cores)
+            * seed of the designs
+        """
+        self.problem = problem
+        if coarse_mesh_parameters is None:
+            defaults = geometry.constants(Path(problem.workdir) / 'mesh.parameters.geo')
+            coarse_mesh_parameters = {k : ratio * problem.mesh_parameters.get(k,v) for k,v in defaults.items()}
+        self.coarse = problem.with_mesh_parameters(coarse_mesh_parameters)
+
+        self.screening = screening
+        self.promote = promote
+        self.refine = refine
+        self.rounds = rounds
+        self.shrink = shrink
+        self.tolerance = tolerance
+        self.workers = workers
+        self.seed = seed
+
+        self.low  = numpy.array([v[1] for v in problem.input_parameters.values()])
+        self.high = numpy.array([v[2] for v in problem.input_parameters.values()])
+
+        self.correction = GaussianProcess(seed=seed)
+        self.model = GaussianProcess(seed=seed)
+
+    def _to_unit(self,x : numpy.ndarray) -> numpy.ndarray:
+        return (x - self.low) / (self.high - self.low)
+
+    def _from_unit(self,u : numpy.ndarray) -> numpy.ndarray:
+        return self.low + u * (self.high - self.low)
+
+    def _data(self,problem) -> typing.Tuple[numpy.ndarray,numpy.ndarray]:
+        """
+        Points and signed imbalance of the database of a problem.
+        """
+        database = problem.database
+        if len(database) == 0:
+            return numpy.empty((0,len(self.low))), numpy.empty((0,))
+        X = numpy.hstack([database[k] for k in problem.input_parameters.keys()])
+        currents = database['currents']
+        return X, numpy.abs(currents[:,1]) - problem.coef_I_inobj * numpy.abs(currents[:,2])
+
+    def predict(self,X : numpy.ndarray, g : numpy.ndarray) -> numpy.ndarray:
+        """
+        Fine signed imbalance predicted from the coarse one g at the points X.
+        """
+        Xc, gc = self._data(self.coarse)
+        Xf, gf = self._data(self.problem)
+
+        # Pairs : fine points also evaluated on the coarse mesh
+        coarse = {tuple(x) : v for x,v in zip(Xc.tolist(),gc)}
+        pairs = [(x,v - coarse[tuple(x)]) for x,v in zip(Xf.tolist(),gf) if tuple(x) in coarse]
+        if not pairs:
+            return g
+        Xp, delta = numpy.array([p[0] for p in pairs]), numpy.array([p[1] for p in pairs])
+        if len(pairs) < len(self.low) + 2:
+            return g + numpy.mean(delta)
+        self.correction.fit(self._to_unit(Xp),delta)
+        return g + self.correction.predict(self._to_unit(X))[0]
+
+    def _minimize(self,X : numpy.ndarray, g : numpy.ndarray, low : numpy.ndarray, width : float, rng : numpy.random.Generator) -> numpy.ndarray:
+        """
+        Point of the box [low,low+width] (unit cube) minimizing the absolute value of a Gaussian process fitted to g at X.
+        """
+        self.model.fit(self._to_unit(X),g)
+        objective = lambda u : float(numpy.abs(self.model.predict(numpy.atleast_2d(u))[0][0]))
+        candidates = low + width * rng.uniform(size=(256,len(self.low)))
+        starts = candidates[numpy.argsort(numpy.abs(self.model.predict(candidates)[0]))[:3]]
+        bounds = list(zip(low,low + width))
+        results = [scipy.optimize.minimize(objective,x0=x0,method='L-BFGS-B',bounds=bounds) for x0 in starts]
+        return self._from_unit(min(results,key=lambda r : r.fun).x)
+
+    def _cost(self,problem) -> float:
+        """
+        Time spent evaluating the points of the database of a problem [s].
+        """
+        if len(problem.database) == 0 or 'time_mesh' not in problem.database:
+            return 0.0
+        return float(numpy.nansum([numpy.nansum(problem.database[k]) for k in ['time_mesh','time_solve','time_read'] if k in problem.database]))
+
+    def run(self) -> dict:
+        """
+        Run the optimization.
+        Returns the best point evaluated on the fine mesh and its objective, with the number of evaluations
+        and the time spent on each mesh.
+        """
+        d = len(self.low)
+        design = scipy.stats.qmc.LatinHypercube(d=d,seed=self.seed)
+        logging.info(f"> Multi-fidelity : screening {self.screening} points on the coarse mesh")
+        self.coarse.evaluate_many(points=self._from_unit(design.random(n=self.screening)),workers=self.workers)
+
+        rng = numpy.random.default_rng(self.seed)
+        low, width = numpy.zeros(len(self.low)), 1.0
+        for i in range(self.rounds):
+            # Minimizer of the predicted fine imbalance, also evaluated on the coarse mesh to learn the correction there
+            Xc, gc = self._data(self.coarse)
+            minimizer = self._minimize(Xc,self.predict(Xc,gc),low,width,rng)
+            evaluated, = self.coarse.evaluate_many(points=[minimizer],workers=self.workers)
+
+            # Promote it (unless it failed, is infeasible or is already on the fine mesh)
+            # with the coarse points with the smallest predicted fine objective
+            Xc, gc = self._data(self.coarse)
+            Xf, _ = self._data(self.problem)
+            done = set(tuple(x) for x in Xf.tolist())
+            promoted = [minimizer] if evaluated is not None and tuple(minimizer.tolist()) not in done else []
+            done.update(tuple(x.tolist()) for x in promoted)
+            order = [j for j in numpy.argsort(numpy.abs(self.predict(Xc,gc))) if tuple(Xc[j].tolist()) not in done]
+            promoted = numpy.array(promoted + [Xc[j] for j in order[:self.promote - len(promoted)]]).reshape(-1,len(self.low))
+            logging.info(f"> Multi-fidelity : round {i}, promoting {promoted.shape[0]} points to the fine mesh")
+            # The other promoted points are not needed once one of them is below the tolerance
+            self.problem.evaluate_many(points=promoted,workers=self.workers,stop=lambda c : abs(numpy.abs(c[1]) - self.problem.coef_I_inobj * numpy.abs(c[2])) < self.tolerance)
+
+            Xf, gf = self._data(self.problem)
+            best = int(numpy.argmin(numpy.abs(gf)))
+            logging.info(f"> Multi-fidelity : best fine objective {numpy.abs(gf[best])}")
+            if numpy.abs(gf[best]) < self.tolerance or i == self.rounds - 1:
+                break
+
+            # Screen new coarse candidates around the best fine point
+            width *= self.shrink
+            low = numpy.clip(self._to_unit(Xf[best]) - width / 2.0,0.0,1.0 - width)
+            self.coarse.evaluate_many(points=self._from_unit(low + width * design.random(n=self.refine)),workers=self.workers)
+
+        Xf, gf = self._data(self.problem)
+        best = int(numpy.argmin(numpy.abs(gf)))
+        result = {
+            'x'                   : Xf[best],
+            'objective'           : float(numpy.abs(gf[best])),
+            'coarse_evaluations'  : len(self.coarse.database),
+            'fine_evaluations'    : len(self.problem.database),
+            'coarse_time'         : self._cost(self.coarse),
+            'fine_time'           : self._cost(self.problem),
+        }
+        logging.info(f"> Multi-fidelity : best point is {result}")
+        return result
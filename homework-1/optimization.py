@@ -4,13 +4,34 @@ import typing
 import logging
 import subprocess
 import re
+import shutil
+import tempfile
+import contextlib
 import copy
+import concurrent.futures
 
 import numpy
 import pandas
 import scipy.optimize
 import typeguard
 
+from cache import EvaluationCache
+from store import ResultStore
+from surrogate import SurrogateOptimizer
+from multifidelity import MultiFidelityOptimizer
+from sweep import Sweep
+from refinement import AdaptiveRefinement
+from gradient import GradientOptimizer
+from archive import FieldArchive, read_maps
+from rendering import MapRenderer
+import meshing
+import gmshio
+import geometry
+from morphing import MeshMorpher
+from solver import NativeSolver
+from scheduler import Scheduler
+import metrics
+
 # Setup logging
 logging.basicConfig(
     level = logging.INFO
@@ -24,6 +45,9 @@ class Problem(object):
     Class that defines our problem.
     """
 
+    # Number of solutions kept to start the iterative solver from
+    WARM_STARTS = 16
+
     @typeguard.typechecked
     def __init__(self,*,
         geo_file : typing.Union[str,Path],
@@ -34,6 +58,18 @@ class Problem(object):
         input_parameters : typing.Dict[str,typing.List],
         coef_I_inobj : float,
         mesh_parameters : dict = {},
+        cache : typing.Optional[EvaluationCache] = None,
+        database_path : typing.Optional[typing.Union[str,Path]] = None,
+        postpro_maps : typing.Optional[str] = None,
+        mesher : str = "subprocess",
+        morphing : bool = False,
+        solver : str = "getdp",
+        metrics_sink : typing.Optional[typing.Callable[[dict],None]] = None,
+        timeouts : typing.Dict[str,float] = {},
+        scheduler : typing.Optional[Scheduler] = None,
+        feasibility : typing.Optional[geometry.Feasibility] = None,
+        background_mesh : typing.Optional[typing.Union[str,Path]] = None,
+        archive : typing.Optional[FieldArchive] = None,
     ):
         """
         Initialize problem:
@@ -45,6 +81,24 @@ class Problem(object):
             * input variables
             * coefficient to be applied to input current in objective function
             * mesh constants (defaults to empty dict, i.e. default values from .geo file)
+            * evaluation cache (defaults to None, i.e. no cache)
+            * directory to which the database is streamed (defaults to None, i.e. in memory only)
+            * post-pro name in the .pro file that writes the field maps, run on demand only (defaults to None)
+            * meshing backend, "subprocess" (GMSH executable) or "session" (in-process GMSH Python API)
+            * morph the last full mesh to the new ellipse instead of remeshing, when its quality allows it
+            * solver backend, "getdp", "native" (NumPy/SciPy, in-process, see solver.NativeSolver) or "native-iterative"
+              (same, with the conjugate gradient started from the solution of the nearest design solved before)
+            * callable receiving the metrics of each evaluation (defaults to None, e.g. metrics.JsonLinesSink)
+            * timeouts of the GMSH ('mesh') and GETDP ('solve') executables in seconds (defaults to none)
+            * scheduler running the evaluations asynchronously, with retry or penalty policies for failed points
+              (defaults to None, i.e. evaluations run directly and failures raise), or distributed.Coordinator
+              running them on workers over TCP
+            * geometric feasibility check run before meshing, infeasible designs raise or are penalized
+              (defaults to None, i.e. no check)
+            * background mesh, a .pos view of mesh sizes given to GMSH, which meshes with the smallest of these sizes
+              and those of the mesh constants (defaults to None, see refinement.AdaptiveRefinement)
+            * archive of the field maps of each evaluation (defaults to None), the evaluations then run
+              the post-operation of the field maps with GETDP
         """
         assert os.path.exists(geo_file)
         assert os.path.exists(pro_file)
@@ -55,6 +109,7 @@ class Problem(object):
 
         self.problem = problem
         self.postpro = postpro
+        self.postpro_maps = postpro_maps
 
         self.input_parameters=  input_parameters
 
@@ -62,11 +117,118 @@ class Problem(object):
 
         self.mesh_parameters = mesh_parameters
 
+        assert mesher in ["subprocess","session"],mesher
+        self.mesher = mesher
+
+        self.morphing = morphing
+        self._morpher : typing.Optional[MeshMorpher] = None
+
+        assert solver in ["getdp","native","native-iterative"],solver
+        self.solver = solver
+
+        # Most recent solutions of the iterative solver, with their (normalized) parameters
+        self._solutions : typing.List[typing.Tuple[numpy.ndarray,dict]] = []
+
+        self.cache = cache
+
+        self.metrics_sink = metrics_sink
+
+        assert set(timeouts.keys()) <= {'mesh','solve'},timeouts
+        self.timeouts = timeouts
+
+        assert scheduler is None or not scheduler.executables or (mesher == "subprocess" and solver == "getdp" and not morphing),"The scheduler runs the GMSH and GETDP executables"
+        self.scheduler = scheduler
+
+        self.feasibility = feasibility
+
+        self.background_mesh = background_mesh
+
+        assert archive is None or (postpro_maps is not None and scheduler is None),"The archive needs the field maps of the evaluations"
+        self.archive = archive
+
         # Count the number of evaluations
         self.counter = 0
 
         # Store the fields at each optimization iteration
-        self.database : pandas.DataFrame = None
+        self.database = ResultStore(path=database_path)
+
+    def __getstate__(self):
+        """
+        Do not ship the database to worker processes.
+        """
+        state = self.__dict__.copy()
+        state['database'] = None
+        return state
+
+    @typeguard.typechecked
+    def with_mesh_parameters(self,mesh_parameters : typing.Dict[str,float]) -> "Problem":
+        """
+        Copy of the problem evaluated with other mesh constants (e.g. a coarse mesh), with its own (empty) database.
+        The cache is shared, entries are distinguished by the mesh constants.
+        Its evaluations are neither archived nor sent to the metrics sink, which hold those of the problem.
+        """
+        problem = copy.copy(self)
+        problem.mesh_parameters = mesh_parameters
+        problem.database = ResultStore()
+        problem.counter = 0
+        # Do not morph or warm start from the meshes of the other fidelity
+        problem._morpher = None
+        problem._solutions = []
+        problem.archive = None
+        problem.metrics_sink = None
+        return problem
+
+    @property
+    def workdir(self) -> Path:
+        """
+        Directory holding the .geo and .pro files, used by serial evaluations.
+        """
+        return Path(os.path.dirname(self.geo_file))
+
+    def _dependencies(self) -> typing.List[Path]:
+        """
+        List the .geo and .pro files, and the files they (recursively) include.
+        """
+        files = []
+        queue = [Path(self.geo_file),Path(self.pro_file)]
+        while queue:
+            file = queue.pop(0)
+            if file in files: continue
+            files.append(file)
+            for include in re.findall(r'Include\s*"([^"]+)"',file.read_text()):
+                queue.append(Path(os.path.normpath(file.parent / include)))
+        return files
+
+    def _tree(self) -> typing.Tuple[Path,typing.List[Path]]:
+        """
+        Common directory of the .geo/.pro files and their includes (which may be outside of the working directory,
+        e.g. "../common.geo"), and their paths relative to it, such that the tree can be copied elsewhere.
+        """
+        files = [Path(os.path.abspath(file)) for file in self._dependencies()]
+        root = Path(os.path.commonpath([file.parent for file in files]))
+        return root, [file.relative_to(root) for file in files]
+
+    @contextlib.contextmanager
+    def _scratch(self):
+        """
+        Create a scratch directory with a copy of the .geo/.pro files and their includes,
+        such that GMSH and GETDP output files do not collide between concurrent evaluations.
+        """
+        root, files = self._tree()
+        with tempfile.TemporaryDirectory(prefix='elec0041-') as tmp:
+            for file in files:
+                (Path(tmp) / file).parent.mkdir(parents=True,exist_ok=True)
+                shutil.copy(root / file,Path(tmp) / file)
+            yield Path(tmp) / Path(os.path.abspath(self.workdir)).relative_to(root)
+
+    @typeguard.typechecked
+    def _parameters(self,x) -> typing.Dict[str,float]:
+        """
+        Map a point (sequence of values) to the input parameters names.
+        """
+        return {
+            k : float(v) for k,v in zip(self.input_parameters.keys(),x)
+        }
 
     @typeguard.typechecked
     def _setnumber(self,*,input_parameters_values : typing.Dict[str,float]) -> typing.List[str]:
@@ -74,32 +236,98 @@ class Problem(object):
         return [item for sublist in a for item in sublist]
 
     @typeguard.typechecked
-    def _mesh(self,*,input_parameters_values : typing.Dict[str,float]):
+    def _mesh(self,*,input_parameters_values : typing.Dict[str,float], workdir : Path) -> typing.Tuple[int,int]:
         """
         Use GMSH to mesh the geometry.
+        Returns the number of nodes and elements.
         """
-        # Run GMSH
-        o = subprocess.check_output(
-            args = [
-                "gmsh",
-                *self._setnumber(input_parameters_values=input_parameters_values),
-                *self._setnumber(input_parameters_values=self.mesh_parameters),
-                "-2",
-                self.geo_file,
-            ]
-        )
-        logging.debug(o.decode())
+        msh_file = workdir / Path(self.geo_file).with_suffix('.msh').name
+
+        # Small design changes : morph the reference mesh
+        if self.morphing and self._morpher is not None:
+            if self._morpher.write(parameters=input_parameters_values,msh_file=msh_file):
+                return self._reference_counts
+
+        if self.mesher == "session":
+            counts = self._mesh_session(input_parameters_values=input_parameters_values,workdir=workdir)
+        else:
+            counts = self._mesh_subprocess(input_parameters_values=input_parameters_values,workdir=workdir)
+
+        # The full mesh becomes the reference for morphing
+        if self.morphing:
+            self._morpher = MeshMorpher(
+                reference  = gmshio.read_msh(msh_file),
+                parameters = input_parameters_values,
+                DO_x       = geometry.constants(workdir / Path(self.geo_file).name,overrides=input_parameters_values)['DO_x'],
+            )
+            self._reference_counts = counts
+
+        return counts
+
+    @typeguard.typechecked
+    def _mesh_command(self,*,input_parameters_values : typing.Dict[str,float], workdir : Path) -> typing.List[str]:
+        """
+        Command line of the GMSH executable.
+        """
+        return [
+            "gmsh",
+            *self._setnumber(input_parameters_values=input_parameters_values),
+            *self._setnumber(input_parameters_values=self.mesh_parameters),
+            *(["-bgm",str(Path(self.background_mesh).resolve())] if self.background_mesh is not None else []),
+            "-2",
+            str(workdir / Path(self.geo_file).name),
+        ]
+
+    @typeguard.typechecked
+    def _mesh_counts(self,*,output : str, input_parameters_values : typing.Dict[str,float]) -> typing.Tuple[int,int]:
+        """
+        Number of nodes and elements from the output of GMSH.
+        """
+        logging.debug(output)
 
         # Determine the number of elements in the mesh
-        match = re.search(r'([0-9]*) nodes ([0-9]*) elements',o.decode())
+        match = re.search(r'([0-9]*) nodes ([0-9]*) elements',output)
         assert match is not None and len(match.groups()) == 2
-        self.number_of_nodes, self.number_of_elements = [int(x) for x in match.groups()]
+        number_of_nodes, number_of_elements = [int(x) for x in match.groups()]
 
         # Ensure there is no warning or skipping in the output of GMSH
-        if any(x in o.decode() for x in ['Warning','warning','skipping','Skipping']):
+        if any(x in output for x in ['Warning','warning','skipping','Skipping']):
             raise RuntimeError(f"An error occured while meshing with {input_parameters_values}")
 
-    def _read(self):
+        return number_of_nodes, number_of_elements
+
+    @typeguard.typechecked
+    def _mesh_subprocess(self,*,input_parameters_values : typing.Dict[str,float], workdir : Path) -> typing.Tuple[int,int]:
+        """
+        Use the GMSH executable to mesh the geometry.
+        Returns the number of nodes and elements.
+        """
+        # Run GMSH
+        o = subprocess.check_output(
+            args    = self._mesh_command(input_parameters_values=input_parameters_values,workdir=workdir),
+            timeout = self.timeouts.get('mesh'),
+        )
+        return self._mesh_counts(output=o.decode(),input_parameters_values=input_parameters_values)
+
+    @typeguard.typechecked
+    def _mesh_session(self,*,input_parameters_values : typing.Dict[str,float], workdir : Path) -> typing.Tuple[int,int]:
+        """
+        Use the GMSH session of this process to mesh the geometry.
+        Returns the number of nodes and elements.
+        """
+        geo_file = workdir / Path(self.geo_file).name
+        result = meshing.session().mesh(
+            geo_file   = geo_file,
+            parameters = {**input_parameters_values,**self.mesh_parameters},
+            msh_file   = geo_file.with_suffix('.msh'),
+            background_mesh = Path(self.background_mesh).resolve() if self.background_mesh is not None else None,
+        )
+        if result['warnings']:
+            raise RuntimeError(f"An error occured while meshing with {input_parameters_values} : {result['warnings']}")
+        return result['number_of_nodes'], result['number_of_elements']
+
+    @typeguard.typechecked
+    def _read(self,*,workdir : Path):
         """
         Load the following fields:
             * current at output ports
@@ -110,40 +338,106 @@ class Problem(object):
         fields = {}
 
         # Read currents
-        with open(Path(os.path.dirname(self.geo_file)) / f"I{self.outputfiles}.txt","r") as f:
+        with open(workdir / f"I{self.outputfiles}.txt","r") as f:
             fields['currents'] = numpy.loadtxt(f)[1::]
 
         # Read voltages
-        with open(Path(os.path.dirname(self.geo_file)) / f"U{self.outputfiles}.txt","r") as f:
+        with open(workdir / f"U{self.outputfiles}.txt","r") as f:
             fields['voltages'] = numpy.loadtxt(f)[1::]
 
         # Read integrated losses
-        with open(Path(os.path.dirname(self.geo_file)) / f"integrated.losses{self.outputfiles}.txt","r") as f:
+        with open(workdir / f"integrated.losses{self.outputfiles}.txt","r") as f:
             fields['losses'] = numpy.loadtxt(f)[1::]
 
         return fields
 
     @typeguard.typechecked
-    def _solve(self,*,input_parameters_values : typing.Dict[str,float]):
+    def _solve_command(self,*,input_parameters_values : typing.Dict[str,float], workdir : Path, postpro : str) -> typing.List[str]:
         """
-        Use GETDP to solve the problem.
+        Command line of the GETDP executable.
         """
-        # Run GETDP
-        o = subprocess.check_output(
-            args = [
-                "getdp",
-                *self._setnumber(input_parameters_values=input_parameters_values),
-                self.pro_file,
-                "-solve",self.problem,
-                "-pos",self.postpro,
-            ]
-        )
-        logging.debug(o.decode())
+        return [
+            "getdp",
+            *self._setnumber(input_parameters_values=input_parameters_values),
+            str(workdir / Path(self.pro_file).name),
+            "-solve",self.problem,
+            "-pos",postpro,
+        ]
+
+    @typeguard.typechecked
+    def _solve_metrics(self,*,output : str, input_parameters_values : typing.Dict[str,float]) -> typing.Dict[str,float]:
+        """
+        Check the output of GETDP and extract its metrics (see metrics.parse_getdp).
+        """
+        logging.debug(output)
 
         # Check in the output that the input parameters where correctly recognized by GETDP
         for k,v in input_parameters_values.items():
             tmp = f"Adding number {k} = {str(v)[0:3]}"
-            assert tmp in o.decode(),"{} not found in {}".format(tmp,o.decode())
+            assert tmp in output,"{} not found in {}".format(tmp,output)
+
+        return metrics.parse_getdp(output)
+
+    @typeguard.typechecked
+    def _solve(self,*,input_parameters_values : typing.Dict[str,float], workdir : Path, postpro : str) -> typing.Dict[str,float]:
+        """
+        Use GETDP to solve the problem and run the post-operation.
+        Returns the metrics reported by GETDP (see metrics.parse_getdp).
+        """
+        # Run GETDP
+        o = subprocess.check_output(
+            args    = self._solve_command(input_parameters_values=input_parameters_values,workdir=workdir,postpro=postpro),
+            timeout = self.timeouts.get('solve'),
+        )
+        return self._solve_metrics(output=o.decode(),input_parameters_values=input_parameters_values)
+
+    @typeguard.typechecked
+    def _solve_native(self,*,input_parameters_values : typing.Dict[str,float], workdir : Path) -> dict:
+        """
+        Solve the problem in-process with the NumPy/SciPy solver, reading the constraints from the .pro file.
+        The iterative solver starts from the solution of the nearest design (w.r.t. the parameter ranges) solved before,
+        its solution is kept in self._solution (see _record).
+        """
+        pro_file = workdir / Path(self.pro_file).name
+        solver = NativeSolver.from_pro(pro_file,overrides=input_parameters_values,iterative=(self.solver == "native-iterative"))
+
+        x = numpy.array([(input_parameters_values[k] - v[1]) / (v[2] - v[1]) for k,v in self.input_parameters.items()])
+        initial = min(self._solutions,key=lambda s : numpy.linalg.norm(s[0] - x))[1] if self._solutions else None
+
+        fields = solver.solve(msh_file=pro_file.with_suffix('.msh'),initial=initial if solver.iterative else None)
+        self._solver_metrics = solver.metrics
+        self._solution = solver.solution if solver.iterative else None
+        return fields
+
+    @typeguard.typechecked
+    def load_cases(self,x, cases : typing.List[typing.Dict[str,float]]) -> typing.Dict[str,numpy.ndarray]:
+        """
+        Evaluate several load cases on the same geometry with a single mesh and solve.
+        Each case may set:
+            * 'current' : input current (defaults to CurrentValue of the .pro file)
+            * 'sigma'   : conductivity (defaults to the value of the .pro file)
+        The problem is linear in the input current and the potential scales with 1/sigma, hence
+        the cases are obtained by scaling the solution for the values of the .pro file:
+            * currents ~ I
+            * voltages ~ I / sigma
+            * losses   ~ I^2 / sigma
+        Returns the currents, voltages and losses stacked along the first axis (one row per case).
+        Raises a RuntimeError if the design is infeasible or its evaluation failed (under a penalty policy).
+        """
+        reference = NativeSolver.from_pro(self.pro_file,overrides=self._parameters(x))
+        assert len(reference.currents) == 1,"Load cases need a single electrode with an imposed current"
+        current = next(iter(reference.currents.values()))
+
+        if self(x) is None:
+            raise RuntimeError(f"Evaluation of {x} failed or is infeasible, no load cases")
+
+        scale = numpy.array([case.get('current',current) / current for case in cases])[:,None]
+        ratio = numpy.array([reference.sigma / case.get('sigma',reference.sigma) for case in cases])[:,None]
+        return {
+            'currents' : scale * self.fields['currents'][None,:],
+            'voltages' : scale * ratio * self.fields['voltages'][None,:],
+            'losses'   : scale**2 * ratio * self.fields['losses'][None,:],
+        }
 
     def nominal(self):
         """
@@ -152,28 +446,268 @@ class Problem(object):
         input_parameters_values = [x[0] for x in self.input_parameters.values()]
         return self(input_parameters_values)
 
-    def __call__(self,x):
-        self.counter += 1
-        logging.info(f"> Computing model with {x} for the {self.counter} time")
-        x = {
-            k : v for k,v in zip(self.input_parameters.keys(),x)
+    @typeguard.typechecked
+    def _evaluate(self,*,input_parameters_values : typing.Dict[str,float], workdir : Path, postpro : typing.Optional[str] = None) -> dict:
+        """
+        Mesh, solve and read the fields, working in the given directory.
+        The post-operation defaults to the one used during the search.
+        A post-operation given explicitly (e.g. field maps) always runs with GETDP.
+        With an archive, the post-operation defaults to that of the field maps, which are read as well.
+        """
+        if self.archive is not None and postpro is None:
+            postpro = self.postpro_maps
+
+        m = {k : float('nan') for k in metrics.METRICS}
+        m.update({'time_mesh' : 0.0, 'time_solve' : 0.0, 'time_read' : 0.0, 'cache_hit' : 0.0})
+
+        with metrics.timer(m,'time_mesh'):
+            number_of_nodes, number_of_elements = self._mesh(input_parameters_values=input_parameters_values,workdir=workdir)
+        if self.solver != "getdp" and postpro is None:
+            with metrics.timer(m,'time_solve'):
+                fields = self._solve_native(input_parameters_values=input_parameters_values,workdir=workdir)
+            m.update(self._solver_metrics)
+            solution = self._solution
+        else:
+            solution = None
+            with metrics.timer(m,'time_solve'):
+                m.update(self._solve(input_parameters_values=input_parameters_values,workdir=workdir,postpro=postpro or self.postpro))
+            with metrics.timer(m,'time_read'):
+                fields = self._read(workdir=workdir)
+        m['peak_rss'] = metrics.peak_rss()
+
+        evaluation = {
+            'fields'             : fields,
+            'number_of_nodes'    : number_of_nodes,
+            'number_of_elements' : number_of_elements,
+            'metrics'            : m,
         }
-        self._mesh (input_parameters_values=x)
-        self._solve(input_parameters_values=x)
-        self.fields = self._read()
+        if self.archive is not None and postpro == self.postpro_maps:
+            evaluation['maps'] = read_maps(workdir,self.outputfiles)
+        if solution is not None:
+            evaluation['solution'] = solution
+        return evaluation
 
-        # Add to database
-        if self.database is None:
-            self.database = pandas.DataFrame(columns=list(self.fields.keys()) + list(x.keys()))
-        data = copy.deepcopy(self.fields)
-        data.update(copy.deepcopy(x))
-        self.database = self.database.append(
-            data,
-            ignore_index=True,
+    @typeguard.typechecked
+    def _cache_key(self,*,input_parameters_values : typing.Dict[str,float]) -> typing.Optional[str]:
+        """
+        Key of an evaluation in the cache (None if there is no cache).
+        """
+        if self.cache is None:
+            return None
+        return self.cache.key(
+            files                   = self._dependencies() + ([Path(self.background_mesh)] if self.background_mesh is not None else []),
+            input_parameters_values = input_parameters_values,
+            mesh_parameters         = self.mesh_parameters,
+            problem                 = self.problem,
+            solver                  = self.solver,
+            postpro                 = self.postpro,
+            outputfiles             = self.outputfiles,
+            morphing                = str(self._morpher.parameters if self.morphing and self._morpher is not None else None),
+            archive                 = str(Path(os.path.abspath(self.archive.path)) if self.archive is not None else None),
         )
 
+    @typeguard.typechecked
+    def _cache_get(self,key : typing.Optional[str]) -> typing.Optional[dict]:
+        """
+        Evaluation stored in the cache under key, flagged as a cache hit (None if not found).
+        Nothing was meshed nor solved for a cache hit, hence its times are NaN (those of the computation stay in the cache).
+        """
+        evaluation = self.cache.get(key) if key is not None else None
+        if evaluation is not None:
+            evaluation['metrics'] = {
+                **{k : float('nan') for k in metrics.METRICS},
+                **{k : v for k,v in evaluation.get('metrics',{}).items() if not k.startswith('time_')},
+                'cache_hit' : 1.0,
+            }
+        return evaluation
+
+    @typeguard.typechecked
+    def _record(self,*,input_parameters_values : typing.Dict[str,float], evaluation : dict):
+        """
+        Keep track of the last evaluation and add it to the database, along with its metrics.
+        The field maps of the evaluation go to the archive, if any, the database holds the index of the run ('archive_index'),
+        which is also kept in the evaluation, such that it is cached with it.
+        The solution of the iterative solver, if any, is kept to start the next solves from (also for evaluations
+        computed in worker processes).
+        The time spent adding to the database (time_record) is only known once the row is appended, it is written
+        to the row afterwards (see ResultStore.update).
+        Returns the row added to the database.
+        """
+        self.fields = evaluation['fields']
+        self.number_of_nodes    = evaluation['number_of_nodes']
+        self.number_of_elements = evaluation['number_of_elements']
+        self.metrics = dict(evaluation['metrics'])
+
+        if 'solution' in evaluation:
+            x = numpy.array([(input_parameters_values[k] - v[1]) / (v[2] - v[1]) for k,v in self.input_parameters.items()])
+            self._solutions = self._solutions[-(self.WARM_STARTS - 1):] + [(x,evaluation['solution'])]
+
+        # Add to database
+        self.metrics['time_record'] = 0.0
+        with metrics.timer(self.metrics,'time_record'):
+            # An evaluation from the cache is already in the archive (unless the archive was recreated since)
+            archived = {}
+            if self.archive is not None and 'maps' in evaluation:
+                index = evaluation.get('archive_index')
+                if index is None or not self.archive.holds(int(index),input_parameters_values):
+                    evaluation['archive_index'] = self.archive.append(parameters=input_parameters_values,**evaluation['maps'])
+                archived['archive_index'] = evaluation['archive_index']
+            row = {
+                **archived,
+                **self.fields,
+                **input_parameters_values,
+                'number_of_nodes'    : self.number_of_nodes,
+                'number_of_elements' : self.number_of_elements,
+                **evaluation['metrics'],
+                'time_record'        : float('nan'),
+            }
+            self.database.append(row)
+        row['time_record'] = self.metrics['time_record']
+        self.database.update(len(self.database) - 1,{'time_record' : row['time_record']})
+
+        if self.metrics_sink is not None:
+            self.metrics_sink({
+                'counter'            : self.counter,
+                **input_parameters_values,
+                'number_of_nodes'    : self.number_of_nodes,
+                'number_of_elements' : self.number_of_elements,
+                **self.metrics,
+            })
+        return row
+
+    def __call__(self,x):
+        """
+        Evaluate a point and return its currents.
+        With a scheduler whose policy is a penalty, returns None if the evaluation failed.
+        With a feasibility check whose policy is a penalty, returns None if the design is infeasible.
+        """
+        self.counter += 1
+        logging.info(f"> Computing model with {x} for the {self.counter} time")
+        x = self._parameters(x)
+        if self.feasibility is not None and self.feasibility.check(x) is not None:
+            return None
+        key = self._cache_key(input_parameters_values=x)
+        evaluation = self._cache_get(key)
+        cached = evaluation is not None
+        if not cached:
+            if self.scheduler is not None:
+                evaluation, = self.scheduler.run(self,[x])
+                if evaluation is None: return None
+            else:
+                evaluation = self._evaluate(input_parameters_values=x,workdir=self.workdir)
+        self._record(input_parameters_values=x,evaluation=evaluation)
+        # Cached once recorded (see _record)
+        if key is not None and not cached: self.cache.put(key,evaluation)
+
         return self.fields['currents']
 
+    @typeguard.typechecked
+    def evaluate_many(self,points : typing.Iterable, workers : typing.Optional[int] = None, stop : typing.Optional[typing.Callable[[numpy.ndarray],bool]] = None, callback : typing.Optional[typing.Callable[[int,dict],None]] = None) -> typing.List[typing.Optional[numpy.ndarray]]:
+        """
+        Evaluate a batch of points on a pool of processes, or with the scheduler if there is one.
+        Each evaluation runs in its own scratch directory, hence the shared files are never overwritten.
+        Once the currents of an evaluation satisfy stop (e.g. the objective is small enough), the evaluations
+        that are no longer needed are cancelled.
+        Each evaluation is added to the database (and the cache) as soon as it is done, in the order of completion,
+        then given to callback along with the index of its point, as the row added to the database (e.g. to stream it).
+        If an evaluation fails in the pool, the others are still recorded and cached before its error is raised.
+        Returns the currents of each point (None for the points that failed or are infeasible under a penalty policy,
+        or were cancelled).
+        """
+        points = [self._parameters(x) for x in points]
+        logging.info(f"> Computing model for {len(points)} points with {workers} workers")
+
+        # Infeasible designs are not evaluated
+        feasible = [True] * len(points)
+        if self.feasibility is not None and points:
+            feasible = self.feasibility.feasible({k : numpy.array([x[k] for x in points]) for k in points[0]}).tolist()
+            for x in [x for x,f in zip(points,feasible) if not f]:
+                self.feasibility.check(x)
+
+        # Only evaluate the points that are not in the cache
+        keys = [self._cache_key(input_parameters_values=x) for x in points]
+        evaluations = [self._cache_get(key) if f else None for key,f in zip(keys,feasible)]
+        missing = [i for i,evaluation in enumerate(evaluations) if evaluation is None and feasible[i]]
+
+        def done(i : int, evaluation : dict):
+            # New evaluations go to the cache once recorded (see _record)
+            evaluations[i] = evaluation
+            self.counter += 1
+            row = self._record(input_parameters_values=points[i],evaluation=evaluation)
+            if keys[i] is not None and i in missing: self.cache.put(keys[i],evaluation)
+            if callback is not None: callback(i,row)
+
+        for i in [i for i,evaluation in enumerate(evaluations) if evaluation is not None]:
+            done(i,evaluations[i])
+
+        # A point of the cache may already satisfy the stop condition
+        if stop is not None and any(evaluation is not None and stop(evaluation['fields']['currents']) for evaluation in evaluations):
+            missing = []
+
+        failure = None
+        if missing and self.scheduler is not None:
+            self.scheduler.run(
+                self,[points[i] for i in missing],
+                stop = (lambda evaluation : stop(evaluation['fields']['currents'])) if stop is not None else None,
+                done = lambda j,evaluation : done(missing[j],evaluation),
+            )
+        elif missing:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(_evaluate_in_scratch,self,points[i]) : i for i in missing}
+                for future in concurrent.futures.as_completed(futures):
+                    if future.exception() is not None: continue
+                    done(futures[future],future.result())
+                    if stop is not None and stop(future.result()['fields']['currents']):
+                        logging.info("> Stop condition met, cancelling the pending evaluations")
+                        for other in futures: other.cancel()
+                        break
+            # Evaluations already running when cancelling are kept, a failure does not discard the others
+            for future,i in futures.items():
+                if future.cancelled() or evaluations[i] is not None: continue
+                try:
+                    done(i,future.result())
+                except Exception as e:
+                    logging.error(f"> Evaluation of {points[i]} failed : {type(e).__name__} {e}")
+                    failure = failure or e
+
+        # Raised once the evaluations that succeeded are saved
+        if failure is not None:
+            raise failure
+
+        return [evaluation['fields']['currents'] if evaluation is not None else None for evaluation in evaluations]
+
+    def maps(self,x) -> dict:
+        """
+        Evaluate a point with the post-operation that writes the field maps (.pos files)
+        next to the .geo file, e.g. for the optimum or for post-processing.sym.geo.
+        The cache and the database are bypassed.
+        """
+        assert self.postpro_maps is not None,"No post-operation for the field maps"
+        x = self._parameters(x)
+        logging.info(f"> Computing field maps with {x}")
+        return self._evaluate(input_parameters_values=x,workdir=self.workdir,postpro=self.postpro_maps)['fields']
+
+    def render_maps(self,runs : typing.Optional[typing.List[int]] = None, **kwargs) -> dict:
+        """
+        Render the field maps of the archived evaluations off-screen, with the same color scales for all of them,
+        next to the database if it is streamed to disk (<database>.maps). See rendering.MapRenderer for the arguments.
+        """
+        assert self.archive is not None,"No archive of the field maps"
+        return MapRenderer(archive=self.archive,store=self.database,**kwargs).render(runs)
+
+    def constraints(self) -> scipy.optimize.NonlinearConstraint:
+        """
+        Geometric feasibility of the design as constraints for scipy.optimize.minimize (SLSQP, COBYLA, trust-constr) :
+        the margins of geometry.Feasibility relative to the ligament, which must be non-negative.
+        Uses the feasibility check of the problem, or the default one for its .geo file.
+        """
+        feasibility = self.feasibility if self.feasibility is not None else geometry.Feasibility(geo_file=self.geo_file)
+        return scipy.optimize.NonlinearConstraint(
+            lambda x : numpy.concatenate(list(feasibility.margins(self._parameters(x)).values())) / feasibility.ligament,
+            0.0,
+            numpy.inf,
+        )
+
     def objective_func_inner(self,*,currents):
         return numpy.abs(numpy.abs(currents[1]) - self.coef_I_inobj * numpy.abs(currents[2]))
 
@@ -183,7 +717,15 @@ class Problem(object):
         F(I1,I2,I3) = abs( abs(I1) - abs(I2) )
         (I1 and I3 are considered equal and we want them to equal I2).
         """
+        if self.feasibility is not None:
+            penalty = self.feasibility.check(self._parameters(x))
+            if penalty is not None:
+                logging.warning(f"> Objective({x}) is infeasible, penalized with {penalty}")
+                return penalty
         currents = self(x)
+        if currents is None:
+            logging.warning(f"> Objective({x}) failed, penalized with {self.scheduler.penalty}")
+            return self.scheduler.penalty
         o = self.objective_func_inner(currents = currents)
         logging.info(f"> Objective({x} => {currents}) = {o}")
         return o
@@ -202,25 +744,88 @@ class Problem(object):
 
         logging.info(f"> Launching optimization with bounds {bounds}")
 
+        # The grid of the brute force DOE is evaluated as a single batch (concurrently, see evaluate_many),
+        # on the same points as scipy.optimize.brute
+        Ns = 4
+        grid = numpy.mgrid[tuple(slice(low,high,complex(Ns)) for low,high in bounds)].reshape(len(bounds),-1).T
+        objectives = {
+            tuple(x) : self.objective_func_inner(currents=currents)
+            for x,currents in zip(grid.tolist(),self.evaluate_many(points=grid))
+            if currents is not None
+        }
+
         # Brute force DOE
         result = scipy.optimize.brute(
-            func    = self.objective_func,
+            func    = lambda x : objectives[tuple(x.tolist())] if tuple(x.tolist()) in objectives else self.objective_func(x),
             ranges  = bounds,
-            Ns      = 4,
+            Ns      = Ns,
             # finish  = None,
         )
         logging.info(f"Global best point found is {result}")
 
-def problem_homework_1(filenamebase : str = "busbar",outputfiles : str = "", coef_I_inobj : float = 1.0, mesh_parameters : dict = {}):
+    def run_surrogate(self,**kwargs) -> dict:
+        """
+        Run the optimization problem with a Gaussian process surrogate fitted on the database.
+        See surrogate.SurrogateOptimizer for the arguments.
+        """
+        logging.info(f"> Launching surrogate optimization with {kwargs}")
+        return SurrogateOptimizer(problem=self,**kwargs).run()
+
+    def run_gradient(self,**kwargs) -> dict:
+        """
+        Run the optimization problem with a gradient-based method within the bounds, the finite differences
+        of each iterate being evaluated as one batch. See gradient.GradientOptimizer for the arguments.
+        """
+        logging.info(f"> Launching gradient optimization with {kwargs}")
+        return GradientOptimizer(problem=self,**kwargs).run()
+
+    def run_multifidelity(self,**kwargs) -> dict:
+        """
+        Run the optimization problem screening candidates on a coarse mesh.
+        See multifidelity.MultiFidelityOptimizer for the arguments.
+        """
+        logging.info(f"> Launching multi-fidelity optimization with {kwargs}")
+        return MultiFidelityOptimizer(problem=self,**kwargs).run()
+
+    def run_refinement(self,**kwargs) -> dict:
+        """
+        Refine the mesh adaptively where the current density changes sharply, see refinement.AdaptiveRefinement for the arguments.
+        Returns the finest level.
+        """
+        logging.info(f"> Launching adaptive refinement with {kwargs}")
+        return AdaptiveRefinement(problem=self,**kwargs).run()
+
+    def run_sweep(self,path : typing.Union[str,Path], **kwargs) -> pandas.DataFrame:
+        """
+        Evaluate a design (by default the grid of run), streamed to and resumed from the directory path.
+        See sweep.Sweep for the arguments.
+        """
+        logging.info(f"> Launching sweep in {path} with {kwargs}")
+        sweep = Sweep(problem=self,path=path,**kwargs)
+        try:
+            return sweep.run()
+        finally:
+            sweep.close()
+
+def _evaluate_in_scratch(problem : Problem, input_parameters_values : typing.Dict[str,float]) -> dict:
+    """
+    Evaluate the problem in a scratch directory (runs in a worker process).
+    """
+    with problem._scratch() as workdir:
+        return problem._evaluate(input_parameters_values=input_parameters_values,workdir=workdir)
+
+def problem_homework_1(filenamebase : str = "busbar",outputfiles : str = "", coef_I_inobj : float = 1.0, mesh_parameters : dict = {}, cache : typing.Optional[EvaluationCache] = None, **kwargs):
     """
     Create problem for homework 1.
+    Additional keyword arguments are forwarded to Problem.
     """
     return Problem(
         geo_file         = HOMEWORK_1 / f"{filenamebase}.geo",
         pro_file         = HOMEWORK_1 / f"{filenamebase}.pro",
         outputfiles      = outputfiles,
         problem          = "EleKin_v",
-        postpro          = "Map",
+        postpro          = "Scalars",
+        postpro_maps     = "Map",
         coef_I_inobj     = coef_I_inobj,
         input_parameters = {
             # Input variable with nominal/low/high range.
@@ -229,58 +834,50 @@ def problem_homework_1(filenamebase : str = "busbar",outputfiles : str = "", coe
             "DO_b" : [0.004  , 0.002 , 0.006 ],
         },
         mesh_parameters  = mesh_parameters,
+        cache            = cache,
+        **kwargs,
     )
 
 if __name__ == "__main__":
 
     DATABASE_FILE = os.path.abspath(__file__).replace('.py','.db')
+    CACHE_DIRECTORY = os.path.abspath(__file__).replace('optimization.py','.cache')
 
     problem = problem_homework_1(
         filenamebase = "busbar.sym",
         outputfiles  = ".sym",
         coef_I_inobj = 2.0,
+        cache        = EvaluationCache(directory=CACHE_DIRECTORY),
     )
 
     # Use this switch to run the optimization only once, and then use the saved database
     if True:
+        shutil.rmtree(DATABASE_FILE,ignore_errors=True)
+        problem.database = ResultStore(path=DATABASE_FILE)
         problem.run()
-        problem.database.to_csv(
-            path_or_buf = DATABASE_FILE,
-        )
+        problem.database.close()
     else:
-        string_to_numpy_array = lambda s : numpy.array([float(x) for x in s.strip('[]').split(' ') if x != ""])
-        problem.database = pandas.read_csv(
-            filepath_or_buffer = DATABASE_FILE,
-            converters = {
-                # Convert from string representation of a list of floats to a numpy array
-                "currents" : string_to_numpy_array,
-                "voltages" : string_to_numpy_array,
-                "losses"   : string_to_numpy_array,
-                "DO_y"     : string_to_numpy_array,
-                "DO_a"     : string_to_numpy_array,
-                "DO_b"     : string_to_numpy_array,
-            }
-        )
+        problem.database = ResultStore(path=DATABASE_FILE)
 
-    # Transform data to numpy array for easier manipulation
-    currents = numpy.stack(problem.database["currents"].to_numpy(),axis=0)
-    voltages = numpy.stack(problem.database["voltages"].to_numpy(),axis=0)
-    losses   = numpy.stack(problem.database["losses"  ].to_numpy(),axis=0)
-    DO_y     = numpy.stack(problem.database["DO_y"    ].to_numpy(),axis=0)
-    DO_a     = numpy.stack(problem.database["DO_a"    ].to_numpy(),axis=0)
-    DO_b     = numpy.stack(problem.database["DO_b"    ].to_numpy(),axis=0)
+    # Views on the database columns
+    currents = problem.database["currents"]
+    voltages = problem.database["voltages"]
+    losses   = problem.database["losses"  ]
+    DO_y     = problem.database["DO_y"    ]
+    DO_a     = problem.database["DO_a"    ]
+    DO_b     = problem.database["DO_b"    ]
 
     # Re-create objective function
     objective = numpy.abs(currents[:,1]- problem.coef_I_inobj * currents[:,2])
 
     # Check sizes
-    assert currents .shape == (problem.database.shape[0],3) and currents .dtype == float
-    assert voltages .shape == (problem.database.shape[0],3) and currents .dtype == float
-    assert losses   .shape == (problem.database.shape[0],1) and losses   .dtype == float
-    assert DO_y     .shape == (problem.database.shape[0],1) and DO_y     .dtype == float
-    assert DO_a     .shape == (problem.database.shape[0],1) and DO_a     .dtype == float
-    assert DO_b     .shape == (problem.database.shape[0],1) and DO_b     .dtype == float
-    assert objective.shape == (problem.database.shape[0], ) and objective.dtype == float
+    assert currents .shape == (len(problem.database),3) and currents .dtype == float
+    assert voltages .shape == (len(problem.database),3) and currents .dtype == float
+    assert losses   .shape == (len(problem.database),1) and losses   .dtype == float
+    assert DO_y     .shape == (len(problem.database),1) and DO_y     .dtype == float
+    assert DO_a     .shape == (len(problem.database),1) and DO_a     .dtype == float
+    assert DO_b     .shape == (len(problem.database),1) and DO_b     .dtype == float
+    assert objective.shape == (len(problem.database), ) and objective.dtype == float
 
     # For the graphs, only use the points that have small objective
     logging.info(
@@ -296,3 +893,6 @@ if __name__ == "__main__":
         objective[-1],
         losses[-1,0],
     ))
+
+    # Field maps of the optimal point for post-processing
+    problem.maps(x=[DO_y[-1,0],DO_a[-1,0],DO_b[-1,0]])
@@ -0,0 +1,175 @@
+import typing
+import logging
+from pathlib import Path
+
+import numpy
+import pandas
+import typeguard
+
+import geometry
+from gmshio import read_pos, write_pos
+
+def _connectivity(triangles : numpy.ndarray) -> typing.Tuple[numpy.ndarray,int]:
+    """
+    Nodes of the triangles (n,3) as indices of their distinct vertices, and the number of nodes.
+    """
+    nodes, connectivity = numpy.unique(triangles.reshape(-1,2),axis=0,return_inverse=True)
+    return connectivity.reshape(-1,3), nodes.shape[0]
+
+def _areas(triangles : numpy.ndarray) -> numpy.ndarray:
+    x, y = triangles[:,:,0], triangles[:,:,1]
+    return 0.5 * numpy.abs((x[:,1] - x[:,0]) * (y[:,2] - y[:,0]) - (x[:,2] - x[:,0]) * (y[:,1] - y[:,0]))
+
+@typeguard.typechecked
+def error_indicator(*, triangles : numpy.ndarray, j : numpy.ndarray) -> typing.Tuple[numpy.ndarray,float]:
+    """
+    Zienkiewicz-Zhu indicator of the error of the current density j (n,2), constant per triangle (P1 potential).
+    The recovered current density is the area-weighted average of j around each node, linear on each triangle;
+    the indicator of a triangle is the L2 norm of the difference, large where j changes sharply.
+    Returns the indicator of each triangle and the L2 norm of j.
+    """
+    connectivity, nodes = _connectivity(triangles)
+    area = _areas(triangles)
+
+    recovered = numpy.stack([
+        numpy.bincount(connectivity.reshape(-1),weights=numpy.repeat(area * j[:,k],3),minlength=nodes) for k in range(2)
+    ],axis=1) / numpy.bincount(connectivity.reshape(-1),weights=numpy.repeat(area,3),minlength=nodes)[:,None]
+
+    # Vertex quadrature of the squared difference on each triangle
+    difference = numpy.sum((recovered[connectivity] - j[:,None,:])**2,axis=2)
+    indicator = numpy.sqrt(area * numpy.mean(difference,axis=1))
+    return indicator, float(numpy.sqrt(numpy.sum(area * numpy.sum(j**2,axis=1))))
+
+@typeguard.typechecked
+def target_sizes(*,
+    triangles : numpy.ndarray,
+    indicator : numpy.ndarray,
+    target : float,
+    min_size : float,
+    max_size : float,
+    max_factor : float = 4.0,
+) -> numpy.ndarray:
+    """
+    Mesh size at the vertices of the triangles (n,3) equidistributing the error : the indicator of a triangle
+    scales with the square of its size, hence the size is multiplied by sqrt(target / indicator), at most
+    by max_factor (and at least by 1 / max_factor), then bounded by min_size and max_size.
+    The size of a node is the smallest of those of its triangles, such that the sizes vary smoothly.
+    """
+    connectivity, nodes = _connectivity(triangles)
+
+    # Edge of the equilateral triangle of the same area
+    size = numpy.sqrt(4.0 / numpy.sqrt(3.0) * _areas(triangles))
+    factor = numpy.sqrt(target / numpy.maximum(indicator,1e-300))
+    size = numpy.clip(size * numpy.clip(factor,1.0 / max_factor,max_factor),min_size,max_size)
+
+    node_size = numpy.full(nodes,numpy.inf)
+    numpy.minimum.at(node_size,connectivity.reshape(-1),numpy.repeat(size,3))
+    return node_size[connectivity]
+
+class AdaptiveRefinement(object):
+    """
+    Adaptive mesh refinement of a problem at a point.
+
+    The problem is meshed with coarse mesh constants, solved with GETDP and its current density is read
+    from the post-operation of the .pro file writing it in the GmshParsed format. The error indicator
+    (see error_indicator) sets the sizes of a background mesh (see target_sizes) : the mesh is refined
+    where the current density changes sharply (ellipse, electrodes) and kept coarse elsewhere.
+    The coarse mesh constants bound the size from above, GMSH remeshes with the smallest of both.
+    Refinement stops when the estimated relative error of j is below the tolerance.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        problem,
+        x : typing.Optional[typing.List[float]] = None,
+        tolerance : float = 0.05,
+        ratio : float = 4.0,
+        min_ratio : float = 0.25,
+        max_factor : float = 4.0,
+        max_levels : int = 6,
+        postpro : str = "Refinement",
+    ):
+        """
+        Initialize refinement:
+            * problem (GETDP solver, its mesh constants or those of mesh.parameters.geo are the reference)
+            * point at which the problem is evaluated (defaults to the nominal point)
+            * estimated relative error (L2) of the current density at which refinement stops
+            * ratio applied to the reference mesh constants for the initial mesh, and largest size
+            * ratio applied to the smallest reference mesh constant for the smallest size
+            * largest refinement (or coarsening) of an element from one level to the next
+            * maximum number of levels
+            * post-operation of the .pro file writing j.refinement{outputfiles}.pos in the GmshParsed format, and the scalars
+        """
+        assert problem.solver == "getdp","Adaptive refinement reads the current density written by GETDP"
+        defaults = {k : problem.mesh_parameters.get(k,v) for k,v in geometry.constants(Path(problem.workdir) / 'mesh.parameters.geo').items()}
+        self.problem = problem.with_mesh_parameters({k : ratio * v for k,v in defaults.items()})
+        self.problem.background_mesh = None
+        # Each level is remeshed with the background mesh, not morphed from the first one
+        self.problem.morphing = False
+        self.background_mesh = Path(problem.workdir) / f"background{problem.outputfiles}.pos"
+
+        self.x = x if x is not None else [v[0] for v in problem.input_parameters.values()]
+        self.tolerance = tolerance
+        self.min_size = min_ratio * min(defaults.values())
+        self.max_size = ratio * max(defaults.values())
+        self.max_factor = max_factor
+        self.max_levels = max_levels
+        self.postpro = postpro
+
+        # Evaluated levels, from the initial mesh to the finest
+        self.levels : typing.List[dict] = []
+
+    def evaluate(self) -> dict:
+        """
+        Mesh (with the current background mesh if any) and solve, then estimate the error.
+        """
+        problem = self.problem
+        x = problem._parameters(self.x)
+        evaluation = problem._evaluate(input_parameters_values=x,workdir=problem.workdir,postpro=self.postpro)
+
+        pos = read_pos(problem.workdir / f"j.refinement{problem.outputfiles}.pos")
+        indicator, norm = error_indicator(triangles=pos['triangles'],j=numpy.mean(pos['values'][:,:,0:2],axis=1))
+        level = {
+            'level'              : len(self.levels),
+            'number_of_nodes'    : evaluation['number_of_nodes'],
+            'number_of_elements' : evaluation['number_of_elements'],
+            'error'              : float(numpy.sqrt(numpy.sum(indicator**2)) / norm),
+            'elapsed'            : evaluation['metrics']['time_mesh'] + evaluation['metrics']['time_solve'] + evaluation['metrics']['time_read'],
+            **evaluation['fields'],
+        }
+        self.levels.append(level)
+        logging.info(f"> Refinement : level {level['level']} with {level['number_of_elements']} elements, estimated error {level['error']}")
+        return {**level,'triangles' : pos['triangles'],'indicator' : indicator,'norm' : norm}
+
+    def run(self) -> dict:
+        """
+        Refine until the estimated error is below the tolerance (or there are max_levels levels).
+        Returns the finest level.
+        """
+        level = self.evaluate()
+        while level['error'] > self.tolerance and len(self.levels) < self.max_levels:
+            sizes = target_sizes(
+                triangles  = level['triangles'],
+                indicator  = level['indicator'],
+                target     = self.tolerance * level['norm'] / numpy.sqrt(level['indicator'].size),
+                min_size   = self.min_size,
+                max_size   = self.max_size,
+                max_factor = self.max_factor,
+            )
+            write_pos(self.background_mesh,name="size",triangles=level['triangles'],values=sizes)
+            self.problem.background_mesh = self.background_mesh
+            level = self.evaluate()
+        return self.levels[-1]
+
+    def to_dataframe(self) -> pandas.DataFrame:
+        """
+        One row per level.
+        """
+        df = pandas.DataFrame([
+            {k : v for k,v in level.items() if k not in ['currents','voltages','losses']} for level in self.levels
+        ])
+        df['current-left'  ] = [level['currents'][1] for level in self.levels]
+        df['current-center'] = [level['currents'][2] for level in self.levels]
+        df['voltage-input' ] = [level['voltages'][0] for level in self.levels]
+        df['losses'        ] = [level['losses'  ][0] for level in self.levels]
+        return df
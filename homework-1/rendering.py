@@ -0,0 +1,160 @@
+import concurrent.futures
+import logging
+import typing
+from pathlib import Path
+
+import numpy
+import typeguard
+import matplotlib.colors
+import matplotlib.tri
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from archive import FieldArchive, FIELDS
+from store import ResultStore
+
+# Title of the views of the fields (the current density is rendered by its magnitude)
+TITLES = {
+    'v'      : "Scalar electric potential [V]",
+    'j'      : "Current density [A/m^2]",
+    'losses' : "Density of losses [W/m^3]",
+}
+
+def _values(run : typing.Dict[str,numpy.ndarray], field : str) -> numpy.ndarray:
+    """
+    Rendered values of a field : at the nodes (v) or on the triangles (magnitude of j, losses).
+    """
+    if field == 'j':
+        return numpy.hypot(run['j'][:,0],run['j'][:,1])
+    return numpy.asarray(run[field],dtype=numpy.float64)
+
+def _render(archive : FieldArchive, i : int, field : str, scale : typing.Tuple[float,float], logarithmic : bool, path : Path, intervals : int, dpi : int) -> Path:
+    """
+    Render the field of run i to path, off-screen (Agg canvas, no display needed).
+    Runs in the worker processes, which read the run from the memory-mapped archive.
+    """
+    run = archive.run(i)
+    values = _values(run,field)
+    triangulation = matplotlib.tri.Triangulation(run['nodes'][:,0],run['nodes'][:,1],run['triangles'])
+
+    # Same discrete intervals for every design
+    low, high = scale
+    if high <= low:
+        high = low + max(abs(low),1.0) * 1e-12
+    levels = numpy.geomspace(low,high,intervals + 1) if logarithmic else numpy.linspace(low,high,intervals + 1)
+    cmap = matplotlib.colormaps['jet']
+    norm = matplotlib.colors.BoundaryNorm(levels,cmap.N)
+
+    figure = Figure(figsize=(8,6))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(1,1,1)
+    if field == 'v':
+        mappable = ax.tricontourf(triangulation,values,levels=levels,cmap=cmap,norm=norm,extend='both')
+    else:
+        mappable = ax.tripcolor(triangulation,facecolors=values,cmap=cmap,norm=norm,edgecolors='none')
+    figure.colorbar(mappable,ax=ax,label=TITLES[field])
+    ax.set_aspect('equal')
+    ax.set_axis_off()
+    ax.set_title(", ".join(f"{name} = {value:.5g}" for name,value in zip(archive.names,run['parameters'])))
+    figure.savefig(path,dpi=dpi,bbox_inches='tight')
+    return path
+
+class MapRenderer(object):
+    """
+    Headless batch rendering of the field maps of the runs of an archive (see archive.FieldArchive),
+    replacing post-processing.sym.geo, which renders one view at a time through the GUI of GMSH.
+
+    Each view (potential, current density, losses) of each run is rendered to <directory>/<field>.<run>.<format>
+    in a process pool, with matplotlib off-screen. The color scale of a field is the same for all the
+    rendered runs (from its smallest to its largest value over these runs), such that designs can be compared.
+    A logarithmic scale (from the smallest positive value) keeps the few hot spots near the holes from
+    compressing the rest of the plate into a single color.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        archive : FieldArchive,
+        directory : typing.Optional[typing.Union[str,Path]] = None,
+        store : typing.Optional[ResultStore] = None,
+        fields : typing.List[str] = FIELDS,
+        logarithmic : typing.List[str] = ['losses'],
+        formats : typing.List[str] = ["png"],
+        intervals : int = 20,
+        dpi : int = 150,
+        workers : typing.Optional[int] = None,
+    ):
+        """
+        Initialize renderer:
+            * archive of the field maps of the runs
+            * directory of the images (defaults to None, i.e. next to the directory of the result store, named after it
+              with a '.maps' suffix, such that removing the store keeps the images, or 'maps' next to the file
+              of the archive if the store is in memory only)
+            * result store of the evaluations (e.g. the database of the problem)
+            * rendered fields among 'v', 'j' and 'losses' (defaults to all)
+            * fields with a logarithmic color scale among 'j' and 'losses' (defaults to the losses)
+            * formats of the images (e.g. 'png', 'svg', 'pdf')
+            * number of intervals of the color scales
+            * resolution of the images [dots per inch]
+            * number of worker processes (defaults to None, i.e. the number of processors)
+        """
+        assert all(field in FIELDS for field in fields),fields
+        assert all(field in ['j','losses'] for field in logarithmic),logarithmic
+        self.archive = archive
+        if directory is None:
+            if store is not None and store.path is not None:
+                directory = store.path.with_name(store.path.name + '.maps')
+            else:
+                directory = archive.path.parent / 'maps'
+        self.directory = Path(directory)
+        self.fields = fields
+        self.logarithmic = logarithmic
+        self.formats = formats
+        self.intervals = intervals
+        self.dpi = dpi
+        self.workers = workers
+
+    @typeguard.typechecked
+    def scales(self,runs : typing.List[int]) -> typing.Dict[str,typing.Tuple[float,float]]:
+        """
+        Color scale (smallest and largest value) of each field over the runs.
+        The smallest value of a logarithmic scale is the smallest positive one.
+        """
+        scales = {}
+        for field in self.fields:
+            values = [_values(self.archive.run(i),field) for i in runs]
+            if field in self.logarithmic:
+                values = [v[v > 0.0] for v in values]
+                values = [v for v in values if v.size] or [numpy.ones(1)]
+            scales[field] = (float(min(numpy.min(v) for v in values)),float(max(numpy.max(v) for v in values)))
+        return scales
+
+    @typeguard.typechecked
+    def render(self,runs : typing.Optional[typing.List[int]] = None) -> typing.Dict[int,typing.Dict[str,typing.List[Path]]]:
+        """
+        Render the views of the runs (defaults to all the runs of the archive) concurrently.
+        Returns the images of each run, per field.
+        """
+        runs = runs if runs is not None else list(range(len(self.archive)))
+        if not runs: return {}
+        self.directory.mkdir(parents=True,exist_ok=True)
+        scales = self.scales(runs)
+        logging.info(f"> Rendering {len(runs)} runs to {self.directory}")
+
+        jobs = [(i,field,self.directory / f"{field}.{i:04d}.{f}") for i in runs for field in self.fields for f in self.formats]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(
+                _render,
+                [self.archive] * len(jobs),
+                [i for i,_,_ in jobs],
+                [field for _,field,_ in jobs],
+                [scales[field] for _,field,_ in jobs],
+                [field in self.logarithmic for _,field,_ in jobs],
+                [path for _,_,path in jobs],
+                [self.intervals] * len(jobs),
+                [self.dpi] * len(jobs),
+            ))
+
+        images = {i : {field : [] for field in self.fields} for i in runs}
+        for i,field,path in jobs:
+            images[i][field].append(path)
+        return images
@@ -0,0 +1,143 @@
+import os
+import typing
+import asyncio
+import logging
+import subprocess
+
+import typeguard
+
+import metrics
+
+class EvaluationFailed(RuntimeError):
+    """
+    An evaluation failed after all its attempts (and the policy is not a penalty).
+    """
+
+class Scheduler(object):
+    """
+    Asynchronous scheduler of the evaluations of a problem.
+
+    GMSH and GETDP run as asyncio subprocesses, at most 'concurrency' evaluations at a time, each in its own
+    scratch directory. A phase exceeding its timeout (see Problem timeouts) is killed. Failed evaluations
+    (timeout, error of an executable, GMSH warning, ...) are retried, then either raise EvaluationFailed
+    or, if a penalty is given, are reported as None and the objective of the point is the penalty.
+    Evaluations still running when they are no longer needed (see evaluate_many) are cancelled and their
+    subprocesses killed.
+    Synchronous code calls run, asynchronous code (e.g. in a running event loop) awaits evaluate_many.
+    """
+
+    # The scheduler runs the GMSH and GETDP executables itself (see Problem)
+    executables = True
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        concurrency : typing.Optional[int] = None,
+        retries : int = 0,
+        penalty : typing.Optional[float] = None,
+    ):
+        """
+        Initialize scheduler:
+            * maximum number of concurrent evaluations (defaults to the number of cores)
+            * number of times a failed evaluation is retried
+            * objective of the points that failed (defaults to None, i.e. failures raise EvaluationFailed)
+        """
+        self.concurrency = concurrency if concurrency is not None else os.cpu_count()
+        self.retries = retries
+        self.penalty = penalty
+
+    @staticmethod
+    async def _run(args : typing.List[str], timeout : typing.Optional[float]) -> str:
+        """
+        Run an executable and return its output, killing it on timeout or cancellation.
+        """
+        process = await asyncio.create_subprocess_exec(*args,stdout=asyncio.subprocess.PIPE)
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(),timeout)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode,args,stdout)
+        return stdout.decode()
+
+    async def _attempt(self,problem,x : typing.Dict[str,float]) -> dict:
+        """
+        Mesh, solve and read the fields of a point in a scratch directory.
+        """
+        m = {k : float('nan') for k in metrics.METRICS}
+        m.update({'time_mesh' : 0.0, 'time_solve' : 0.0, 'time_read' : 0.0, 'cache_hit' : 0.0})
+
+        with problem._scratch() as workdir:
+            with metrics.timer(m,'time_mesh'):
+                output = await self._run(problem._mesh_command(input_parameters_values=x,workdir=workdir),problem.timeouts.get('mesh'))
+                number_of_nodes, number_of_elements = problem._mesh_counts(output=output,input_parameters_values=x)
+            with metrics.timer(m,'time_solve'):
+                output = await self._run(problem._solve_command(input_parameters_values=x,workdir=workdir,postpro=problem.postpro),problem.timeouts.get('solve'))
+                m.update(problem._solve_metrics(output=output,input_parameters_values=x))
+            with metrics.timer(m,'time_read'):
+                fields = problem._read(workdir=workdir)
+        m['peak_rss'] = metrics.peak_rss()
+
+        return {
+            'fields'             : fields,
+            'number_of_nodes'    : number_of_nodes,
+            'number_of_elements' : number_of_elements,
+            'metrics'            : m,
+        }
+
+    async def evaluate(self,problem,x : typing.Dict[str,float], semaphore : asyncio.Semaphore) -> typing.Optional[dict]:
+        """
+        Evaluate a point with the retry and penalty policies (None if it failed under a penalty policy).
+        """
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    return await self._attempt(problem,x)
+                except Exception as e:
+                    logging.warning(f"> Evaluation of {x} failed (attempt {attempt + 1} of {self.retries + 1}) : {type(e).__name__} {e}")
+                    error = e
+        if self.penalty is None:
+            raise EvaluationFailed(f"Evaluation of {x} failed") from error
+        return None
+
+    async def evaluate_many(self,problem,points : typing.List[typing.Dict[str,float]], stop : typing.Optional[typing.Callable[[dict],bool]] = None, done : typing.Optional[typing.Callable[[int,dict],None]] = None) -> typing.List[typing.Optional[dict]]:
+        """
+        Evaluate the points concurrently.
+        Each evaluation is given to done along with the index of its point as soon as it is done.
+        When an evaluation satisfies stop (e.g. the objective is small enough), the others are cancelled.
+        Returns the evaluation of each point (None if it failed under a penalty policy or was cancelled).
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = {asyncio.create_task(self.evaluate(problem,x,semaphore)) : i for i,x in enumerate(points)}
+        evaluations = [None] * len(points)
+
+        pending = set(tasks.keys())
+        try:
+            while pending:
+                finished, pending = await asyncio.wait(pending,return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    evaluations[tasks[task]] = task.result()
+                    if done is not None and evaluations[tasks[task]] is not None:
+                        done(tasks[task],evaluations[tasks[task]])
+                    if stop is not None and evaluations[tasks[task]] is not None and stop(evaluations[tasks[task]]):
+                        logging.info(f"> Scheduler : stop condition met, cancelling {len(pending)} evaluations")
+                        for other in pending: other.cancel()
+                        await asyncio.gather(*pending,return_exceptions=True)
+                        pending = set()
+        finally:
+            for task in pending: task.cancel()
+            await asyncio.gather(*pending,return_exceptions=True)
+        return evaluations
+
+    @typeguard.typechecked
+    def run(self,problem,points : typing.List[typing.Dict[str,float]], stop : typing.Optional[typing.Callable[[dict],bool]] = None, done : typing.Optional[typing.Callable[[int,dict],None]] = None) -> typing.List[typing.Optional[dict]]:
+        """
+        Synchronous entry point of evaluate_many, which runs its own event loop.
+        From a coroutine (e.g. a Jupyter notebook, whose event loop is already running), await evaluate_many instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.evaluate_many(problem,points,stop=stop,done=done))
+        raise RuntimeError("Scheduler.run called from a running event loop, await Scheduler.evaluate_many instead")
@@ -0,0 +1,212 @@
+import logging
+import typing
+
+import numpy
+import scipy.stats.qmc
+import typeguard
+
+@typeguard.typechecked
+def morris_design(*,d : int, trajectories : int, levels : int = 4, seed : int = 0) -> numpy.ndarray:
+    """
+    Morris design in the unit cube, (trajectories * (d+1),d).
+    Each trajectory starts from a random point of a grid of the given number of levels and moves
+    every factor once, in random order and direction, by delta = levels / (2 * (levels - 1)).
+    """
+    assert levels >= 2 and levels % 2 == 0,"The number of levels must be even"
+    rng = numpy.random.default_rng(seed)
+    delta = levels / (2.0 * (levels - 1))
+
+    # Base points (from which +delta stays in the cube), directions and order of the factors
+    base = rng.integers(0,levels // 2,size=(trajectories,d)) / (levels - 1)
+    direction = rng.choice([-1.0,1.0],size=(trajectories,d))
+    rank = numpy.argsort(rng.random(size=(trajectories,d)),axis=1)
+
+    # Step k of a trajectory has moved the factors of rank < k
+    moved = numpy.arange(d + 1)[None,:,None] > rank[:,None,:]
+    start = base + delta * (direction < 0)
+    points = start[:,None,:] + moved * direction[:,None,:] * delta
+    return points.reshape(-1,d)
+
+@typeguard.typechecked
+def morris_indices(points : numpy.ndarray, y : numpy.ndarray, bootstrap : int = 1000, confidence : float = 0.95, seed : int = 0) -> dict:
+    """
+    Elementary effects of a Morris design (unit cube) and its outputs:
+        * 'mu'         : mean elementary effect of each factor
+        * 'mu_star'    : mean absolute elementary effect of each factor (overall influence)
+        * 'sigma'      : standard deviation of the elementary effects (non-linearity and interactions)
+        * 'mu_star_ci' : bootstrap confidence interval of mu_star over the trajectories (d,2)
+        * 'dropped'    : number of trajectories dropped because an output is NaN (e.g. a failed evaluation)
+    Effects are per unit of the normalized factors, i.e. relative to the range of each factor.
+    """
+    d = points.shape[1]
+    X = points.reshape(-1,d + 1,d)
+    Y = y.reshape(-1,d + 1)
+
+    # A NaN output spoils every effect of its trajectory
+    valid = ~numpy.any(numpy.isnan(Y),axis=1)
+    if not numpy.any(valid):
+        raise ValueError("Every trajectory has a NaN output")
+    if not numpy.all(valid):
+        logging.warning(f"> Sensitivity : {numpy.sum(~valid)} of {valid.size} trajectories dropped (NaN outputs)")
+    X, Y = X[valid], Y[valid]
+
+    dX = numpy.diff(X,axis=1)
+    dy = numpy.diff(Y,axis=1)
+
+    # Factor moved at each step of each trajectory
+    moved = numpy.argmax(numpy.abs(dX),axis=2)
+    step = numpy.take_along_axis(dX,moved[:,:,None],axis=2)[:,:,0]
+    effects = numpy.zeros_like(dy)
+    numpy.put_along_axis(effects,moved,dy / step,axis=1)
+
+    rng = numpy.random.default_rng(seed)
+    resampled = numpy.mean(numpy.abs(effects)[rng.integers(0,effects.shape[0],size=(bootstrap,effects.shape[0]))],axis=1)
+    alpha = 100.0 * (1.0 - confidence) / 2.0
+    return {
+        'mu'         : numpy.mean(effects,axis=0),
+        'mu_star'    : numpy.mean(numpy.abs(effects),axis=0),
+        'sigma'      : numpy.std(effects,axis=0,ddof=1) if effects.shape[0] > 1 else numpy.zeros(d),
+        'mu_star_ci' : numpy.percentile(resampled,[alpha,100.0 - alpha],axis=0).T,
+        'dropped'    : int(numpy.sum(~valid)),
+    }
+
+@typeguard.typechecked
+def saltelli_design(*,d : int, n : int, seed : int = 0) -> numpy.ndarray:
+    """
+    Saltelli design in the unit cube, (n * (d+2),d), from a scrambled Sobol sequence of dimension 2d:
+    the n points of matrix A, then those of matrix B, then those of A with column i taken from B (for each i).
+    n should be a power of 2.
+    """
+    AB = scipy.stats.qmc.Sobol(d=2 * d,seed=seed).random(n)
+    A, B = AB[:,:d], AB[:,d:]
+    ABi = numpy.repeat(A[None,:,:],d,axis=0)
+    ABi[numpy.arange(d),:,numpy.arange(d)] = B.T
+    return numpy.vstack([A,B,ABi.reshape(-1,d)])
+
+def _sobol_estimates(fA : numpy.ndarray, fB : numpy.ndarray, fABi : numpy.ndarray) -> typing.Tuple[numpy.ndarray,numpy.ndarray]:
+    """
+    First-order (Saltelli 2010) and total (Jansen) indices, vectorized over the last axis (samples)
+    and broadcast over the leading ones (e.g. bootstrap replicates). fABi has a leading axis of factors.
+    """
+    variance = numpy.var(numpy.concatenate([fA,fB],axis=-1),axis=-1)
+    first = numpy.mean(fB * (fABi - fA),axis=-1) / variance
+    total = 0.5 * numpy.mean((fA - fABi)**2,axis=-1) / variance
+    return first, total
+
+@typeguard.typechecked
+def sobol_indices(y : numpy.ndarray, d : int, bootstrap : int = 1000, confidence : float = 0.95, seed : int = 0) -> dict:
+    """
+    Sobol indices from the outputs of a Saltelli design:
+        * 'first'       : first-order index of each factor
+        * 'total'       : total index of each factor (including all its interactions)
+        * 'interaction' : total minus first-order index of each factor
+        * 'first_ci', 'total_ci', 'interaction_ci' : bootstrap confidence intervals (d,2)
+        * 'dropped'     : number of rows of the design dropped because an output is NaN (e.g. a failed evaluation)
+    """
+    n = y.size // (d + 2)
+    assert y.size == n * (d + 2),"The outputs do not match a Saltelli design"
+    fA, fB, fABi = y[:n], y[n:2 * n], y[2 * n:].reshape(d,n)
+
+    # A NaN output spoils every estimate using its row (of A, B and each ABi)
+    valid = ~(numpy.isnan(fA) | numpy.isnan(fB) | numpy.any(numpy.isnan(fABi),axis=0))
+    if not numpy.any(valid):
+        raise ValueError("Every row of the design has a NaN output")
+    if not numpy.all(valid):
+        logging.warning(f"> Sensitivity : {numpy.sum(~valid)} of {n} rows of the design dropped (NaN outputs)")
+    fA, fB, fABi = fA[valid], fB[valid], fABi[:,valid]
+    n = fA.size
+
+    first, total = _sobol_estimates(fA,fB,fABi)
+
+    # Resample the rows of the design, all bootstrap replicates at once
+    rng = numpy.random.default_rng(seed)
+    rows = rng.integers(0,n,size=(bootstrap,n))
+    first_b, total_b = _sobol_estimates(fA[rows],fB[rows],fABi[:,rows])
+    alpha = 100.0 * (1.0 - confidence) / 2.0
+    ci = lambda samples : numpy.percentile(samples,[alpha,100.0 - alpha],axis=1).T
+
+    return {
+        'first'          : first,
+        'total'          : total,
+        'interaction'    : total - first,
+        'first_ci'       : ci(first_b),
+        'total_ci'       : ci(total_b),
+        'interaction_ci' : ci(total_b - first_b),
+        'dropped'        : int(numpy.sum(~valid)),
+    }
+
+class SensitivityAnalysis(object):
+    """
+    Global sensitivity analysis of a problem (Morris screening or Sobol indices).
+
+    The whole design is evaluated as a single batch with problem.evaluate_many.
+    Points already in the database of the problem (or repeated in the design) are not evaluated again,
+    and evaluate_many itself skips the points in the cache of the problem.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        problem,
+        quantity : typing.Optional[typing.Callable] = None,
+        low : typing.Optional[typing.List[float]] = None,
+        high : typing.Optional[typing.List[float]] = None,
+        workers : typing.Optional[int] = None,
+        seed : int = 0,
+    ):
+        """
+        Initialize analysis:
+            * problem (its database is used and filled)
+            * function of the currents whose sensitivity is analysed (defaults to the objective)
+            * lower bounds of the parameters (defaults to the bounds of the problem)
+            * upper bounds of the parameters (defaults to the bounds of the problem)
+            * number of concurrent evaluations (defaults to the number of cores)
+            * seed of the designs and of the bootstrap
+        """
+        self.problem = problem
+        self.quantity = quantity if quantity is not None else lambda currents : problem.objective_func_inner(currents=currents)
+        self.names = list(problem.input_parameters.keys())
+        self.low  = numpy.array(low  if low  is not None else [v[1] for v in problem.input_parameters.values()])
+        self.high = numpy.array(high if high is not None else [v[2] for v in problem.input_parameters.values()])
+        self.workers = workers
+        self.seed = seed
+
+    def _from_unit(self,u : numpy.ndarray) -> numpy.ndarray:
+        return self.low + u * (self.high - self.low)
+
+    @typeguard.typechecked
+    def evaluate(self,points : numpy.ndarray) -> numpy.ndarray:
+        """
+        Quantity at each point (physical units), evaluating only the points not in the database.
+        """
+        database = self.problem.database
+        known = {}
+        if len(database) > 0:
+            X = numpy.hstack([database[k] for k in self.names])
+            known = {tuple(x) : currents for x,currents in zip(X.tolist(),database['currents'])}
+
+        unique = list(dict.fromkeys(tuple(x) for x in points.tolist()))
+        missing = [x for x in unique if x not in known]
+        logging.info(f"> Sensitivity : {points.shape[0]} points, {len(unique)} unique, {len(missing)} to evaluate")
+        if missing:
+            known.update(zip(missing,self.problem.evaluate_many(points=missing,workers=self.workers)))
+
+        # Failed or infeasible points (see Problem.evaluate_many) are NaN, dropped from the indices
+        return numpy.array([self.quantity(known[tuple(x)]) if known[tuple(x)] is not None else numpy.nan for x in points.tolist()])
+
+    @typeguard.typechecked
+    def morris(self,trajectories : int = 10, levels : int = 4, **kwargs) -> dict:
+        """
+        Morris screening, see morris_indices (keyword arguments are passed to it).
+        """
+        points = morris_design(d=len(self.names),trajectories=trajectories,levels=levels,seed=self.seed)
+        y = self.evaluate(self._from_unit(points))
+        return {'names' : self.names,'evaluations' : y.size,**morris_indices(points,y,seed=self.seed,**kwargs)}
+
+    @typeguard.typechecked
+    def sobol(self,n : int = 64, **kwargs) -> dict:
+        """
+        Sobol indices from a Saltelli design of n * (d+2) points, see sobol_indices (keyword arguments are passed to it).
+        """
+        points = saltelli_design(d=len(self.names),n=n,seed=self.seed)
+        y = self.evaluate(self._from_unit(points))
+        return {'names' : self.names,'evaluations' : y.size,**sobol_indices(y,len(self.names),seed=self.seed,**kwargs)}
@@ -0,0 +1,220 @@
+from pathlib import Path
+import typing
+import re
+import logging
+
+import numpy
+import scipy.sparse
+import scipy.sparse.linalg
+import scipy.spatial
+import typeguard
+
+import gmshio
+import geometry
+from metrics import timer
+
+class NativeSolver(object):
+    """
+    Electrokinetic solver equivalent to the EleKin_v resolution of busbar.pro/busbar.sym.pro,
+    assembled with vectorized NumPy element kernels and solved with scipy.sparse:
+        * P1 nodal scalar potential v on the triangles of the volume region, constant conductivity
+        * each electrode is a single degree of freedom (group of nodes) with a global potential U and current I
+        * the input electrode has an imposed current, the other electrodes an imposed potential
+        * no condition on the other boundaries (homogeneous Neumann)
+
+    The linear system is solved either with a sparse direct factorization, or iteratively with
+    the conjugate gradient preconditioned by the diagonal (Jacobi). The iterative solve
+    may start from the solution of another design (see project).
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        sigma : float,
+        volume : int,
+        electrodes : typing.List[int],
+        currents : typing.Dict[int,float],
+        potentials : typing.Dict[int,float],
+        iterative : bool = False,
+        tolerance : float = 1e-10,
+    ):
+        """
+        Initialize solver:
+            * conductivity of the volume region [S/m]
+            * physical tag of the volume region
+            * physical tags of the electrodes (in the order of the output fields)
+            * imposed current of some electrodes [A]
+            * imposed potential of the other electrodes [V]
+            * solve iteratively (preconditioned conjugate gradient) instead of with a direct factorization
+            * relative residual at which the iterative solve stops
+        """
+        assert set(currents.keys()) | set(potentials.keys()) == set(electrodes)
+        self.sigma = sigma
+        self.volume = volume
+        self.electrodes = electrodes
+        self.currents = currents
+        self.potentials = potentials
+        self.iterative = iterative
+        self.tolerance = tolerance
+
+    @staticmethod
+    @typeguard.typechecked
+    def from_pro(pro_file : typing.Union[str,Path], overrides : typing.Dict[str,float] = {}, **kwargs) -> 'NativeSolver':
+        """
+        Read the conductivity, regions and electrode constraints from the .pro file.
+        Additional keyword arguments are forwarded to NativeSolver.
+        """
+        content = re.sub(r'//[^\n]*','',Path(pro_file).read_text())
+        values = geometry.constants(pro_file,overrides=overrides)
+        evaluate = lambda expression : float(eval(expression,{'__builtins__' : {}},values))
+
+        regions = {name : [int(tag)] for name,tag in re.findall(r'(\w+)\s*=\s*Region\[\s*(\d+)\s*\]',content)}
+        for name,names in re.findall(r'(\w+)\s*=\s*Region\[\s*\{([^}]*)\}\s*\]',content):
+            regions.setdefault(name,sum([regions.get(n.strip(),[]) for n in names.split(',')],[]))
+
+        def constraint(name : str) -> typing.Dict[int,float]:
+            block = re.search(rf'Name\s+{name}\s*;.*?Case\s*\{{(.*?)\}}\s*\}}',content,re.DOTALL).group(1)
+            return {
+                tag : evaluate(value)
+                for region,value in re.findall(r'Region\s+(\w+)\s*;\s*Value\s+([^;]+);',block)
+                for tag in regions[region]
+            }
+
+        (sigma_region, sigma), = re.findall(r'sigma\[\s*(\w+)\s*\]\s*=\s*([^;]+);',content)
+        return NativeSolver(
+            sigma      = evaluate(sigma),
+            volume     = regions['Vol_Ele'][0],
+            electrodes = sorted(regions['Sur_Electrodes_Ele']),
+            currents   = constraint('SetGlobalCurrent'),
+            potentials = constraint('SetGlobalPotential'),
+            **kwargs,
+        )
+
+    @typeguard.typechecked
+    def assemble(self,mesh : gmshio.Mesh) -> typing.Tuple[scipy.sparse.csr_matrix,numpy.ndarray]:
+        """
+        Assemble the stiffness matrix on the degrees of freedom : one per node not on an electrode,
+        then one per electrode (in the order of self.electrodes).
+        Returns the matrix and the degree of freedom of each node (-1 if unused).
+        """
+        triangles = mesh.elements(physical=self.volume,type=2)
+        x, y = mesh.coordinates[triangles,0], mesh.coordinates[triangles,1]
+
+        # Gradients of the barycentric coordinates (times twice the signed area)
+        b = y[:,[1,2,0]] - y[:,[2,0,1]]
+        c = x[:,[2,0,1]] - x[:,[1,2,0]]
+        area2 = (x[:,1] - x[:,0]) * (y[:,2] - y[:,0]) - (x[:,2] - x[:,0]) * (y[:,1] - y[:,0])
+        Ke = self.sigma * (b[:,:,None] * b[:,None,:] + c[:,:,None] * c[:,None,:]) / (2.0 * numpy.abs(area2))[:,None,None]
+
+        # Degrees of freedom
+        dofs = numpy.full(mesh.coordinates.shape[0],-1,dtype=numpy.int64)
+        used = numpy.unique(triangles)
+        electrode_nodes = [mesh.nodes(physical=tag) for tag in self.electrodes]
+        free = numpy.setdiff1d(used,numpy.concatenate(electrode_nodes))
+        dofs[free] = numpy.arange(free.size)
+        for i,nodes in enumerate(electrode_nodes):
+            dofs[nodes] = free.size + i
+        size = free.size + len(self.electrodes)
+
+        rows = numpy.repeat(dofs[triangles],3,axis=1).reshape(-1)
+        cols = numpy.tile(dofs[triangles],(1,3)).reshape(-1)
+        K = scipy.sparse.coo_matrix((Ke.reshape(-1),(rows,cols)),shape=(size,size)).tocsr()
+        return K, dofs
+
+    @typeguard.typechecked
+    def solve(self,*,msh_file : typing.Union[str,Path], initial : typing.Optional[dict] = None) -> dict:
+        """
+        Solve on the mesh and return the currents and voltages of the electrodes
+        and the integrated losses, like the post-operations of the .pro files.
+        An iterative solve starts from the initial solution if given (a previous self.solution, see project).
+        Timings, number of degrees of freedom and of iterations are kept in self.metrics,
+        the nodal solution in self.solution.
+        """
+        self.metrics = {}
+        mesh = gmshio.read_msh(msh_file)
+        with timer(self.metrics,'time_assembly'):
+            K, dofs = self.assemble(mesh)
+        with timer(self.metrics,'time_linear'):
+            x0 = self.project(initial,coordinates=mesh.coordinates,dofs=dofs) if initial is not None else None
+            u = self._solve(K,x0=x0)
+        self.metrics['dofs'] = float(K.shape[0])
+
+        used = dofs >= 0
+        self.solution = {
+            'coordinates' : mesh.coordinates[used,0:2],
+            'potential'   : u[dofs[used]],
+            'voltages'    : u[K.shape[0] - len(self.electrodes):],
+        }
+
+        # Global quantities of the electrodes
+        n = K.shape[0] - len(self.electrodes)
+        reactions = K @ u
+        return {
+            'currents' : reactions[n:],
+            'voltages' : u[n:],
+            'losses'   : numpy.array([u @ reactions]),
+        }
+
+    @typeguard.typechecked
+    def project(self,solution : dict, *, coordinates : numpy.ndarray, dofs : numpy.ndarray) -> numpy.ndarray:
+        """
+        Degrees of freedom interpolated from a solution on another mesh of a nearby design.
+        A mesh with the same nodes (e.g. morphed) is used node by node, otherwise each node takes the
+        potential of the nearest node of the other mesh. Electrodes keep their voltage.
+        """
+        used = dofs >= 0
+        points = coordinates[used,0:2]
+        if points.shape == solution['coordinates'].shape:
+            potential = solution['potential']
+        else:
+            _, nearest = scipy.spatial.cKDTree(solution['coordinates']).query(points)
+            potential = solution['potential'][nearest]
+
+        x0 = numpy.zeros(numpy.max(dofs) + 1)
+        x0[dofs[used]] = potential
+        x0[x0.size - len(self.electrodes):] = solution['voltages']
+        return x0
+
+    def _solve(self,K : scipy.sparse.csr_matrix, x0 : typing.Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        """
+        Solution of the system with the electrode constraints.
+        """
+        n = K.shape[0] - len(self.electrodes)
+        u, f = numpy.zeros(K.shape[0]), numpy.zeros(K.shape[0])
+        fixed = numpy.array([n + i for i,tag in enumerate(self.electrodes) if tag in self.potentials],dtype=numpy.int64)
+        u[fixed] = [self.potentials[tag] for tag in self.electrodes if tag in self.potentials]
+        for i,tag in enumerate(self.electrodes):
+            if tag in self.currents:
+                f[n + i] = self.currents[tag]
+
+        unknown = numpy.setdiff1d(numpy.arange(K.shape[0]),fixed)
+        rhs = f[unknown] - K[unknown][:,fixed] @ u[fixed]
+        A = K[unknown][:,unknown].tocsc()
+        if not self.iterative:
+            u[unknown] = scipy.sparse.linalg.spsolve(A,rhs)
+            return u
+
+        # Jacobi preconditioner : symmetric positive definite like the matrix, as the conjugate gradient needs
+        diagonal = A.diagonal()
+        M = scipy.sparse.linalg.LinearOperator(A.shape,matvec=lambda r : r / diagonal)
+
+        # A projected solution that is further from the solution than zero is not used
+        if x0 is not None and numpy.linalg.norm(A @ x0[unknown] - rhs) >= numpy.linalg.norm(rhs):
+            logging.debug("> Initial solution rejected, starting from zero")
+            x0 = None
+
+        iterations = [0]
+        def count(_): iterations[0] += 1
+        u[unknown], info = scipy.sparse.linalg.cg(
+            A,rhs,
+            x0       = x0[unknown] if x0 is not None else None,
+            rtol     = self.tolerance,
+            atol     = 0.0,
+            maxiter  = A.shape[0],
+            M        = M,
+            callback = count,
+        )
+        self.metrics['iterations'] = float(iterations[0])
+        if info != 0:
+            logging.warning(f"> Conjugate gradient did not converge ({info}), solving directly")
+            u[unknown] = scipy.sparse.linalg.spsolve(A,rhs)
+        return u
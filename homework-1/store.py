@@ -0,0 +1,197 @@
+import os
+import json
+from pathlib import Path
+import typing
+
+import numpy
+import pandas
+import typeguard
+
+class ResultStore(object):
+    """
+    Append-only columnar store of evaluation results.
+
+    Every column is a fixed-width float64 array (one row per evaluation), preallocated
+    and grown geometrically such that appending is amortized O(1).
+    If a path is given, each row is streamed to disk as soon as it is appended:
+        * <path>/columns.json : name and width of each column
+        * <path>/<name>.f64   : raw float64 data of the column, row after row
+    The columns are frozen at the first row : every row must carry the same keys (see append).
+    """
+
+    SCHEMA = 'columns.json'
+
+    @typeguard.typechecked
+    def __init__(self,*,path : typing.Optional[typing.Union[str,Path]] = None, capacity : int = 64, durable : bool = True):
+        """
+        Initialize store:
+            * directory in which the columns are streamed (defaults to None, i.e. in memory only)
+              If it already holds a store, its rows are loaded and new rows are appended to it.
+            * initial number of rows allocated
+            * synchronize each appended row to the disk (os.fsync), such that it survives a crash of the machine,
+              not only of the process (defaults to True)
+        """
+        self.path = Path(path) if path is not None else None
+        self.durable = durable
+
+        self._capacity = capacity
+        self._size     = 0
+        self._widths : typing.Dict[str,int] = {}
+        self._data   : typing.Dict[str,numpy.ndarray] = {}
+        self._files  : typing.Dict[str,typing.BinaryIO] = {}
+
+        if self.path is not None and (self.path / self.SCHEMA).exists():
+            self._load()
+            self._truncate()
+
+    def _load(self):
+        """
+        Load the rows of an existing store on disk.
+        """
+        columns = ResultStore.memmap(path=self.path)
+        self._size = len(next(iter(columns.values()))) if columns else 0
+        self._capacity = max(self._capacity,self._size)
+        for name,values in columns.items():
+            self._allocate(name=name,width=values.shape[1])
+            self._data[name][:self._size] = values
+
+    def _truncate(self):
+        """
+        Drop rows that were only partially written (interrupted run).
+        """
+        for name in self._widths:
+            self._open(name).truncate(self._size * self._widths[name] * 8)
+
+    def _allocate(self,*,name : str, width : int):
+        self._widths[name] = width
+        self._data  [name] = numpy.empty(shape=(self._capacity,width),dtype=numpy.float64)
+
+    def _open(self,name : str) -> typing.BinaryIO:
+        if name not in self._files:
+            self._files[name] = open(self.path / f"{name}.f64",'r+b' if (self.path / f"{name}.f64").exists() else 'w+b')
+            self._files[name].seek(0,os.SEEK_END)
+        return self._files[name]
+
+    def _grow(self):
+        self._capacity *= 2
+        for name,data in self._data.items():
+            self._data[name] = numpy.empty(shape=(self._capacity,data.shape[1]),dtype=numpy.float64)
+            self._data[name][:self._size] = data[:self._size]
+
+    def append(self,row : typing.Dict[str,typing.Any]):
+        """
+        Append a row. The first row defines the columns and their widths, every other row must carry
+        the same keys : a missing or an extra key (or another width) raises ValueError.
+        """
+        row = {k : numpy.asarray(v,dtype=numpy.float64).reshape(-1) for k,v in row.items()}
+
+        if not self._widths:
+            for name,value in row.items():
+                self._allocate(name=name,width=value.size)
+            if self.path is not None:
+                self.path.mkdir(parents=True,exist_ok=True)
+                with open(self.path / self.SCHEMA,'w') as f:
+                    f.write(json.dumps(self._widths))
+                    if self.durable:
+                        f.flush()
+                        os.fsync(f.fileno())
+
+        if set(row.keys()) != set(self._widths.keys()):
+            raise ValueError(f"Row has columns {list(row.keys())} but the store has {list(self._widths.keys())}")
+        for name,value in row.items():
+            if value.size != self._widths[name]:
+                raise ValueError(f"Column {name} has width {self._widths[name]}, got {value.size} values")
+
+        if self._size == self._capacity:
+            self._grow()
+
+        for name,value in row.items():
+            self._data[name][self._size] = value
+            if self.path is not None:
+                f = self._open(name)
+                f.write(value.tobytes())
+                f.flush()
+        if self.path is not None and self.durable:
+            for name in row:
+                os.fsync(self._files[name].fileno())
+        self._size += 1
+
+    def update(self,index : int, values : typing.Dict[str,typing.Any]):
+        """
+        Overwrite some columns of a row already appended (e.g. a value only known once the row is stored).
+        """
+        assert 0 <= index < self._size,index
+        for name,value in values.items():
+            value = numpy.asarray(value,dtype=numpy.float64).reshape(-1)
+            if value.size != self._widths[name]:
+                raise ValueError(f"Column {name} has width {self._widths[name]}, got {value.size} values")
+            self._data[name][index] = value
+            if self.path is not None:
+                f = self._open(name)
+                f.seek(index * self._widths[name] * 8)
+                f.write(value.tobytes())
+                f.flush()
+                f.seek(0,os.SEEK_END)
+                if self.durable:
+                    os.fsync(f.fileno())
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    @property
+    def columns(self) -> typing.List[str]:
+        return list(self._widths.keys())
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory allocated for the columns (including the rows preallocated for growth).
+        """
+        return sum(data.nbytes for data in self._data.values())
+
+    def __contains__(self,name : str):
+        return name in self._widths
+
+    def __getitem__(self,name : str) -> numpy.ndarray:
+        """
+        View (no copy) of the rows of a column, with shape (rows,width).
+        """
+        return self._data[name][:self._size]
+
+    def to_dataframe(self) -> pandas.DataFrame:
+        """
+        Copy to a dataframe, columns wider than 1 are split as name[0], name[1], ...
+        """
+        df = {}
+        for name,width in self._widths.items():
+            if width == 1:
+                df[name] = self[name][:,0]
+            else:
+                for i in range(width):
+                    df[f"{name}[{i}]"] = self[name][:,i]
+        return pandas.DataFrame(df)
+
+    @staticmethod
+    @typeguard.typechecked
+    def memmap(*,path : typing.Union[str,Path]) -> typing.Dict[str,numpy.ndarray]:
+        """
+        Memory-map the columns of a store on disk (e.g. while it is being written by a run).
+        Only the rows written to every column are exposed.
+        """
+        path = Path(path)
+        widths = json.loads((path / ResultStore.SCHEMA).read_text())
+        rows = min(
+            [os.path.getsize(path / f"{name}.f64") // (8 * width) if (path / f"{name}.f64").exists() else 0 for name,width in widths.items()],
+            default = 0,
+        )
+        if rows == 0:
+            return {name : numpy.empty(shape=(0,width),dtype=numpy.float64) for name,width in widths.items()}
+        return {
+            name : numpy.memmap(path / f"{name}.f64",dtype=numpy.float64,mode='r',shape=(rows,width))
+            for name,width in widths.items()
+        }
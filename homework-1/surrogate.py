@@ -0,0 +1,245 @@
+import logging
+import typing
+
+import numpy
+import scipy.linalg
+import scipy.optimize
+import scipy.stats
+import scipy.stats.qmc
+import typeguard
+
+class GaussianProcess(object):
+    """
+    Gaussian process regression with an anisotropic squared-exponential (RBF) kernel.
+    Inputs are expected in the unit cube, outputs are standardized internally.
+    The signal variance is profiled out of the likelihood, the length scales and the
+    (relative) noise are fitted by maximizing the likelihood.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,restarts : int = 4, seed : int = 0):
+        """
+        Initialize Gaussian process:
+            * number of random restarts of the likelihood maximization
+            * seed of the random restarts
+        """
+        self.restarts = restarts
+        self.rng = numpy.random.default_rng(seed)
+
+    @staticmethod
+    def _kernel(A : numpy.ndarray, B : numpy.ndarray, lengthscales : numpy.ndarray) -> numpy.ndarray:
+        d = (A[:,None,:] - B[None,:,:]) / lengthscales
+        return numpy.exp(-0.5 * numpy.sum(d**2,axis=-1))
+
+    def _factorize(self,theta : numpy.ndarray):
+        """
+        Factorize the kernel matrix for hyperparameters theta = [log(lengthscales), log(noise)].
+        Returns the Cholesky factor, the weights and the signal variance.
+        """
+        lengthscales, noise = numpy.exp(theta[:-1]), numpy.exp(theta[-1])
+        K = self._kernel(self.X,self.X,lengthscales) + (noise + 1e-10) * numpy.eye(self.X.shape[0])
+        L = scipy.linalg.cho_factor(K,lower=True)
+        alpha = scipy.linalg.cho_solve(L,self.y)
+        variance = max(float(self.y @ alpha) / self.X.shape[0],1e-300)
+        return L, alpha, variance
+
+    def _nll(self,theta : numpy.ndarray) -> float:
+        """
+        Negative concentrated log-likelihood.
+        """
+        try:
+            L, _, variance = self._factorize(theta)
+        except numpy.linalg.LinAlgError:
+            return 1e300
+        return 0.5 * self.X.shape[0] * numpy.log(variance) + numpy.sum(numpy.log(numpy.diag(L[0])))
+
+    @typeguard.typechecked
+    def fit(self,X : numpy.ndarray, y : numpy.ndarray, optimize : bool = True):
+        """
+        Fit to the points X (n,d) with values y (n,).
+        If optimize is False, the hyperparameters of the previous fit are kept.
+        """
+        self.X = X
+        self.y_mean, self.y_std = y.mean(), (y.std() if y.std() > 0 else 1.0)
+        self.y = (y - self.y_mean) / self.y_std
+
+        if optimize or not hasattr(self,'theta'):
+            bounds = [(numpy.log(1e-2),numpy.log(1e1))] * X.shape[1] + [(numpy.log(1e-10),numpy.log(1e-1))]
+            starts = [numpy.array([numpy.log(0.3)] * X.shape[1] + [numpy.log(1e-6)])]
+            starts += [numpy.array([self.rng.uniform(*b) for b in bounds]) for _ in range(self.restarts)]
+            best = min(
+                [scipy.optimize.minimize(self._nll,x0=x0,method='L-BFGS-B',bounds=bounds) for x0 in starts],
+                key = lambda r : r.fun,
+            )
+            self.theta = best.x
+        self.L, self.alpha, self.variance = self._factorize(self.theta)
+        return self
+
+    @typeguard.typechecked
+    def predict(self,X : numpy.ndarray) -> typing.Tuple[numpy.ndarray,numpy.ndarray]:
+        """
+        Posterior mean and standard deviation at the points X (m,d).
+        """
+        k = self._kernel(X,self.X,numpy.exp(self.theta[:-1]))
+        mean = k @ self.alpha
+        v = scipy.linalg.solve_triangular(self.L[0],k.T,lower=True)
+        var = self.variance * numpy.clip(1.0 - numpy.sum(v**2,axis=0),1e-12,None)
+        return self.y_mean + self.y_std * mean, self.y_std * numpy.sqrt(var)
+
+def expected_improvement_abs(mean : numpy.ndarray, std : numpy.ndarray, best : float) -> numpy.ndarray:
+    """
+    Expected improvement E[max(best - |G|,0)] of the absolute value of G ~ N(mean,std^2),
+    i.e. for minimizing |g| when the signed quantity g is modelled.
+    """
+    def partial(a,b):
+        # E[G 1(a<G<b)] and P(a<G<b)
+        alpha, beta = (a - mean) / std, (b - mean) / std
+        prob = scipy.stats.norm.cdf(beta) - scipy.stats.norm.cdf(alpha)
+        return mean * prob + std * (scipy.stats.norm.pdf(alpha) - scipy.stats.norm.pdf(beta)), prob
+    positive, p_positive = partial(0.0,best)
+    negative, p_negative = partial(-best,0.0)
+    return numpy.clip(best * (p_positive + p_negative) - (positive - negative),0.0,None)
+
+class SurrogateOptimizer(object):
+    """
+    Surrogate-based optimization driven by the database of a problem.
+
+    A Gaussian process is fitted to the signed current imbalance |I1| - coef * |I2| of every
+    point in the database (which is smooth, unlike its absolute value, the objective).
+    New points maximize the expected improvement of the objective. Batches are proposed
+    with the 'kriging believer' heuristic and evaluated concurrently.
+    """
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        problem,
+        max_evaluations : int = 30,
+        batch_size : int = 4,
+        initial_points : typing.Optional[int] = None,
+        tolerance : float = 1e-3,
+        candidates : int = 1024,
+        workers : typing.Optional[int] = None,
+        seed : int = 0,
+    ):
+        """
+        Initialize optimizer:
+            * problem to optimize (its database is used and filled)
+            * maximum number of new evaluations
+            * number of points proposed at each iteration
+            * number of points of the initial Latin hypercube if the database is smaller (defaults to 2*d+1)
+            * stop when the expected improvement falls below this tolerance [A]
+            * number of random candidates on which the acquisition is screened
+            * number of concurrent evaluations (defaults to the number of cores)
+            * seed of the random generators
+        """
+        self.problem = problem
+        self.max_evaluations = max_evaluations
+        self.batch_size = batch_size
+        self.initial_points = initial_points if initial_points is not None else 2 * len(problem.input_parameters) + 1
+        self.tolerance = tolerance
+        self.candidates = candidates
+        self.workers = workers
+        self.seed = seed
+
+        self.low  = numpy.array([v[1] for v in problem.input_parameters.values()])
+        self.high = numpy.array([v[2] for v in problem.input_parameters.values()])
+
+        self.gp = GaussianProcess(seed=seed)
+
+    def _to_unit(self,x : numpy.ndarray) -> numpy.ndarray:
+        return (x - self.low) / (self.high - self.low)
+
+    def _from_unit(self,u : numpy.ndarray) -> numpy.ndarray:
+        return self.low + u * (self.high - self.low)
+
+    def _data(self) -> typing.Tuple[numpy.ndarray,numpy.ndarray]:
+        """
+        Points (unit cube) and signed imbalance of the database.
+        """
+        database = self.problem.database
+        if len(database) == 0:
+            return numpy.empty((0,len(self.low))), numpy.empty((0,))
+        X = numpy.hstack([database[k] for k in self.problem.input_parameters.keys()])
+        currents = database['currents']
+        g = numpy.abs(currents[:,1]) - self.problem.coef_I_inobj * numpy.abs(currents[:,2])
+
+        # Only keep the points inside the bounds
+        inside = numpy.all((X >= self.low) & (X <= self.high),axis=1)
+        return self._to_unit(X[inside]), g[inside]
+
+    def _propose(self,X : numpy.ndarray, g : numpy.ndarray, rng : numpy.random.Generator) -> typing.Tuple[numpy.ndarray,float]:
+        """
+        Propose a batch of points (unit cube), returns them with the largest expected improvement.
+        """
+        X, g = X.copy(), g.copy()
+        batch, ei_max = [], 0.0
+        for i in range(self.batch_size):
+            # Kriging believer : previously proposed points are added with their predicted value
+            self.gp.fit(X,g,optimize=(i == 0))
+            best = float(numpy.min(numpy.abs(g)))
+
+            def negative_ei(u):
+                mean, std = self.gp.predict(numpy.atleast_2d(u))
+                return -expected_improvement_abs(mean,std,best)[0]
+
+            # Screen random candidates, then polish the most promising ones
+            candidates = rng.uniform(size=(self.candidates,X.shape[1]))
+            mean, std = self.gp.predict(candidates)
+            ei = expected_improvement_abs(mean,std,best)
+            starts = candidates[numpy.argsort(ei)[-3:]]
+            results = [scipy.optimize.minimize(negative_ei,x0=x0,method='L-BFGS-B',bounds=[(0.0,1.0)] * X.shape[1]) for x0 in starts]
+            result = min(results,key=lambda r : r.fun)
+
+            if i == 0: ei_max = -float(result.fun)
+            batch.append(result.x)
+            X = numpy.vstack([X,result.x])
+            g = numpy.append(g,self.gp.predict(numpy.atleast_2d(result.x))[0])
+        return numpy.array(batch), ei_max
+
+    def run(self) -> dict:
+        """
+        Run the optimization.
+        Returns the best evaluated point, its objective and the surrogate mean/standard deviation
+        of the objective there, along with the number of evaluations.
+        """
+        rng = numpy.random.default_rng(self.seed)
+        evaluations = 0
+
+        # Initial design if the database is too small
+        X, g = self._data()
+        if X.shape[0] < self.initial_points:
+            lhs = scipy.stats.qmc.LatinHypercube(d=len(self.low),seed=self.seed).random(n=self.initial_points - X.shape[0])
+            logging.info(f"> Surrogate : initial design of {lhs.shape[0]} points")
+            self.problem.evaluate_many(points=self._from_unit(lhs),workers=self.workers)
+            evaluations += lhs.shape[0]
+
+        while evaluations < self.max_evaluations:
+            X, g = self._data()
+            batch, ei_max = self._propose(X,g,rng)
+            logging.info(f"> Surrogate : best objective {numpy.min(numpy.abs(g))} and expected improvement {ei_max}")
+            if ei_max < self.tolerance:
+                break
+            batch = batch[:self.max_evaluations - evaluations]
+            # No improvement is expected beyond a point whose objective is below the tolerance,
+            # the rest of the batch is cancelled
+            converged = lambda currents : self.problem.objective_func_inner(currents=currents) < self.tolerance
+            currents = self.problem.evaluate_many(points=self._from_unit(batch),workers=self.workers,stop=converged)
+            if any(c is not None and converged(c) for c in currents):
+                evaluations += sum(c is not None for c in currents)
+                break
+            evaluations += batch.shape[0]
+
+        # Best point and its uncertainty according to the surrogate
+        X, g = self._data()
+        self.gp.fit(X,g)
+        best = int(numpy.argmin(numpy.abs(g)))
+        mean, std = self.gp.predict(X[best:best + 1])
+        result = {
+            'x'           : self._from_unit(X[best]),
+            'objective'   : float(numpy.abs(g[best])),
+            'model_mean'  : float(numpy.abs(mean[0])),
+            'model_std'   : float(std[0]),
+            'evaluations' : evaluations,
+        }
+        logging.info(f"> Surrogate : best point is {result}")
+        return result
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import typing
+from pathlib import Path
+
+import numpy
+import pandas
+import scipy.stats.qmc
+import typeguard
+
+from store import ResultStore
+
+# Kinds of designs
+DESIGNS = ["factorial","lhs","sobol"]
+
+@typeguard.typechecked
+def design(*, kind : str, size : int, low : typing.List[float], high : typing.List[float], seed : int = 0) -> numpy.ndarray:
+    """
+    Points of a design over the box [low,high], (points,parameters):
+        * "factorial" : full factorial with size levels per parameter (size^d points, in the order of scipy.optimize.brute)
+        * "lhs"       : Latin hypercube of size points
+        * "sobol"     : scrambled Sobol sequence of size points (size should be a power of 2)
+    """
+    assert kind in DESIGNS,kind
+    if kind == "factorial":
+        grid = numpy.meshgrid(*[numpy.linspace(0.0,1.0,size)] * len(low),indexing='ij')
+        unit = numpy.stack([g.reshape(-1) for g in grid],axis=1)
+    elif kind == "lhs":
+        unit = scipy.stats.qmc.LatinHypercube(d=len(low),seed=seed).random(n=size)
+    else:
+        unit = scipy.stats.qmc.Sobol(d=len(low),seed=seed).random(n=size)
+    return numpy.array(low) + unit * (numpy.array(high) - numpy.array(low))
+
+class Sweep(object):
+    """
+    Resumable sweep of a problem over a design.
+
+    Points are evaluated in batches (see Problem.evaluate_many), each completed point is streamed to a
+    ResultStore on disk, with the index of the point in the design ('design_index'). The description of
+    the design is kept next to it (sweep.json). Running the sweep again with the same directory resumes it:
+    the points already in the store are skipped. Failed points (see scheduler.Scheduler) are not stored,
+    hence they are attempted again on resume.
+    While the sweep runs, partial results can be read with ResultStore.memmap.
+    """
+
+    DESCRIPTION = 'sweep.json'
+
+    @typeguard.typechecked
+    def __init__(self,*,
+        problem,
+        path : typing.Union[str,Path],
+        kind : str = "factorial",
+        size : int = 4,
+        seed : int = 0,
+        batch_size : typing.Optional[int] = None,
+        workers : typing.Optional[int] = None,
+    ):
+        """
+        Initialize sweep:
+            * problem to evaluate
+            * directory of the results (created if needed)
+            * kind of design (see design)
+            * levels per parameter (factorial) or number of points (lhs, sobol)
+            * seed of the design
+            * number of points evaluated (and stored) together (defaults to the number of workers)
+            * number of concurrent evaluations (defaults to the number of cores)
+        """
+        self.problem = problem
+        self.path = Path(path)
+        self.workers = workers
+        self.batch_size = batch_size if batch_size is not None else (workers if workers is not None else os.cpu_count())
+
+        self.description = {
+            'kind'       : kind,
+            'size'       : size,
+            'seed'       : seed,
+            'parameters' : list(problem.input_parameters.keys()),
+            'low'        : [float(v[1]) for v in problem.input_parameters.values()],
+            'high'       : [float(v[2]) for v in problem.input_parameters.values()],
+        }
+        self.points = design(kind=kind,size=size,low=self.description['low'],high=self.description['high'],seed=seed)
+
+        self.path.mkdir(parents=True,exist_ok=True)
+        description = self.path / self.DESCRIPTION
+        if description.exists():
+            existing = json.loads(description.read_text())
+            if existing != self.description:
+                raise ValueError(f"{self.path} holds another sweep : {existing}")
+        else:
+            description.write_text(json.dumps(self.description,indent=4))
+
+        self.store = ResultStore(path=self.path)
+
+    def done(self) -> typing.Set[int]:
+        """
+        Indices of the points of the design already in the store.
+        """
+        if 'design_index' not in self.store:
+            return set()
+        return set(self.store['design_index'][:,0].astype(int).tolist())
+
+    def run(self) -> pandas.DataFrame:
+        """
+        Evaluate the points that are not done yet.
+        Returns all the results of the sweep, one row per point.
+        """
+        done = self.done()
+        remaining = [i for i in range(self.points.shape[0]) if i not in done]
+        logging.info(f"> Sweep : {len(done)} of {self.points.shape[0]} points done, {len(remaining)} remaining")
+
+        for start in range(0,len(remaining),self.batch_size):
+            batch = remaining[start:start + self.batch_size]
+            # Each point is stored as soon as it is done, with the row added to the database of the problem
+            self.problem.evaluate_many(
+                points   = self.points[batch],
+                workers  = self.workers,
+                callback = lambda j,row : self.store.append({'design_index' : batch[j],**row}),
+            )
+            logging.info(f"> Sweep : {len(self.store)} of {self.points.shape[0]} points done")
+
+        return self.store.to_dataframe()
+
+    def close(self):
+        self.store.close()
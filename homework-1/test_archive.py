@@ -0,0 +1,140 @@
+import numpy
+import pytest
+
+import metrics
+import optimization
+from cache import EvaluationCache
+from gmshio import write_pos
+from archive import FieldArchive, read_maps
+from test_refinement import structured
+
+NAMES = ["DO_y","DO_a","DO_b"]
+
+def maps(slope : float, n : int = 8) -> dict:
+    """
+    Field maps of the potential v = slope * x on the unit square (sigma = 1), as in read_maps.
+    """
+    triangles = structured(n)
+    nodes, connectivity = numpy.unique(triangles.reshape(-1,2),axis=0,return_inverse=True)
+    return {
+        'nodes'     : nodes,
+        'triangles' : connectivity.reshape(-1,3),
+        'v'         : slope * nodes[:,0],
+        'j'         : numpy.tile([-slope,0.0],(triangles.shape[0],1)),
+        'losses'    : numpy.full(triangles.shape[0],slope**2),
+    }
+
+def test_read_maps(tmp_path):
+    triangles = structured(4)
+    x = triangles[:,:,0]
+    write_pos(tmp_path / 'v.sym.pos',name="v",triangles=triangles,values=2.0 * x)
+    write_pos(tmp_path / 'losses.sym.pos',name="losses",triangles=triangles,values=numpy.full_like(x,4.0))
+    with open(tmp_path / 'j.sym.pos','w') as f:
+        f.write('View "j" {\n')
+        for t in triangles:
+            f.write(f"VT({','.join(f'{c},{d},0' for c,d in t)}){{{','.join(['-2,0,0'] * 3)}}};\n")
+        f.write('};\n')
+
+    fields = read_maps(tmp_path,".sym")
+    assert fields['nodes'].shape == (25,2) and fields['triangles'].shape == (32,3)
+    assert numpy.allclose(fields['v'],2.0 * fields['nodes'][:,0])
+    assert numpy.allclose(fields['j'],[-2.0,0.0]) and numpy.allclose(fields['losses'],4.0)
+
+def test_archive(tmp_path):
+    archive = FieldArchive(path=tmp_path / 'fields.bin',names=NAMES)
+    for i,slope in enumerate([1.0,2.0,3.0]):
+        assert archive.append(parameters={'DO_y' : 0.03 + 0.001 * i,'DO_a' : 0.0075,'DO_b' : 0.004},**maps(slope,n=8 + i)) == i
+
+    # Reopened from the file, runs are views on it
+    archive = FieldArchive(path=tmp_path / 'fields.bin',names=NAMES)
+    assert len(archive) == 3
+    run = archive.run(1)
+    assert isinstance(run['v'].base,numpy.memmap) or isinstance(run['v'],numpy.memmap)
+    assert run['v'].dtype == numpy.float32 and run['nodes'].dtype == numpy.float64 and run['triangles'].dtype == numpy.int32
+    expected = maps(2.0,n=9)
+    for name,values in expected.items():
+        assert numpy.allclose(run[name],values)
+    assert numpy.allclose(archive.parameters[:,0],[0.03,0.031,0.032])
+
+    # Comparisons across designs
+    assert numpy.allclose(archive.hot_spots()['j'],[1.0,2.0,3.0])
+    assert numpy.allclose(archive.losses(),[1.0,4.0,9.0])
+    assert numpy.allclose(archive.difference(0,1,'j'),[-1.0,0.0])
+    # Nearest node of the other mesh, within half a diagonal of its cells
+    assert numpy.allclose(archive.difference(0,2,'v'),2.0 * archive.run(0)['nodes'][:,0],atol=3.0 * numpy.sqrt(2.0) / 20.0)
+    assert archive.nearest(0) == 1 and archive.nearest(2) == 1
+
+def test_archive_interrupted(tmp_path):
+    """
+    A run only partially written is dropped, and overwritten by the next one.
+    """
+    archive = FieldArchive(path=tmp_path / 'fields.bin',names=NAMES,dtype='float64')
+    archive.append(parameters=dict(zip(NAMES,[0.03,0.0075,0.004])),**maps(1.0))
+    size = (tmp_path / 'fields.bin').stat().st_size
+    archive.append(parameters=dict(zip(NAMES,[0.031,0.0075,0.004])),**maps(2.0))
+    with open(tmp_path / 'fields.bin','r+b') as f:
+        f.truncate(size + 100)
+
+    archive = FieldArchive(path=tmp_path / 'fields.bin',names=NAMES,dtype='float64')
+    assert len(archive) == 1 and (tmp_path / 'fields.bin').stat().st_size == size
+    archive.append(parameters=dict(zip(NAMES,[0.032,0.0075,0.004])),**maps(3.0))
+    assert len(FieldArchive(path=tmp_path / 'fields.bin',names=NAMES,dtype='float64')) == 2
+    assert numpy.allclose(archive.run(1)['losses'],9.0)
+
+    with pytest.raises(ValueError):
+        FieldArchive(path=tmp_path / 'fields.bin',names=NAMES)
+
+def test_archive_read_only(tmp_path):
+    """
+    A reader neither truncates the run being appended nor appends.
+    """
+    archive = FieldArchive(path=tmp_path / 'fields.bin',names=NAMES)
+    archive.append(parameters=dict(zip(NAMES,[0.03,0.0075,0.004])),**maps(1.0))
+    with open(tmp_path / 'fields.bin','ab') as f:
+        f.write(b'RUN1' + b'\0' * 100)
+    size = (tmp_path / 'fields.bin').stat().st_size
+
+    reader = FieldArchive(path=tmp_path / 'fields.bin',names=NAMES,mode='r')
+    assert len(reader) == 1 and (tmp_path / 'fields.bin').stat().st_size == size
+    assert numpy.allclose(reader.run(0)['losses'],1.0)
+    with pytest.raises(AssertionError):
+        reader.append(parameters=dict(zip(NAMES,[0.03,0.0075,0.004])),**maps(1.0))
+    with pytest.raises(FileNotFoundError):
+        FieldArchive(path=tmp_path / 'missing.bin',names=NAMES,mode='r')
+
+def test_archive_cache_hits(tmp_path):
+    """
+    An evaluation served by the cache is not archived twice.
+    """
+    archive = FieldArchive(path=tmp_path / 'fields.bin',names=NAMES)
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, archive = archive, cache = EvaluationCache(directory=tmp_path / 'cache'))
+    x = dict(zip(NAMES,[0.03,0.0075,0.004]))
+    evaluation = {
+        'fields'             : {'currents' : numpy.ones(3),'voltages' : numpy.zeros(3),'losses' : numpy.ones(1)},
+        'number_of_nodes'    : 81,
+        'number_of_elements' : 128,
+        'metrics'            : {**{k : float('nan') for k in metrics.METRICS},'cache_hit' : 0.0},
+        'maps'               : maps(1.0),
+    }
+    problem._record(input_parameters_values=x,evaluation=evaluation)
+    problem.cache.put('key',evaluation)
+    problem._record(input_parameters_values=x,evaluation=problem._cache_get('key'))
+    assert len(archive) == 1
+    assert numpy.array_equal(problem.database['archive_index'][:,0],[0,0])
+
+    # Unless the archive does not hold it anymore
+    (tmp_path / 'fields.bin').unlink()
+    problem.archive = FieldArchive(path=tmp_path / 'fields.bin',names=NAMES)
+    problem.archive.append(parameters=dict(zip(NAMES,[0.031,0.0075,0.004])),**maps(2.0))
+    problem._record(input_parameters_values=x,evaluation=problem._cache_get('key'))
+    assert len(problem.archive) == 2 and problem.database['archive_index'][-1,0] == 1
+
+def test_cache_maps(tmp_path):
+    """
+    Field maps of an evaluation go through the cache as arrays.
+    """
+    cache = EvaluationCache(directory=tmp_path)
+    cache.put('key',{'fields' : {'currents' : numpy.ones(3)},'metrics' : {'time_mesh' : 1.0},'maps' : maps(1.0)})
+    evaluation = cache.get('key')
+    assert numpy.array_equal(evaluation['maps']['triangles'],maps(1.0)['triangles'])
+    assert evaluation['metrics']['time_mesh'] == 1.0
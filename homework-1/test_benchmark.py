@@ -0,0 +1,22 @@
+import numpy
+
+import benchmark
+
+def test_benchmark_database_growth():
+    growth = benchmark.database_growth(rows=1000,checkpoints=4)
+    assert [g['rows'] for g in growth['growth']] == [250,500,750,1000]
+    assert growth['bytes_per_row'] == 8 * (4 + 4 + 1 + 3 + 2 + len(benchmark.metrics.METRICS))
+
+    # Geometric growth : memory is within a factor 2 of the rows stored
+    for g in growth['growth']:
+        assert g['rows'] * growth['bytes_per_row'] <= g['bytes'] <= 2 * g['rows'] * growth['bytes_per_row']
+
+def test_benchmark_compare():
+    assert benchmark.percentiles([1.0,2.0,float('nan'),3.0])['p50'] == 2.0
+
+    before = {'environment' : {'cpu_count' : 4}, 'throughput' : {'evaluations_per_second' : 2.0}, 'mesh_scaling' : [{'ratio' : 1.0, 'elapsed' : {'p50' : 4.0}}]}
+    after  = {'environment' : {'cpu_count' : 8}, 'throughput' : {'evaluations_per_second' : 3.0}, 'mesh_scaling' : [{'ratio' : 1.0, 'elapsed' : {'p50' : 2.0}}]}
+    changes = {k : change for k,_,_,change in benchmark.compare(before,after)}
+    assert numpy.isclose(changes['throughput.evaluations_per_second'],0.5)
+    assert numpy.isclose(changes['mesh_scaling[ratio=1.0].elapsed.p50'],-0.5)
+    assert not any(k.startswith('environment') for k in changes)
@@ -0,0 +1,107 @@
+import time
+
+import numpy
+
+from cache import EvaluationCache
+
+def evaluation(value : float) -> dict:
+    return {
+        'fields' : {
+            'currents' : numpy.array([value, -value / 2.0, -value / 2.0]),
+            'voltages' : numpy.array([value * 1e-3, 0.0, 0.0]),
+            'losses'   : numpy.array([value ** 2]),
+        },
+        'number_of_nodes'    : 10,
+        'number_of_elements' : 20,
+        'metrics'            : {'time_mesh' : 0.5, 'time_solve' : 1.5},
+    }
+
+def test_cache_key(tmp_path):
+    """
+    The key depends on the files content and on the parameter values at full precision.
+    """
+    file = tmp_path / 'busbar.geo'
+    file.write_text('DO_y = 0.035;')
+
+    params = {'files' : [file], 'mesh_parameters' : {}, 'problem' : 'EleKin_v'}
+    key = EvaluationCache.key(input_parameters_values={'DO_y' : 0.035},**params)
+
+    assert key == EvaluationCache.key(input_parameters_values={'DO_y' : 0.035},**params)
+    assert key != EvaluationCache.key(input_parameters_values={'DO_y' : 0.035 + 1e-15},**params)
+    assert key != EvaluationCache.key(input_parameters_values={'DO_y' : 0.035},**{**params,'problem' : 'other'})
+
+    file.write_text('DO_y = 0.036;')
+    assert key != EvaluationCache.key(input_parameters_values={'DO_y' : 0.035},**params)
+
+def test_cache_put_get(tmp_path):
+    cache = EvaluationCache(directory=tmp_path)
+    assert cache.get('missing') is None
+
+    cache.put('a',evaluation(1.0))
+    loaded = cache.get('a')
+    for k,v in evaluation(1.0)['fields'].items():
+        assert numpy.array_equal(loaded['fields'][k],v)
+    assert loaded['number_of_nodes'] == 10 and loaded['number_of_elements'] == 20
+    assert loaded['metrics'] == {'time_mesh' : 0.5, 'time_solve' : 1.5}
+
+def test_cache_lru_eviction(tmp_path):
+    cache = EvaluationCache(directory=tmp_path)
+    cache.put('a',evaluation(1.0))
+    entry_size = (tmp_path / 'a.npz').stat().st_size
+
+    # Room for 2 entries only
+    cache.max_bytes = 2 * entry_size
+    cache.put('b',evaluation(2.0))
+    time.sleep(0.01)
+
+    # Use 'a' such that 'b' is the least recently used
+    assert cache.get('a') is not None
+    time.sleep(0.01)
+    cache.put('c',evaluation(3.0))
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+def test_cache_concurrent_eviction(tmp_path,monkeypatch):
+    """
+    An entry removed by another process while evicting is skipped.
+    """
+    cache = EvaluationCache(directory=tmp_path)
+    cache.put('a',evaluation(1.0))
+
+    stat = type(tmp_path).stat
+    def removed(path,*args,**kwargs):
+        if path.name == 'a.npz':
+            raise FileNotFoundError(path)
+        return stat(path,*args,**kwargs)
+    monkeypatch.setattr(type(tmp_path),'stat',removed)
+
+    cache.put('b',evaluation(2.0))
+    assert cache.get('b') is not None
+
+def test_cache_solution(tmp_path):
+    """
+    The solution of the iterative solver goes through the cache as arrays.
+    """
+    cache = EvaluationCache(directory=tmp_path)
+    solution = {'coordinates' : numpy.ones((4,2)),'potential' : numpy.arange(4.0),'voltages' : numpy.zeros(3)}
+    cache.put('key',{**evaluation(1.0),'solution' : solution})
+    loaded = cache.get('key')['solution']
+    assert all(numpy.array_equal(loaded[k],v) for k,v in solution.items())
+
+def test_cache_corrupted_entry(tmp_path):
+    """
+    A truncated or unreadable entry is a miss, and is removed such that it is computed again.
+    """
+    cache = EvaluationCache(directory=tmp_path)
+    cache.put('a',evaluation(1.0))
+    content = (tmp_path / 'a.npz').read_bytes()
+    (tmp_path / 'a.npz').write_bytes(content[:len(content) // 2])
+    (tmp_path / 'b.npz').write_bytes(b'not an archive')
+
+    assert cache.get('a') is None and cache.get('b') is None
+    assert len(cache) == 0
+
+    cache.put('a',evaluation(1.0))
+    assert cache.get('a') is not None
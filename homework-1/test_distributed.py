@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+import multiprocessing
+
+import numpy
+import pytest
+
+import optimization
+from scheduler import EvaluationFailed
+from distributed import Coordinator, Worker, describe
+from test_optimization import relocated
+
+class AnalyticWorker(Worker):
+    """
+    Worker whose evaluation is analytic and takes 0.5 s (no GMSH nor GETDP),
+    the imbalance vanishes on the plane DO_y + DO_a = 0.04. Fails for DO_b above 0.0059.
+    """
+    def evaluate(self,job):
+        time.sleep(0.5)
+        x = job['input_parameters_values']
+        if x['DO_b'] > 0.0059:
+            raise RuntimeError("GMSH failed")
+        center = 62.5 * (1.0 + 20.0 * (x['DO_y'] + x['DO_a'] - 0.04))
+        return {
+            'fields'             : {'currents' : numpy.array([187.5, -(187.5 - center), -center]),'voltages' : numpy.zeros(3),'losses' : numpy.zeros(1)},
+            'number_of_nodes'    : 10,
+            'number_of_elements' : 20,
+            'metrics'            : {'time_mesh' : 0.5,'time_solve' : float('nan')},
+        }
+
+class DyingWorker(AnalyticWorker):
+    """
+    Worker whose process dies during its first job.
+    """
+    def evaluate(self,job):
+        os._exit(1)
+
+class SilentWorker(AnalyticWorker):
+    """
+    Worker that hangs on its first job without sending heartbeats.
+    """
+    def _heartbeats(self,stream,job,done):
+        pass
+
+    def evaluate(self,job):
+        time.sleep(60.0)
+
+def start(kind,coordinator,name):
+    process = multiprocessing.get_context('fork').Process(
+        target = lambda : kind(port=coordinator.address[1],name=name,heartbeat=0.1,token=coordinator.token).run(),
+        daemon = True,
+    )
+    process.start()
+    return process
+
+@pytest.fixture
+def problem():
+    return optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+
+def points(n):
+    return [{'DO_y' : 0.03 + 0.001 * i,'DO_a' : 0.0075,'DO_b' : 0.004} for i in range(n)]
+
+def test_describe(problem):
+    description = describe(problem)
+    assert set(description['files'].keys()) >= {'busbar.sym.geo','busbar.sym.pro','mesh.parameters.geo','geometry.parameters.geo'}
+    assert description['geo_file'] == 'busbar.sym.geo' and description['settings']['coef_I_inobj'] == 2.0
+
+def test_describe_includes(tmp_path):
+    """
+    Includes outside of the directory of the .geo file keep their relative location.
+    """
+    description = describe(relocated(tmp_path))
+    assert set(description['files'].keys()) == {'case/busbar.sym.geo','case/busbar.sym.pro','geometry.parameters.geo','mesh.parameters.geo'}
+    assert description['geo_file'] == 'case/busbar.sym.geo' and description['pro_file'] == 'case/busbar.sym.pro'
+
+def test_distributed_workers(problem):
+    """
+    Four workers on localhost evaluate 8 points concurrently, results in the order of the points.
+    """
+    coordinator = Coordinator(heartbeat=0.1)
+    workers = [start(AnalyticWorker,coordinator,f"worker-{i}") for i in range(4)]
+    try:
+        started_at = time.time()
+        evaluations = coordinator.run(problem,points(8))
+        assert time.time() - started_at < 3.0
+
+        for x,evaluation in zip(points(8),evaluations):
+            assert numpy.isclose(evaluation['fields']['currents'][2],-62.5 * (1.0 + 20.0 * (x['DO_y'] + x['DO_a'] - 0.04)))
+        assert len(set(evaluation['worker'] for evaluation in evaluations)) > 1
+        assert numpy.isnan(evaluations[0]['metrics']['time_solve'])
+    finally:
+        coordinator.close()
+        for worker in workers: worker.join(timeout=5.0)
+    assert not any(worker.is_alive() for worker in workers)
+
+def test_distributed_problem(problem):
+    """
+    The coordinator is the scheduler of the problem.
+    """
+    coordinator = Coordinator(heartbeat=0.1)
+    problem.scheduler = coordinator
+    workers = [start(AnalyticWorker,coordinator,f"worker-{i}") for i in range(2)]
+    try:
+        currents = problem.evaluate_many(points=[[0.03,0.0075,0.004],[0.035,0.005,0.004]])
+        assert numpy.allclose([c[2] for c in currents],[-62.5 * 0.95,-62.5])
+        assert len(problem.database) == 2
+    finally:
+        coordinator.close()
+
+def test_distributed_lost_jobs(problem,caplog):
+    """
+    Jobs of a worker that dies or stops sending heartbeats are queued again for the others.
+    """
+    coordinator = Coordinator(heartbeat=0.1,timeout=0.5)
+    evaluations = []
+    run = threading.Thread(target=lambda : evaluations.extend(coordinator.run(problem,points(4))))
+    run.start()
+    workers = [start(DyingWorker,coordinator,"dying"),start(SilentWorker,coordinator,"silent")]
+    time.sleep(1.0)
+    workers.append(start(AnalyticWorker,coordinator,"analytic"))
+    try:
+        run.join(timeout=30.0)
+        assert len(evaluations) == 4
+        assert all(evaluation['worker'] == "analytic" for evaluation in evaluations)
+        assert any("of worker dying lost" in message for message in caplog.messages)
+        assert any("of worker silent lost" in message for message in caplog.messages)
+    finally:
+        coordinator.close()
+        for worker in workers: worker.kill()
+
+def test_distributed_failures(problem):
+    """
+    Failed jobs are retried, then raise or are penalized.
+    """
+    coordinator = Coordinator(heartbeat=0.1,retries=1)
+    workers = [start(AnalyticWorker,coordinator,f"worker-{i}") for i in range(2)]
+    failing = [{'DO_y' : 0.035,'DO_a' : 0.0075,'DO_b' : 0.006}]
+    try:
+        with pytest.raises(EvaluationFailed):
+            coordinator.run(problem,points(1) + failing)
+        coordinator.penalty = 1e3
+        evaluations = coordinator.run(problem,points(1) + failing)
+        assert evaluations[0] is not None and evaluations[1] is None
+    finally:
+        coordinator.close()
+
+def test_distributed_stop(problem):
+    """
+    Once an evaluation satisfies the stop condition, the remaining jobs are cancelled.
+    """
+    coordinator = Coordinator(heartbeat=0.1)
+    workers = [start(AnalyticWorker,coordinator,"worker")]
+    try:
+        evaluations = coordinator.run(problem,points(4),stop=lambda evaluation : True)
+        assert evaluations[0] is not None and evaluations[-1] is None
+        assert not coordinator.jobs and not coordinator.running
+    finally:
+        coordinator.close()
+
+def test_distributed_token(problem):
+    """
+    A worker without the token of the coordinator gets no job.
+    """
+    coordinator = Coordinator(heartbeat=0.1,token="secret")
+    try:
+        with pytest.raises(PermissionError):
+            AnalyticWorker(port=coordinator.address[1],heartbeat=0.1,token="guess").run()
+        workers = [start(AnalyticWorker,coordinator,"worker")]
+        evaluations = coordinator.run(problem,points(1))
+        assert evaluations[0]['worker'] == "worker"
+    finally:
+        coordinator.close()
+
+    # Listening on the loopback only, with a random token by default
+    coordinator = Coordinator(heartbeat=0.1)
+    coordinator.close()
+    assert coordinator.address[0] == "127.0.0.1" and len(coordinator.token) == 32
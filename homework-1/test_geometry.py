@@ -0,0 +1,64 @@
+import numpy
+import pytest
+
+import geometry
+import optimization
+
+GEO_FILE = 'homework-1/busbar.sym.geo'
+
+def test_constants():
+    values = geometry.constants(GEO_FILE,overrides={'DO_y' : 0.03})
+    assert values['DO_y'] == 0.03
+    assert values['DO_x'] == values['CP_width'] / 2.0 == 0.085
+    assert values['IO_radius'] == 0.0025
+
+def test_feasibility_margins():
+    feasibility = geometry.Feasibility(geo_file=GEO_FILE,ligament=1e-3)
+
+    # Ligament to the input hole (I_y - IO_radius = 0.0575) and to the center output hole (O_height + IO_radius = 0.0125)
+    margins = feasibility.margins({'DO_y' : 0.035, 'DO_a' : 0.0075, 'DO_b' : 0.004})
+    assert numpy.isclose(margins['input'][0],0.0575 - 0.0425 - 1e-3)
+    assert numpy.isclose(margins['output_center'][0],0.0275 - 0.0125 - 1e-3)
+    theta = numpy.linspace(0.0,2.0 * numpy.pi,100000)
+    distance = numpy.min(numpy.hypot(0.085 - 0.004 * numpy.cos(theta) - 0.035,0.035 + 0.0075 * numpy.sin(theta) - 0.01))
+    assert numpy.isclose(margins['output_left'][0],distance - 0.0025 - 1e-3,rtol=1e-4)
+
+    # Vectorized over designs : feasible, too thin ligament, across the input hole, degenerate
+    designs = {
+        'DO_y' : numpy.array([0.035 ,0.035 ,0.055 ,0.035  ]),
+        'DO_a' : numpy.array([0.0075,0.022 ,0.0075,0.0075 ]),
+        'DO_b' : numpy.array([0.004 ,0.004 ,0.004 ,0.0002 ]),
+    }
+    assert feasibility.feasible(designs).tolist() == [True,False,False,False]
+    violation = feasibility.violation(designs)
+    assert violation[0] == 0.0 and numpy.all(violation[1:] > 0.0)
+
+    # The brute force grid of Problem.run is feasible
+    assert numpy.all(feasibility.feasible({'DO_y' : 0.03, 'DO_a' : 0.01, 'DO_b' : 0.006}))
+
+def test_feasibility_problem():
+    """
+    Infeasible designs are rejected or penalized without meshing.
+    """
+    problem = optimization.problem_homework_1(
+        filenamebase = "busbar.sym",
+        outputfiles  = ".sym",
+        coef_I_inobj = 2.0,
+        feasibility  = geometry.Feasibility(geo_file=GEO_FILE,penalty=1e3),
+    )
+    infeasible = [0.035,0.022,0.004]
+    assert problem.objective_func(infeasible) > 1e3
+    assert problem(infeasible) is None
+    assert problem.evaluate_many(points=[infeasible,infeasible]) == [None,None]
+    assert len(problem.database) == 0
+    with pytest.raises(RuntimeError):
+        problem.load_cases(x=infeasible,cases=[{}])
+
+    problem.feasibility = geometry.Feasibility(geo_file=GEO_FILE)
+    with pytest.raises(geometry.InfeasibleDesign):
+        problem.objective_func(infeasible)
+
+    # Constraints for scipy.optimize.minimize
+    constraints = problem.constraints()
+    assert numpy.all(constraints.fun([0.035,0.0075,0.004]) >= 0.0)
+    assert numpy.any(constraints.fun(infeasible) < 0.0)
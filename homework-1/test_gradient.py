@@ -0,0 +1,117 @@
+import numpy
+import scipy.optimize
+
+from test_surrogate import AnalyticProblem
+from gradient import GradientOptimizer, mesh_noise, relative_step
+
+class BatchedProblem(AnalyticProblem):
+    """
+    Analytic problem keeping track of the batches it evaluates, whose imbalance vanishes on the plane
+    DO_y + DO_a = target (outside of the bounds for target above 0.05).
+    """
+
+    def __init__(self,target : float = 0.04):
+        super().__init__()
+        self.target = target
+        self.batches = []
+
+    def evaluate_many(self,points,workers=None):
+        points = numpy.array(points)
+        self.batches.append(points)
+        return super().evaluate_many(points + numpy.array([0.04 - self.target,0.0,0.0]),workers)
+
+    def constraints(self):
+        # Keep DO_b below 0.005
+        return scipy.optimize.NonlinearConstraint(lambda x : numpy.array([0.005 - x[2]]),0.0,numpy.inf)
+
+def test_relative_step():
+    assert numpy.isclose(relative_step(1e-4),numpy.cbrt(3e-4))
+    assert relative_step(0.0) == 1e-4 and relative_step(1.0) == 0.1
+
+class MeasuredStudy(object):
+    """
+    Stand-in for convergence.ConvergenceStudy whose relative error is proportional to the ratio.
+    """
+    mesh_parameters = {'lc' : 0.01}
+
+    def __init__(self):
+        self.levels = []
+
+    def evaluate(self,ratios):
+        self.levels.extend({'ratio' : ratio} for ratio in ratios)
+
+    def run(self):
+        self.evaluate([4.0,2.0,1.0])
+
+    def noise(self,ratio):
+        assert ratio in [level['ratio'] for level in self.levels]
+        return 1e-3 * ratio
+
+def test_mesh_noise():
+    study = MeasuredStudy()
+    assert numpy.isclose(mesh_noise(study,{}),1e-3) and len(study.levels) == 3
+    assert numpy.isclose(mesh_noise(study,{'lc' : 0.005}),5e-4) and len(study.levels) == 4
+
+    problem = BatchedProblem()
+    problem.mesh_parameters = {'lc' : 0.02}
+    assert numpy.isclose(GradientOptimizer(problem=problem,study=study).step,relative_step(2e-3))
+    assert GradientOptimizer(problem=problem,study=study,noise=1e-6).step == relative_step(1e-6)
+
+def test_gradient_optimizer():
+    problem = BatchedProblem()
+    optimizer = GradientOptimizer(problem=problem,tolerance=1e-3)
+    result = optimizer.run()
+
+    assert result['objective'] < 1e-3
+
+    # The iterate and its central differences are evaluated as one batch
+    assert result['batches'] == len(problem.batches)
+    assert all(batch.shape[0] <= 7 for batch in problem.batches)
+    assert problem.batches[0].shape[0] == 7
+
+    # The best point is one that was evaluated
+    assert numpy.isclose(problem.objective_func_inner(currents=problem.evaluate_many([result['x']])[0]),result['objective'])
+
+def test_gradient_optimizer_bounds():
+    """
+    The optimum lies outside of the bounds : the optimizer stops at the corner, never evaluating outside.
+    """
+    problem = BatchedProblem(target=0.06)
+    result = GradientOptimizer(problem=problem,max_iterations=20).run()
+
+    points = numpy.vstack(problem.batches)
+    low  = numpy.array([v[1] for v in problem.input_parameters.values()])
+    high = numpy.array([v[2] for v in problem.input_parameters.values()])
+    assert numpy.all(points >= low - 1e-15) and numpy.all(points <= high + 1e-15)
+    assert numpy.allclose(result['x'][0:2],high[0:2])
+
+def test_gradient_optimizer_constraints():
+    """
+    With SLSQP and the constraints, DO_b stays below 0.005 (the optimum is at DO_b = 0).
+    """
+    problem = BatchedProblem(target=0.07)
+    result = GradientOptimizer(problem=problem,method="SLSQP",constraints=True,max_iterations=20).run()
+    assert result['x'][2] <= 0.005 + 1e-9
+
+class FailingProblem(BatchedProblem):
+    """
+    Batched problem whose second iterate fails (e.g. GMSH could not mesh it).
+    """
+    def evaluate_many(self,points,workers=None):
+        currents = super().evaluate_many(points,workers)
+        if len(self.batches) == 2:
+            currents[0] = None
+        return currents
+
+def test_gradient_optimizer_failure():
+    """
+    A failed iterate gets the penalty, the line search backs off and the optimization goes on.
+    """
+    problem = FailingProblem()
+    optimizer = GradientOptimizer(problem=problem,tolerance=1e-3)
+    result = optimizer.run()
+    assert result['objective'] < 1e-3 and result['batches'] > 2
+
+    failed, = [u for u,v in optimizer.known.items() if v is None]
+    objective, gradient = optimizer._objective(numpy.array(failed))
+    assert objective == GradientOptimizer.PENALTY and numpy.all(gradient == 0.0)
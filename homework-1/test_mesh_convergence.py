@@ -1,7 +1,7 @@
 import logging
 import pprint
-import time
 import os
+import contextlib
 from pathlib import Path
 import re
 
@@ -15,6 +15,8 @@ font = {'size' : 12}
 matplotlib.rc('font', **font)
 
 import optimization
+from convergence import ConvergenceStudy
+from refinement import AdaptiveRefinement
 
 DEFAULT_MESH_PARAMETERS = {
     'CP_mesh_t' : 0.0009,
@@ -50,37 +52,13 @@ def test_mesh_convergence():
     """
     Check mesh convergence as elements get smaller.
     """
-    # Columns of the dataframe
-    columns = ['ratio', 'elapsed', 'current-left', 'current-center', 'number-of-elements', 'voltage-input', 'losses']
-
     # Ratios of the mesh size
     ratios = [4,3,2.5,2,1.75,1.5,1.3,1.2,1.0,0.9,0.8,]
 
-    # Create dataframe
-    pd = pandas.DataFrame(columns = columns)
-    for col in columns:
-        pd[col] = numpy.zeros(shape=(len(ratios),1)) if col != 'ratio' else numpy.array(ratios)
-    for row,ratio in enumerate(pd['ratio']):
-        started_at = time.time()
-        logging.info(f"> Mesh with ratio {ratio} ({started_at})")
-        problem = optimization.problem_homework_1(
-            filenamebase    = "busbar.sym",
-            outputfiles     = ".sym",
-            coef_I_inobj    = 2.0,
-            mesh_parameters = {
-                "CP_mesh_t" : ratio * DEFAULT_MESH_PARAMETERS['CP_mesh_t'],
-                "CP_mesh_b" : ratio * DEFAULT_MESH_PARAMETERS['CP_mesh_b'],
-                "IO_mesh"   : ratio * DEFAULT_MESH_PARAMETERS['IO_mesh'],
-                "DO_mesh"   : ratio * DEFAULT_MESH_PARAMETERS['DO_mesh'],
-            }
-        )
-        _ = problem.nominal()
-        pd.at[row,'elapsed'           ] = time.time()-started_at
-        pd.at[row,'current-left'      ] = problem.fields['currents'][1]
-        pd.at[row,'current-center'    ] = problem.fields['currents'][2]
-        pd.at[row,'number-of-elements'] = problem.number_of_elements
-        pd.at[row,'voltage-input'     ] = problem.fields['voltages'][0]
-        pd.at[row,'losses'            ] = problem.fields['losses'][0]
+    # Evaluate all ratios concurrently
+    study = ConvergenceStudy(mesh_parameters=DEFAULT_MESH_PARAMETERS)
+    study.evaluate(ratios=[float(r) for r in ratios])
+    pd = study.to_dataframe().rename(columns={'number_of_elements' : 'number-of-elements'})
 
     pprint.pprint(pd)
 
@@ -120,3 +98,84 @@ def test_mesh_convergence():
         os.path.abspath(__file__).replace('.py','.svg'),
         bbox_inches='tight',
     )
+
+def test_mesh_convergence_adaptive():
+    """
+    Refine adaptively until currents and losses converge, and recommend the cheapest mesh for a target accuracy.
+    """
+    study = ConvergenceStudy(mesh_parameters=DEFAULT_MESH_PARAMETERS,tolerance=1e-4)
+    extrapolation = study.run(ratios=[4.0,2.0,1.0],max_levels=6)
+
+    pprint.pprint(study.to_dataframe())
+    pprint.pprint(extrapolation)
+
+    assert len(study.levels) >= 3
+    assert study.change() <= 1e-4 or len(study.levels) == 6
+    assert all(level['elapsed'] > 0 and level['number_of_elements'] > 0 for level in study.levels)
+
+    # Extrapolated currents still balance the input current
+    assert numpy.isclose(numpy.sum(extrapolation['value'][0:3]),0.0,atol=1e-6 * extrapolation['value'][0])
+
+    recommended = study.recommend(target=1e-3)
+    assert recommended['error'] <= 1e-3
+    assert set(recommended['mesh_parameters'].keys()) == set(DEFAULT_MESH_PARAMETERS.keys())
+
+class QuadraticProblem(object):
+    """
+    Stand-in for optimization.Problem whose currents, voltages and losses converge quadratically with the mesh size lc.
+    """
+    input_parameters = {"DO_y" : [0.035, 0.03, 0.04]}
+
+    def __init__(self,mesh_parameters={'lc' : 1.0}):
+        self.mesh_parameters = mesh_parameters
+
+    def _parameters(self,x):
+        return {k : float(v) for k,v in zip(self.input_parameters.keys(),x)}
+
+    @contextlib.contextmanager
+    def _scratch(self):
+        yield Path('.')
+
+    def _evaluate(self,*,input_parameters_values,workdir):
+        h2 = self.mesh_parameters['lc']**2
+        return {
+            'fields'             : {'currents' : numpy.array([2.0,-1.0 - h2,-1.0 + h2]),'voltages' : numpy.array([1.0 + h2]),'losses' : numpy.array([3.0 - h2])},
+            'number_of_nodes'    : int(1.0 / h2),
+            'number_of_elements' : int(2.0 / h2),
+        }
+
+def test_convergence_batches():
+    """
+    Finer ratios are evaluated two at a time until the two finest levels agree.
+    """
+    study = ConvergenceStudy(factory=QuadraticProblem,factory_kwargs={},mesh_parameters={'lc' : 0.1},tolerance=1e-3,workers=2)
+    assert study.change() == float('inf')
+
+    batches = []
+    evaluate = study.evaluate
+    study.evaluate = lambda ratios : batches.append(ratios) or evaluate(ratios)
+    extrapolation = study.run(ratios=[4.0,2.0,1.0],max_levels=8)
+
+    assert [len(ratios) for ratios in batches] == [3,2,2] and len(study.levels) == 7
+    assert numpy.isclose(study.levels[-1]['ratio'],0.8**4)
+    assert study.change() <= 1e-3
+    assert numpy.allclose(extrapolation['value'],[2.0,-1.0,-1.0,1.0,3.0]) and numpy.allclose(extrapolation['order'],2.0)
+
+def test_mesh_refinement_adaptive():
+    """
+    Refine where the current density changes sharply : the currents of the ratio-1.0 mesh with fewer elements.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles=".sym", coef_I_inobj=2.0, mesh_parameters=DEFAULT_MESH_PARAMETERS)
+    uniform = problem.nominal()
+    uniform_elements = problem.number_of_elements
+
+    refinement = AdaptiveRefinement(problem=problem,tolerance=0.05)
+    finest = refinement.run()
+    pprint.pprint(refinement.to_dataframe())
+
+    # Error decreases from the initial coarse mesh, the problem itself is left untouched
+    assert finest['error'] < refinement.levels[0]['error']
+    assert problem.background_mesh is None and problem.mesh_parameters == DEFAULT_MESH_PARAMETERS
+
+    assert numpy.allclose(finest['currents'],uniform,rtol=1e-3),(finest['currents'],uniform)
+    assert finest['number_of_elements'] < uniform_elements
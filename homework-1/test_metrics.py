@@ -0,0 +1,41 @@
+import json
+
+import numpy
+
+import metrics
+
+GETDP_OUTPUT = """Info    : Running 'getdp busbar.sym.pro -solve EleKin_v -pos Scalars' [GetDP 3.4.0, 1 node, max. 1 thread]
+Info    : Started (Wed Mar 02 10:00:00 2022, Wall = 0.01s, CPU = 0.01s, Mem = 20Mb)
+Info    : Loading problem definition 'busbar.sym.pro'
+Info    : Resolution 'EleKin_v'
+Info    : Generate[Sys_Ele]
+Info    : System 1/1: 5316 Dofs
+Info    : (Wall 0.0312s, CPU 0.03s, Mem 24.5Mb)
+Info    : Solve[Sys_Ele]
+Info    : N: 5316 - preonly lu mumps
+Info    : (Wall 0.0488s, CPU 0.05s, Mem 31.2Mb)
+Info    : SaveSolution[Sys_Ele]
+Info    : (Wall 0.001s, CPU 0s, Mem 31.2Mb)
+Info    : Stopped (Wed Mar 02 10:00:01 2022, Wall 0.2s, CPU 0.15s, Mem 31.5Mb)
+"""
+
+def test_parse_getdp():
+    m = metrics.parse_getdp(GETDP_OUTPUT)
+    assert numpy.isclose(m['time_assembly'],0.0312)
+    assert numpy.isclose(m['time_linear'],0.0488)
+    assert m['dofs'] == 5316
+    assert m['solver_memory'] == 31.5
+
+def test_timer_and_sink(tmp_path):
+    m = {}
+    for _ in range(2):
+        with metrics.timer(m,'time_solve'):
+            pass
+    assert m['time_solve'] >= 0.0
+    assert metrics.peak_rss() > 0.0
+
+    sink = metrics.JsonLinesSink(tmp_path / 'metrics.jsonl')
+    sink({'counter' : 1, **m})
+    sink({'counter' : 2, **m})
+    lines = [json.loads(line) for line in (tmp_path / 'metrics.jsonl').read_text().splitlines()]
+    assert [line['counter'] for line in lines] == [1,2]
@@ -0,0 +1,114 @@
+from pathlib import Path
+
+import numpy
+import typeguard
+
+import gmshio
+from morphing import MeshMorpher, triangle_quality
+
+@typeguard.typechecked
+def write_ellipse_annulus_msh(path : Path, *, DO_x : float = 0.085, DO_y : float = 0.035, DO_a : float = 0.0075, DO_b : float = 0.004, radius : float = 3.0, nr : int = 12, nt : int = 48):
+    """
+    Write a structured mesh (MSH 4.1) of the region between the ellipse (DO_x,DO_y,DO_a,DO_b)
+    and the same ellipse scaled by radius:
+        * 200 : surface
+        * 201 : top half of the outer boundary
+        * 202 : bottom half of the outer boundary
+        * 205 : ellipse
+    """
+    r = numpy.linspace(1.0,radius,nr + 1)
+    t = numpy.linspace(0.0,2.0 * numpy.pi,nt,endpoint=False)
+    R, T = numpy.meshgrid(r,t,indexing='ij')
+    x = DO_x + DO_b * R * numpy.cos(T)
+    y = DO_y + DO_a * R * numpy.sin(T)
+    tag = lambda i,j : 1 + i * nt + (j % nt)
+
+    inner  = [tag(0,j) for j in range(nt)]
+    top    = [tag(nr,j) for j in range(nt) if t[j] < numpy.pi]
+    bottom = [tag(nr,j) for j in range(nt) if t[j] >= numpy.pi]
+    interior = [tag(i,j) for i in range(1,nr) for j in range(nt)]
+
+    xy = lambda tags : ' '.join(f"{x.flat[k - 1]} {y.flat[k - 1]} 0" for k in tags)
+    box = f"{x.min()} {y.min()} 0 {x.max()} {y.max()} 0"
+    lines = [
+        "$MeshFormat","4.1 0 8","$EndMeshFormat",
+        "$Entities","0 3 1 0",
+        f"1 {box} 1 205 0",f"2 {box} 1 201 0",f"3 {box} 1 202 0",
+        f"1 {box} 1 200 3 1 2 3",
+        "$EndEntities",
+        "$Nodes",f"4 {x.size} 1 {x.size}",
+    ]
+    for dim,entity,tags in [(1,1,inner),(1,2,top),(1,3,bottom),(2,1,interior)]:
+        lines += [f"{dim} {entity} 0 {len(tags)}"] + [str(k) for k in tags] + [xy([k]) for k in tags]
+    lines += ["$EndNodes"]
+
+    triangles = []
+    for i in range(nr):
+        for j in range(nt):
+            triangles += [(tag(i,j),tag(i + 1,j),tag(i + 1,j + 1)),(tag(i,j),tag(i + 1,j + 1),tag(i,j + 1))]
+    edges = {
+        1 : [(tag(0,j),tag(0,j + 1)) for j in range(nt)],
+        2 : [(tag(nr,j),tag(nr,j + 1)) for j in range(nt) if t[j] < numpy.pi],
+        3 : [(tag(nr,j),tag(nr,j + 1)) for j in range(nt) if t[j] >= numpy.pi],
+    }
+    count = len(triangles) + sum(len(e) for e in edges.values())
+    lines += ["$Elements",f"4 {count} 1 {count}"]
+    element = 1
+    for entity,elements in edges.items():
+        lines += [f"1 {entity} 1 {len(elements)}"]
+        for e in elements:
+            lines += [f"{element} {e[0]} {e[1]}"]
+            element += 1
+    lines += [f"2 1 2 {len(triangles)}"]
+    for e in triangles:
+        lines += [f"{element} {e[0]} {e[1]} {e[2]}"]
+        element += 1
+    lines += ["$EndElements"]
+    path.write_text('\n'.join(lines) + '\n')
+
+def test_read_write_msh(tmp_path):
+    write_ellipse_annulus_msh(tmp_path / 'annulus.msh')
+    mesh = gmshio.read_msh(tmp_path / 'annulus.msh')
+
+    assert mesh.coordinates.shape == (13 * 48,3)
+    assert mesh.elements(physical=200,type=2).shape == (2 * 12 * 48,3)
+    assert mesh.elements(physical=205,type=1).shape == (48,2)
+    assert mesh.nodes(physical=201).size + mesh.nodes(physical=202).size == 48 + 2
+
+    coordinates = mesh.coordinates * 2.0
+    mesh.write(tmp_path / 'scaled.msh',coordinates=coordinates)
+    scaled = gmshio.read_msh(tmp_path / 'scaled.msh')
+    assert numpy.allclose(scaled.coordinates,coordinates)
+    assert numpy.array_equal(scaled.elements(physical=200,type=2),mesh.elements(physical=200,type=2))
+
+def test_morph_small_perturbation(tmp_path):
+    write_ellipse_annulus_msh(tmp_path / 'annulus.msh')
+    mesh = gmshio.read_msh(tmp_path / 'annulus.msh')
+    reference = {'DO_y' : 0.035, 'DO_a' : 0.0075, 'DO_b' : 0.004}
+    morpher = MeshMorpher(reference=mesh,parameters=reference,DO_x=0.085)
+
+    perturbed = {'DO_y' : 0.035 * 1.01, 'DO_a' : 0.0075 * 0.99, 'DO_b' : 0.004 * 1.01}
+    assert morpher.write(parameters=perturbed,msh_file=tmp_path / 'morphed.msh')
+    morphed = gmshio.read_msh(tmp_path / 'morphed.msh').coordinates
+
+    # Ellipse nodes are on the new ellipse
+    hole = mesh.nodes(physical=205)
+    r = ((morphed[hole,0] - 0.085) / perturbed['DO_b'])**2 + ((morphed[hole,1] - perturbed['DO_y']) / perturbed['DO_a'])**2
+    assert numpy.allclose(r,1.0)
+
+    # Outer boundary does not move
+    outer = numpy.concatenate([mesh.nodes(physical=201),mesh.nodes(physical=202)])
+    assert numpy.allclose(morphed[outer],mesh.coordinates[outer])
+
+    # Quality barely changes
+    triangles = mesh.elements(physical=200,type=2)
+    assert numpy.min(numpy.abs(triangle_quality(morphed,triangles))) > 0.9 * morpher.reference_quality
+
+def test_morph_large_perturbation_needs_remesh(tmp_path):
+    write_ellipse_annulus_msh(tmp_path / 'annulus.msh')
+    mesh = gmshio.read_msh(tmp_path / 'annulus.msh')
+    morpher = MeshMorpher(reference=mesh,parameters={'DO_y' : 0.035, 'DO_a' : 0.0075, 'DO_b' : 0.004},DO_x=0.085)
+
+    # Ellipse pushed through the outer boundary
+    assert not morpher.write(parameters={'DO_y' : 0.05, 'DO_a' : 0.0075, 'DO_b' : 0.004},msh_file=tmp_path / 'morphed.msh')
+    assert not (tmp_path / 'morphed.msh').exists()
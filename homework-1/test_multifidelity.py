@@ -0,0 +1,88 @@
+import copy
+
+import numpy
+
+from store import ResultStore
+from multifidelity import MultiFidelityOptimizer
+
+class BiasedProblem(object):
+    """
+    Stand-in for optimization.Problem whose coarse meshes (mesh constant 'ratio' above 1) bias the currents,
+    the fine imbalance vanishes on the plane DO_y + DO_a = 0.04.
+    """
+    input_parameters = {
+        "DO_y" : [0.035  , 0.03  , 0.04  ],
+        "DO_a" : [0.0075 , 0.005 , 0.01  ],
+        "DO_b" : [0.004  , 0.002 , 0.006 ],
+    }
+    coef_I_inobj = 2.0
+
+    def __init__(self):
+        self.mesh_parameters = {'ratio' : 1.0}
+        self.database = ResultStore()
+        self.counter = 0
+
+    def with_mesh_parameters(self,mesh_parameters):
+        problem = copy.copy(self)
+        problem.mesh_parameters = mesh_parameters
+        problem.database = ResultStore()
+        problem.counter = 0
+        return problem
+
+    def evaluate_many(self,points,workers=None,stop=None,callback=None):
+        currents, stopped = [], False
+        for i,x in enumerate(points):
+            # Points after the one satisfying stop are cancelled
+            if stopped:
+                currents.append(None)
+                continue
+            x = dict(zip(self.input_parameters.keys(),x))
+            center = 62.5 * (1.0 + 20.0 * (x['DO_y'] + x['DO_a'] - 0.04))
+            center += (self.mesh_parameters['ratio'] - 1.0) * (0.5 + 100.0 * x['DO_b'])
+            currents.append(numpy.array([187.5, -(187.5 - center), -center]))
+            self.database.append({'currents' : currents[-1],**x})
+            if callback is not None: callback(i,{'currents' : currents[-1],**x})
+            stopped = stop is not None and stop(currents[-1])
+        return currents
+
+def test_multifidelity_optimizer():
+    problem = BiasedProblem()
+    optimizer = MultiFidelityOptimizer(problem=problem,coarse_mesh_parameters={'ratio' : 4.0},tolerance=0.05,rounds=6)
+    result = optimizer.run()
+
+    # The coarse problem is a separate copy
+    assert problem.mesh_parameters == {'ratio' : 1.0} and optimizer.coarse.mesh_parameters == {'ratio' : 4.0}
+
+    # Fine accuracy, with most of the evaluations on the coarse mesh
+    x = dict(zip(problem.input_parameters.keys(),result['x']))
+    assert result['objective'] < 0.05,result
+    assert numpy.isclose(3750.0 * abs(x['DO_y'] + x['DO_a'] - 0.04),result['objective'])
+    assert result['fine_evaluations'] == len(problem.database) <= 12
+    assert result['coarse_evaluations'] >= 64
+
+    # The learned correction removes the bias at the fine points
+    Xf, gf = optimizer._data(problem)
+    Xc, gc = optimizer._data(optimizer.coarse)
+    coarse = {tuple(x) : g for x,g in zip(Xc.tolist(),gc)}
+    g = numpy.array([coarse[tuple(x)] for x in Xf.tolist()])
+    assert numpy.max(numpy.abs(optimizer.predict(Xf,g) - gf)) < numpy.max(numpy.abs(g - gf))
+
+class FailingProblem(BiasedProblem):
+    """
+    Biased problem whose coarse evaluation of the minimizers (batches of a single point) fails under a penalty.
+    """
+    def evaluate_many(self,points,workers=None,stop=None,callback=None):
+        if self.mesh_parameters['ratio'] > 1.0 and len(points) == 1:
+            return [None]
+        return super().evaluate_many(points,workers,stop,callback)
+
+def test_multifidelity_failed_minimizer():
+    """
+    A minimizer that failed on the coarse mesh is not promoted, nor is any point promoted twice
+    (without new coarse candidates between the rounds).
+    """
+    problem = FailingProblem()
+    MultiFidelityOptimizer(problem=problem,coarse_mesh_parameters={'ratio' : 4.0},tolerance=1e-9,rounds=4,refine=0).run()
+
+    X = numpy.hstack([problem.database[k] for k in problem.input_parameters.keys()])
+    assert len(set(tuple(x) for x in X.tolist())) == X.shape[0]
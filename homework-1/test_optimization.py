@@ -1,6 +1,14 @@
+import threading
+
 import numpy
+import pytest
 
 import optimization
+import metrics
+from cache import EvaluationCache
+from scheduler import Scheduler
+from distributed import Coordinator, Worker
+from archive import FieldArchive
 
 # Copper plate thickness [m]
 CP_thickn = 0.002
@@ -49,3 +57,337 @@ def test_homework_1_near_optimal():
     assert numpy.allclose(currents,EXPECTED_CURRENTS)
 
     assert numpy.allclose(problem.fields['voltages'][1::],[0.,0.,])
+
+def test_homework_1_sym_evaluate_many():
+    """
+    Evaluate several points concurrently, each in its own scratch directory.
+    """
+    # Create problem with symmetry
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+
+    nominal = [x[0] for x in problem.input_parameters.values()]
+    near_optimal = [0.02787345, 0.01059685, 0.0063542]
+
+    # Run both points twice on 2 workers
+    res = problem.evaluate_many(points=[nominal,near_optimal,nominal,near_optimal],workers=2)
+
+    # Results come back in the order of the points
+    assert numpy.allclose(res[0],EXPECTED_RESULT_SYM),res[0]
+    assert numpy.allclose(res[1],numpy.array([187.5, -125.0010832372, -62.4989167628]) / CP_thickn),res[1]
+    assert numpy.allclose(res[0],res[2]) and numpy.allclose(res[1],res[3])
+
+    assert problem.counter == 4
+    assert len(problem.database) == 4
+
+def test_homework_1_sym_evaluate_many_stop():
+    """
+    Once an evaluation satisfies the stop condition, the pending evaluations are cancelled.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+    points = [[0.03 + 0.001 * i,0.0075,0.004] for i in range(8)]
+
+    res = problem.evaluate_many(points=points,workers=1,stop=lambda currents : True)
+    assert res[0] is not None and res[-1] is None
+    assert len(problem.database) == sum(r is not None for r in res) < 8
+
+class FlakyProblem(optimization.Problem):
+    """
+    Problem of busbar.sym whose evaluation fails for the highest holes, without GMSH nor GETDP.
+    """
+    def _evaluate(self,*,input_parameters_values,workdir,postpro=None):
+        if input_parameters_values['DO_y'] > 0.039:
+            raise RuntimeError("Meshing failed")
+        return {
+            'fields'             : {'currents' : numpy.array([input_parameters_values['DO_y'],0.0])},
+            'number_of_nodes'    : 1,
+            'number_of_elements' : 1,
+            'metrics'            : {k : 0.0 for k in metrics.METRICS},
+        }
+
+def flaky(tmp_path):
+    return FlakyProblem(
+        geo_file         = optimization.HOMEWORK_1 / "busbar.sym.geo",
+        pro_file         = optimization.HOMEWORK_1 / "busbar.sym.pro",
+        outputfiles      = ".sym",
+        problem          = "EleKin_v",
+        postpro          = "Scalars",
+        input_parameters = {"DO_y" : [0.035,0.03,0.04], "DO_a" : [0.0075,0.005,0.01], "DO_b" : [0.004,0.002,0.006]},
+        coef_I_inobj     = 2.0,
+        cache            = EvaluationCache(directory=tmp_path),
+    )
+
+def test_with_mesh_parameters(tmp_path):
+    """
+    The copy of a problem with other mesh constants has its own database, and does not archive nor report its evaluations.
+    """
+    problem = flaky(tmp_path)
+    problem.archive, problem.metrics_sink = object(), print
+    coarse = problem.with_mesh_parameters({'ratio' : 4.0})
+    assert coarse.mesh_parameters == {'ratio' : 4.0} and problem.mesh_parameters == {}
+    assert coarse.archive is None and coarse.metrics_sink is None
+    assert problem.archive is not None and coarse.cache is problem.cache
+
+    coarse.evaluate_many(points=[[0.03,0.0075,0.004]],workers=1)
+    assert len(coarse.database) == 1 and len(problem.database) == 0
+
+def test_evaluate_many_failure(tmp_path):
+    """
+    A failed evaluation of a batch is raised once the evaluations that succeeded are recorded and cached.
+    """
+    problem = flaky(tmp_path)
+    points = [[0.03 + 0.002 * i,0.0075,0.004] for i in range(6)]
+
+    with pytest.raises(RuntimeError,match="Meshing failed"):
+        problem.evaluate_many(points=points,workers=2)
+    assert len(problem.database) == 5 and len(problem.cache) == 5
+
+    # Only the failed point is evaluated again
+    with pytest.raises(RuntimeError,match="Meshing failed"):
+        problem.evaluate_many(points=points,workers=2)
+    assert len(problem.database) == 10 and problem.database['cache_hit'][5:].sum() == 5
+
+def test_cache_hit_metrics(tmp_path):
+    """
+    Nothing is meshed nor solved for a cache hit, and the time spent recording each evaluation goes to the database.
+    """
+    problem = flaky(tmp_path)
+    points = [[0.03,0.0075,0.004],[0.032,0.0075,0.004]]
+    problem.evaluate_many(points=points,workers=2)
+    problem.evaluate_many(points=points,workers=2)
+
+    assert numpy.all(problem.database['time_mesh'][:2] == 0.0) and numpy.all(numpy.isnan(problem.database['time_mesh'][2:]))
+    assert numpy.all(problem.database['time_record'] > 0.0)
+    assert problem.database['time_record'][-1,0] == problem.metrics['time_record']
+
+def test_homework_1_sym_maps():
+    """
+    Field maps are only written on demand, the search only runs the scalar post-operation.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+
+    maps = [problem.workdir / f"{field}.sym.pos" for field in ['v','j','losses']]
+    for file in maps:
+        file.unlink(missing_ok=True)
+
+    res = problem.nominal()
+    assert numpy.allclose(res,EXPECTED_RESULT_SYM),res
+    assert not any(file.exists() for file in maps)
+
+    fields = problem.maps(x=[x[0] for x in problem.input_parameters.values()])
+    assert numpy.allclose(fields['currents'],EXPECTED_RESULT_SYM)
+    assert all(file.exists() for file in maps)
+
+def test_homework_1_sym_archive(tmp_path):
+    """
+    With an archive, the field maps of each evaluation are archived, the database holds their index.
+    """
+    archive = FieldArchive(path=tmp_path / 'fields.bin',names=["DO_y","DO_a","DO_b"])
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, archive = archive)
+
+    currents = problem.evaluate_many(points=[[0.03,0.0075,0.004],[0.035,0.005,0.004]])
+    assert numpy.allclose(currents[0],EXPECTED_RESULT_SYM)
+    assert len(archive) == 2
+    assert numpy.array_equal(problem.database['archive_index'][:,0],[0,1])
+    assert archive.run(0)['nodes'].shape[0] == problem.database['number_of_nodes'][0,0]
+
+    images = problem.render_maps(runs=[0,1],fields=['v'])
+    assert images[1]['v'] == [tmp_path / 'maps' / 'v.0001.png'] and images[1]['v'][0].exists()
+
+def relocated(tmp_path):
+    """
+    Problem of busbar.sym whose .geo/.pro files include the parameters of the parent directory.
+    """
+    (tmp_path / 'case').mkdir()
+    for name in ['geometry.parameters.geo','mesh.parameters.geo']:
+        (tmp_path / name).write_text((optimization.HOMEWORK_1 / name).read_text())
+    for name in ['busbar.sym.geo','busbar.sym.pro']:
+        content = (optimization.HOMEWORK_1 / name).read_text()
+        for include in ['geometry.parameters.geo','mesh.parameters.geo']:
+            content = content.replace(f'Include "{include}"',f'Include "../{include}"')
+        (tmp_path / 'case' / name).write_text(content)
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+    problem.geo_file, problem.pro_file = tmp_path / 'case' / 'busbar.sym.geo', tmp_path / 'case' / 'busbar.sym.pro'
+    return problem
+
+def test_scratch_includes(tmp_path):
+    """
+    Includes outside of the directory of the .geo file are copied along to the scratch directory.
+    """
+    problem = relocated(tmp_path)
+    with problem._scratch() as workdir:
+        assert workdir.name == 'case' and (workdir / 'busbar.sym.geo').exists() and (workdir / 'busbar.sym.pro').exists()
+        assert (workdir.parent / 'geometry.parameters.geo').exists() and (workdir.parent / 'mesh.parameters.geo').exists()
+
+def test_homework_1_sym_session():
+    """
+    Mesh with the in-process GMSH session, several times in a row.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, mesher = "session")
+
+    for _ in range(2):
+        res = problem.nominal()
+        assert numpy.allclose(res,EXPECTED_RESULT_SYM),res
+        assert problem.number_of_nodes > 0 and problem.number_of_elements > 0
+
+def test_homework_1_sym_morphing():
+    """
+    A small perturbation of the ellipse morphs the nominal mesh, and matches a full remesh.
+    """
+    problem  = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, morphing = True)
+    remeshed = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+
+    res = problem.nominal()
+    assert numpy.allclose(res,EXPECTED_RESULT_SYM),res
+    number_of_elements = problem.number_of_elements
+
+    perturbed = [1.01 * x[0] for x in problem.input_parameters.values()]
+    res = problem(x=perturbed)
+
+    # Same mesh topology, close to the currents of a full remesh
+    assert problem.number_of_elements == number_of_elements
+    assert numpy.allclose(res,remeshed(x=perturbed),rtol=1e-3)
+
+def test_homework_1_native():
+    """
+    The native solver gives the same currents as GETDP.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar", outputfiles = "", coef_I_inobj = 1.0, solver = "native")
+    res = problem.nominal()
+    assert numpy.allclose(res,EXPECTED_RESULT_FULL),res
+    assert numpy.allclose(problem.fields['voltages'][1::],[0.,0.,0.,])
+
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, solver = "native")
+    res = problem.nominal()
+    assert numpy.allclose(res,EXPECTED_RESULT_SYM),res
+    assert numpy.allclose(problem.fields['voltages'][1::],[0.,0.,])
+
+    # Same voltages and losses as GETDP
+    getdp = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+    getdp.nominal()
+    assert numpy.allclose(problem.fields['voltages'],getdp.fields['voltages'])
+    assert numpy.allclose(problem.fields['losses'],getdp.fields['losses'])
+
+def test_homework_1_sym_native_iterative():
+    """
+    The iterative solver with warm starts gives the currents of the direct one.
+    """
+    direct = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, solver = "native")
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, solver = "native-iterative", morphing = True)
+    nominal = [x[0] for x in problem.input_parameters.values()]
+    perturbed = [1.001 * v for v in nominal]
+
+    assert numpy.allclose(problem(x=nominal),EXPECTED_RESULT_SYM)
+    cold = problem.metrics['iterations']
+    assert numpy.allclose(problem(x=perturbed),direct(x=perturbed),rtol=1e-3)
+    assert problem.metrics['iterations'] < cold
+
+def test_homework_1_sym_native_iterative_batches():
+    """
+    Solutions computed in worker processes warm-start the next batches.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, solver = "native-iterative")
+    first  = [[0.03,0.0075,0.004],[0.035,0.005,0.004]]
+    second = [[1.001 * v for v in x] for x in first]
+
+    problem.evaluate_many(points=first,workers=2)
+    assert len(problem._solutions) == 2
+    problem.evaluate_many(points=second,workers=2)
+    iterations = problem.database['iterations'][:,0]
+    assert numpy.all(iterations[2:] < iterations[0:2])
+
+def test_homework_1_sym_scheduler():
+    """
+    Evaluations through the asynchronous scheduler, a point whose ellipse overlaps the electrodes is penalized.
+    """
+    problem = optimization.problem_homework_1(
+        filenamebase = "busbar.sym",
+        outputfiles  = ".sym",
+        coef_I_inobj = 2.0,
+        timeouts     = {'mesh' : 60.0, 'solve' : 120.0},
+        scheduler    = Scheduler(concurrency=2,retries=1,penalty=1e6),
+    )
+    nominal = [x[0] for x in problem.input_parameters.values()]
+    degenerate = [nominal[0],0.2,nominal[2]]
+
+    currents = problem.evaluate_many(points=[nominal,degenerate])
+    assert numpy.allclose(currents[0],EXPECTED_RESULT_SYM)
+    assert currents[1] is None
+    assert len(problem.database) == 1
+
+    assert problem.objective_func(degenerate) == 1e6
+
+def test_homework_1_sym_distributed():
+    """
+    Evaluations on two workers connected to the coordinator over TCP on localhost.
+    """
+    coordinator = Coordinator(heartbeat=0.5)
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, scheduler = coordinator)
+    workers = [threading.Thread(target=Worker(port=coordinator.address[1],token=coordinator.token).run,daemon=True) for _ in range(2)]
+    for worker in workers: worker.start()
+    try:
+        nominal = [x[0] for x in problem.input_parameters.values()]
+        currents = problem.evaluate_many(points=[nominal,nominal])
+        assert all(numpy.allclose(c,EXPECTED_RESULT_SYM) for c in currents)
+        assert problem.number_of_elements > 0
+    finally:
+        coordinator.close()
+        for worker in workers: worker.join(timeout=5.0)
+
+def test_homework_1_sym_multifidelity():
+    """
+    Screening on a coarse mesh, the result is evaluated on the mesh of the problem.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+    result = problem.run_multifidelity(ratio=4.0,screening=16,refine=8,rounds=3,tolerance=1e-2)
+
+    assert result['fine_evaluations'] == len(problem.database) <= 6
+    assert result['coarse_evaluations'] >= 16
+    assert numpy.isclose(problem.objective_func(result['x']),result['objective'])
+
+def test_homework_1_sym_gradient():
+    """
+    Bound-constrained gradient optimization, each iterate and its finite differences evaluated as one batch.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+    nominal = problem.objective_func([x[0] for x in problem.input_parameters.values()])
+    result = problem.run_gradient(noise=1e-4,max_iterations=10,tolerance=1e-2,workers=7)
+
+    assert result['objective'] < nominal
+    assert result['evaluations'] == len(problem.database) - 1 and result['evaluations'] <= 7 * result['batches']
+    assert all(low <= x <= high for x,(_,low,high) in zip(result['x'],problem.input_parameters.values()))
+
+def test_homework_1_sym_load_cases():
+    """
+    Load cases with other currents and conductivities from a single evaluation.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0)
+    nominal = [x[0] for x in problem.input_parameters.values()]
+
+    cases = [{}, {'current' : 2.0 * 375 / 2.0 / CP_thickn}, {'sigma' : 5.81e7 / 2.0}, {'current' : -375 / 2.0 / CP_thickn, 'sigma' : 1.0e7}]
+    res = problem.load_cases(x=nominal,cases=cases)
+    assert problem.counter == 1
+
+    assert res['currents'].shape == (4,3) and res['voltages'].shape == (4,3) and res['losses'].shape == (4,1)
+    assert numpy.allclose(res['currents'][0],EXPECTED_RESULT_SYM)
+    assert numpy.allclose(res['currents'][1],2.0 * EXPECTED_RESULT_SYM)
+    assert numpy.allclose(res['currents'][2],EXPECTED_RESULT_SYM)
+    assert numpy.allclose(res['voltages'][2],2.0 * res['voltages'][0])
+    assert numpy.allclose(res['losses'][2],2.0 * res['losses'][0])
+    assert numpy.allclose(res['currents'][3],-EXPECTED_RESULT_SYM)
+    assert numpy.allclose(res['losses'][3],5.81 * res['losses'][0])
+
+def test_homework_1_sym_metrics(tmp_path):
+    """
+    Per-phase metrics go to the database and to the metrics sink.
+    """
+    sink = metrics.JsonLinesSink(tmp_path / 'metrics.jsonl')
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, metrics_sink = sink)
+    problem.nominal()
+
+    for name in ['time_mesh','time_solve','time_read','peak_rss']:
+        assert problem.database[name][0,0] > 0.0,name
+    assert problem.database['number_of_elements'][0,0] == problem.number_of_elements
+    assert problem.metrics['time_record'] > 0.0 and problem.database['time_record'][0,0] == problem.metrics['time_record']
+
+    lines = (tmp_path / 'metrics.jsonl').read_text().splitlines()
+    assert len(lines) == 1
@@ -0,0 +1,92 @@
+import numpy
+import pytest
+
+import optimization
+from gmshio import read_pos, write_pos
+from refinement import AdaptiveRefinement, error_indicator, target_sizes
+
+def structured(n : int = 16) -> numpy.ndarray:
+    """
+    Triangles (2 n^2,3,2) of a structured mesh of the unit square.
+    """
+    x, y = numpy.meshgrid(numpy.linspace(0.0,1.0,n + 1),numpy.linspace(0.0,1.0,n + 1),indexing='ij')
+    p = numpy.stack([x,y],axis=2)
+    a, b, c, d = p[:-1,:-1].reshape(-1,2), p[1:,:-1].reshape(-1,2), p[1:,1:].reshape(-1,2), p[:-1,1:].reshape(-1,2)
+    return numpy.concatenate([numpy.stack([a,b,c],axis=1),numpy.stack([a,c,d],axis=1)])
+
+def test_pos_round_trip(tmp_path):
+    triangles = structured(4)
+    values = numpy.random.default_rng(0).uniform(size=(triangles.shape[0],3))
+    write_pos(tmp_path / 'size.pos',name="size",triangles=triangles,values=values)
+
+    pos = read_pos(tmp_path / 'size.pos')
+    assert numpy.array_equal(pos['triangles'],triangles)
+    assert numpy.array_equal(pos['values'][:,:,0],values)
+
+def test_read_pos_vector(tmp_path):
+    """
+    Vector view as written by GETDP, only the first time step is kept.
+    """
+    (tmp_path / 'j.pos').write_text(
+        'View "j" {\n'
+        'VT(0,0,0,1,0,0,0,1,0){1,2,0,1,2,0,1,2,0,9,9,9,9,9,9,9,9,9};\n'
+        'VT(1,0,0,1,1,0,0,1,0){3,4,0,3,4,0,3,4,0,9,9,9,9,9,9,9,9,9};\n'
+        'TIME{0,1};\n'
+        '};\n'
+    )
+    pos = read_pos(tmp_path / 'j.pos')
+    assert pos['triangles'].shape == (2,3,2) and pos['values'].shape == (2,3,3)
+    assert numpy.array_equal(pos['triangles'][1],[[1,0],[1,1],[0,1]])
+    assert numpy.array_equal(pos['values'][:,0,0:2],[[1,2],[3,4]])
+
+def test_error_indicator():
+    """
+    The recovery is exact for a uniform current density, a jump is flagged on its two sides only.
+    """
+    triangles = structured()
+    uniform = numpy.tile([2.0,-1.0],(triangles.shape[0],1))
+    indicator, norm = error_indicator(triangles=triangles,j=uniform)
+    assert numpy.allclose(indicator,0.0,atol=1e-12)
+    assert numpy.isclose(norm,numpy.sqrt(5.0))
+
+    center = numpy.mean(triangles[:,:,0],axis=1)
+    jump = numpy.where(center < 0.5,1.0,2.0)[:,None] * uniform
+    indicator, _ = error_indicator(triangles=triangles,j=jump)
+    near = numpy.any(numpy.isclose(triangles[:,:,0],0.5),axis=1)
+    assert numpy.all(indicator[near] > 0.0)
+    assert numpy.allclose(indicator[~near],0.0,atol=1e-12)
+
+def test_target_sizes():
+    triangles = structured()
+    size = 1.0 / 16.0 * numpy.sqrt(2.0 / numpy.sqrt(3.0))
+    near = numpy.any(numpy.isclose(triangles[:,:,0],0.5),axis=1)
+    indicator = numpy.where(near,1.0,1e-6)
+
+    sizes = target_sizes(triangles=triangles,indicator=indicator,target=1e-2,min_size=1e-3,max_size=0.1)
+
+    # Refined (at most by max_factor) along the jump, coarsened (up to max_size) elsewhere
+    assert numpy.allclose(sizes[near],size / 4.0)
+    far = numpy.all(numpy.abs(triangles[:,:,0] - 0.5) > 0.2,axis=1)
+    assert numpy.allclose(sizes[far],0.1)
+
+    # A node has the same size in all its triangles
+    nodes, inverse = numpy.unique(triangles.reshape(-1,2),axis=0,return_inverse=True)
+    node_sizes = numpy.full(nodes.shape[0],numpy.nan)
+    node_sizes[inverse.reshape(-1)] = sizes.reshape(-1)
+    assert numpy.array_equal(node_sizes[inverse.reshape(-1)],sizes.reshape(-1))
+
+    # Bounds
+    sizes = target_sizes(triangles=triangles,indicator=indicator,target=1e-2,min_size=0.05,max_size=0.06)
+    assert numpy.all((sizes >= 0.05) & (sizes <= 0.06))
+
+def test_refinement_problem():
+    """
+    Levels are remeshed (not morphed) and solved with GETDP, which writes the current density.
+    """
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, morphing = True)
+    refinement = AdaptiveRefinement(problem=problem)
+    assert not refinement.problem.morphing and problem.morphing
+
+    problem = optimization.problem_homework_1(filenamebase="busbar.sym", outputfiles = ".sym", coef_I_inobj = 2.0, solver = "native")
+    with pytest.raises(AssertionError):
+        AdaptiveRefinement(problem=problem)
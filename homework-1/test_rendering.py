@@ -0,0 +1,55 @@
+import numpy
+import matplotlib.image
+
+from archive import FieldArchive
+from store import ResultStore
+from rendering import MapRenderer
+from test_archive import NAMES, maps
+
+def archive(path):
+    archive = FieldArchive(path=path / 'fields.bin',names=NAMES)
+    for i,slope in enumerate([1.0,2.0,3.0]):
+        archive.append(parameters={'DO_y' : 0.03 + 0.001 * i,'DO_a' : 0.0075,'DO_b' : 0.004},**maps(slope,n=8 + i))
+    return archive
+
+def test_scales(tmp_path):
+    renderer = MapRenderer(archive=archive(tmp_path))
+    scales = renderer.scales([0,2])
+    assert numpy.allclose(scales['v'],(0.0,3.0)) and numpy.allclose(scales['j'],(1.0,3.0)) and numpy.allclose(scales['losses'],(1.0,9.0))
+    assert numpy.allclose(renderer.scales([1])['j'],(2.0,2.0))
+
+def test_render(tmp_path,monkeypatch):
+    """
+    Views of several runs rendered in worker processes, without display.
+    """
+    monkeypatch.delenv('DISPLAY',raising=False)
+    renderer = MapRenderer(archive=archive(tmp_path),formats=["png","svg"],dpi=50,workers=2)
+    images = renderer.render([0,2])
+
+    assert set(images.keys()) == {0,2}
+    assert images[2]['losses'] == [tmp_path / 'maps' / 'losses.0002.png',tmp_path / 'maps' / 'losses.0002.svg']
+    for run in images.values():
+        for paths in run.values():
+            assert all(path.stat().st_size > 0 for path in paths)
+
+    # Same color scale : the constant losses of run 0 (smallest) and of run 2 (largest) have different colors
+    colors = [matplotlib.image.imread(images[i]['losses'][0]) for i in [0,2]]
+    center = [c[c.shape[0] // 2,c.shape[1] // 3,0:3] for c in colors]
+    assert not numpy.allclose(center[0],center[1])
+
+def test_logarithmic_scales(tmp_path):
+    """
+    Logarithmic scales start from the smallest positive value, the images go next to the result store.
+    """
+    fields = archive(tmp_path)
+    run = maps(1.0)
+    run['losses'][0:2] = [0.0,1e3]
+    fields.append(parameters=dict(zip(NAMES,[0.035,0.0075,0.004])),**run)
+
+    renderer = MapRenderer(archive=fields,store=ResultStore(path=tmp_path / 'store'),logarithmic=['j','losses'],dpi=50,workers=2)
+    assert renderer.directory == tmp_path / 'store.maps'
+    assert numpy.allclose(renderer.scales([0,3])['losses'],(1.0,1e3))
+    assert MapRenderer(archive=fields,store=ResultStore()).directory == tmp_path / 'maps'
+
+    images = renderer.render([3])
+    assert images[3]['losses'][0].exists() and images[3]['j'][0].exists()
@@ -0,0 +1,96 @@
+import sys
+import time
+import asyncio
+import contextlib
+import tempfile
+from pathlib import Path
+
+import numpy
+import pytest
+
+from scheduler import Scheduler, EvaluationFailed
+
+class SleepingProblem(object):
+    """
+    Stand-in for optimization.Problem whose 'executables' are Python one-liners:
+    meshing sleeps for x['sleep'] seconds and fails if x['fail'] > 0 (decremented at each attempt).
+    """
+    postpro = "Scalars"
+
+    def __init__(self,timeouts={}):
+        self.timeouts = timeouts
+        self.attempts = 0
+
+    @contextlib.contextmanager
+    def _scratch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            yield Path(tmp)
+
+    def _mesh_command(self,*,input_parameters_values,workdir):
+        self.attempts += 1
+        fail = input_parameters_values.get('fail',0) >= self.attempts
+        return [sys.executable,"-c",f"import time,sys; time.sleep({input_parameters_values['sleep']}); print('10 nodes 20 elements'); sys.exit({int(fail)})"]
+
+    def _mesh_counts(self,*,output,input_parameters_values):
+        return 10, 20
+
+    def _solve_command(self,*,input_parameters_values,workdir,postpro):
+        return [sys.executable,"-c","print('solved')"]
+
+    def _solve_metrics(self,*,output,input_parameters_values):
+        assert output.strip() == 'solved'
+        return {}
+
+    def _read(self,*,workdir):
+        return {'currents' : numpy.zeros(3)}
+
+def test_scheduler_concurrency():
+    problem = SleepingProblem()
+    started_at = time.time()
+    evaluations = Scheduler(concurrency=4).run(problem,[{'sleep' : 0.5}] * 4)
+    assert time.time() - started_at < 1.5
+    assert all(e['number_of_elements'] == 20 and e['metrics']['time_mesh'] >= 0.5 for e in evaluations)
+
+def test_scheduler_timeout_penalty():
+    problem = SleepingProblem(timeouts={'mesh' : 0.5})
+    started_at = time.time()
+    done = []
+    evaluations = Scheduler(concurrency=2,penalty=1e3).run(problem,[{'sleep' : 0.0},{'sleep' : 60.0}],done=lambda i,e : done.append(i))
+    assert time.time() - started_at < 10.0
+    assert evaluations[0] is not None and evaluations[1] is None
+    # Only the evaluations that succeeded are given to done
+    assert done == [0]
+
+    with pytest.raises(EvaluationFailed):
+        Scheduler(concurrency=2).run(problem,[{'sleep' : 60.0}])
+
+def test_scheduler_retries():
+    problem = SleepingProblem()
+    evaluation, = Scheduler(retries=2).run(problem,[{'sleep' : 0.0, 'fail' : 2}])
+    assert evaluation is not None and problem.attempts == 3
+
+    problem = SleepingProblem()
+    evaluation, = Scheduler(retries=1,penalty=1e3).run(problem,[{'sleep' : 0.0, 'fail' : 2}])
+    assert evaluation is None and problem.attempts == 2
+
+def test_scheduler_cancellation():
+    """
+    Once an evaluation meets the stop condition, the slow ones are cancelled (and their subprocesses killed).
+    """
+    problem = SleepingProblem()
+    started_at = time.time()
+    evaluations = Scheduler(concurrency=3).run(problem,[{'sleep' : 60.0},{'sleep' : 0.0},{'sleep' : 60.0}],stop=lambda e : True)
+    assert time.time() - started_at < 10.0
+    assert evaluations[1] is not None and evaluations[0] is None and evaluations[2] is None
+
+def test_scheduler_running_loop():
+    """
+    In a running event loop, run fails clearly and evaluate_many is awaited instead.
+    """
+    problem = SleepingProblem()
+    async def evaluate():
+        with pytest.raises(RuntimeError,match="await"):
+            Scheduler().run(problem,[{'sleep' : 0.0}])
+        return await Scheduler().evaluate_many(problem,[{'sleep' : 0.0}] * 2)
+    evaluations = asyncio.run(evaluate())
+    assert all(e is not None for e in evaluations)
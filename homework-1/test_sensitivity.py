@@ -5,10 +5,13 @@ import json
 
 from matplotlib import pyplot as plt
 import numpy
+import pytest
 import typeguard
 
 import optimization
+import sensitivity
 from test_mesh_convergence import set_common_props
+from test_surrogate import AnalyticProblem
 
 @typeguard.typechecked
 def prepare_points(*,GEOM_PARAMS_OPTIMAL : dict, name : str, SENSITIVITY_RANGE : float, NUM_PTS : int) -> numpy.ndarray:
@@ -37,11 +40,13 @@ def evaluate_sensitivity(
     sensitivity = {}
     filename = os.path.abspath(__file__).replace('.py',f'.{name}.json')
     if DO_EVAL:
-        for point in prepare_points(name=name,GEOM_PARAMS_OPTIMAL=GEOM_PARAMS_OPTIMAL,SENSITIVITY_RANGE=SENSITIVITY_RANGE,NUM_PTS=NUM_PTS):
-            params = copy.deepcopy(GEOM_PARAMS_OPTIMAL)
-            params[name] = point
-            logging.info(f"> Sensitivity : {name} : {params}")
-            currents = problem(x=params.values())
+        points = prepare_points(name=name,GEOM_PARAMS_OPTIMAL=GEOM_PARAMS_OPTIMAL,SENSITIVITY_RANGE=SENSITIVITY_RANGE,NUM_PTS=NUM_PTS)
+        params = []
+        for point in points:
+            params.append(copy.deepcopy(GEOM_PARAMS_OPTIMAL))
+            params[-1][name] = point
+            logging.info(f"> Sensitivity : {name} : {params[-1]}")
+        for point,currents in zip(points,problem.evaluate_many(points=[p.values() for p in params])):
             sensitivity[point] = problem.objective_func_inner(currents=currents)
         with open(filename,'w+') as f:
             json.dump(sensitivity,f)
@@ -114,6 +119,88 @@ def test_sensitivity_near_optimal():
     plt.savefig(os.path.abspath(__file__).replace('.py',f'.svg'))
     plt.close(fig)
 
+def test_sobol_indices_ishigami():
+    """
+    Compare with the analytic indices of the Ishigami function (a = 7, b = 0.1).
+    """
+    points = sensitivity.saltelli_design(d=3,n=4096)
+    x = numpy.pi * (2.0 * points - 1.0)
+    y = numpy.sin(x[:,0]) + 7.0 * numpy.sin(x[:,1])**2 + 0.1 * x[:,2]**4 * numpy.sin(x[:,0])
+    indices = sensitivity.sobol_indices(y,3)
+
+    assert numpy.allclose(indices['first'],[0.3139,0.4424,0.0   ],atol=0.02),indices
+    assert numpy.allclose(indices['total'],[0.5576,0.4424,0.2437],atol=0.02),indices
+    assert numpy.all(indices['total_ci'][:,0] <= indices['total']) and numpy.all(indices['total'] <= indices['total_ci'][:,1])
+
+def test_morris_indices_linear():
+    points = sensitivity.morris_design(d=3,trajectories=10)
+    assert points.shape == (40,3)
+    assert numpy.all((points >= 0.0) & (points <= 1.0))
+
+    indices = sensitivity.morris_indices(points,points @ numpy.array([1.0,-2.0,0.0]))
+    assert numpy.allclose(indices['mu'     ],[1.0,-2.0,0.0])
+    assert numpy.allclose(indices['mu_star'],[1.0, 2.0,0.0])
+    assert numpy.allclose(indices['sigma'  ],0.0)
+
+def test_indices_failed_points():
+    """
+    Trajectories and rows of the design with a failed (NaN) output are dropped and counted.
+    """
+    points = sensitivity.morris_design(d=3,trajectories=10)
+    y = points @ numpy.array([1.0,-2.0,0.0])
+    y[[1,6]] = numpy.nan
+    indices = sensitivity.morris_indices(points,y)
+    assert indices['dropped'] == 2
+    assert numpy.allclose(indices['mu'],[1.0,-2.0,0.0]) and numpy.allclose(indices['sigma'],0.0)
+
+    points = sensitivity.saltelli_design(d=3,n=4096)
+    y = points @ numpy.array([1.0,2.0,0.0])
+    reference = sensitivity.sobol_indices(y,3)
+    y[[5,4096 + 7,2 * 4096 + 4096 + 9]] = numpy.nan
+    indices = sensitivity.sobol_indices(y,3)
+    assert indices['dropped'] == 3 and reference['dropped'] == 0
+    assert numpy.all(numpy.isfinite(indices['total'])) and numpy.allclose(indices['total'],reference['total'],atol=0.01)
+
+    with pytest.raises(ValueError):
+        sensitivity.morris_indices(points[:4],numpy.full(4,numpy.nan))
+
+def test_sensitivity_analysis_reuses_points():
+    problem = AnalyticProblem()
+    analysis = sensitivity.SensitivityAnalysis(problem=problem)
+
+    indices = analysis.sobol(n=32)
+    assert len(problem.database) == indices['evaluations'] == 32 * 5
+
+    # DO_y and DO_a only enter through their sum, DO_b has a smaller effect on this range
+    assert indices['total'][0] > indices['total'][2] and indices['total'][1] > indices['total'][2]
+
+    # Same design again : nothing is evaluated
+    again = analysis.sobol(n=32)
+    assert len(problem.database) == 32 * 5
+    assert numpy.allclose(again['first'],indices['first'])
+
+def test_global_sensitivity_near_optimal():
+    """
+    Sobol indices of the objective within 1 percent of the optimal point.
+    """
+    GEOM_PARAMS_OPTIMAL = numpy.array([0.027866968988955805,0.010593076883293234,0.00635262054464091])
+
+    problem = optimization.problem_homework_1(
+        filenamebase = "busbar.sym",
+        outputfiles  = ".sym",
+        coef_I_inobj = 2.0,
+    )
+    analysis = sensitivity.SensitivityAnalysis(
+        problem = problem,
+        low     = list(0.99 * GEOM_PARAMS_OPTIMAL),
+        high    = list(1.01 * GEOM_PARAMS_OPTIMAL),
+    )
+    indices = analysis.sobol(n=16)
+    logging.info(f"> Sobol indices : {indices}")
+
+    assert indices['evaluations'] == 16 * 5
+    assert numpy.all(indices['total'] >= indices['first'] - 0.1)
+
 if __name__ == "__main__":
 
     test_sensitivity_near_optimal()
@@ -0,0 +1,65 @@
+import numpy
+
+from solver import NativeSolver
+from test_morphing import write_ellipse_annulus_msh
+
+# Conductivity of copper [S/m]
+SIGMA = 5.81e7
+
+def test_native_solver_from_pro():
+    """
+    Conductivity, regions and constraints are read from the .pro files.
+    """
+    solver = NativeSolver.from_pro('homework-1/busbar.sym.pro')
+    assert solver.sigma == SIGMA
+    assert solver.volume == 200
+    assert solver.electrodes == [201,202,203]
+    assert solver.currents == {201 : 375 / 2.0 / 0.002}
+    assert solver.potentials == {202 : 0.0, 203 : 0.0}
+
+    solver = NativeSolver.from_pro('homework-1/busbar.pro',overrides={'CP_thickn' : 0.001})
+    assert solver.electrodes == [201,202,203,204]
+    assert solver.currents == {201 : 375 / 0.001}
+
+def test_native_solver_annulus(tmp_path):
+    """
+    Current injected on the inner circle of an annulus and collected on the outer circle,
+    the voltage is I * ln(r2/r1) / (2 pi sigma).
+    """
+    write_ellipse_annulus_msh(tmp_path / 'annulus.msh',DO_a=0.01,DO_b=0.01,radius=3.0,nr=40,nt=160)
+    solver = NativeSolver(sigma=SIGMA,volume=200,electrodes=[201,202,205],currents={205 : 100.0},potentials={201 : 0.0, 202 : 0.0})
+    fields = solver.solve(msh_file=tmp_path / 'annulus.msh')
+
+    assert numpy.isclose(fields['currents'][2],100.0)
+    assert numpy.isclose(numpy.sum(fields['currents']),0.0,atol=1e-9)
+    assert numpy.allclose(fields['voltages'][0:2],0.0)
+    assert numpy.isclose(fields['voltages'][2],100.0 * numpy.log(3.0) / (2.0 * numpy.pi * SIGMA),rtol=1e-3)
+    assert numpy.isclose(fields['losses'][0],fields['voltages'][2] * 100.0)
+
+def test_native_solver_iterative_warm_start(tmp_path):
+    """
+    The conjugate gradient gives the solution of the direct solver, in fewer iterations
+    when started from the solution of a nearby design on the same mesh topology.
+    """
+    kwargs = {'sigma' : SIGMA, 'volume' : 200, 'electrodes' : [201,202,205], 'currents' : {205 : 100.0}, 'potentials' : {201 : 0.0, 202 : 0.0}}
+    write_ellipse_annulus_msh(tmp_path / 'reference.msh',DO_a=0.0101,DO_b=0.01,radius=3.0,nr=40,nt=160)
+    write_ellipse_annulus_msh(tmp_path / 'perturbed.msh',DO_a=0.0102,DO_b=0.01,radius=3.0,nr=40,nt=160)
+
+    solver = NativeSolver(**kwargs,iterative=True)
+    solver.solve(msh_file=tmp_path / 'reference.msh')
+    reference = solver.solution
+
+    cold = solver.solve(msh_file=tmp_path / 'perturbed.msh')
+    cold_iterations = solver.metrics['iterations']
+    warm = solver.solve(msh_file=tmp_path / 'perturbed.msh',initial=reference)
+    assert solver.metrics['iterations'] < cold_iterations
+
+    direct = NativeSolver(**kwargs).solve(msh_file=tmp_path / 'perturbed.msh')
+    for name in ['currents','voltages','losses']:
+        assert numpy.allclose(cold[name],direct[name],rtol=1e-8,atol=1e-9)
+        assert numpy.allclose(warm[name],direct[name],rtol=1e-8,atol=1e-9)
+
+    # Projection onto another mesh
+    write_ellipse_annulus_msh(tmp_path / 'other.msh',DO_a=0.0102,DO_b=0.01,radius=3.0,nr=30,nt=120)
+    other = solver.solve(msh_file=tmp_path / 'other.msh',initial=reference)
+    assert numpy.isclose(other['voltages'][2],direct['voltages'][2],rtol=1e-3)
@@ -0,0 +1,99 @@
+import os
+
+import numpy
+import pytest
+
+from store import ResultStore
+
+def row(i : int) -> dict:
+    return {
+        'currents' : numpy.array([1.0, -0.5, -0.5]) * i,
+        'losses'   : numpy.array([2.0 * i]),
+        'DO_y'     : 0.01 * i,
+    }
+
+def test_store_append_views():
+    """
+    Columns grow past their initial capacity and are exposed as (rows,width) float64 views.
+    """
+    store = ResultStore(capacity=2)
+    for i in range(5):
+        store.append(row(i))
+
+    assert len(store) == 5
+    assert store.columns == ['currents','losses','DO_y']
+    assert store['currents'].shape == (5,3) and store['currents'].dtype == numpy.float64
+    assert store['DO_y'].shape == (5,1)
+    assert numpy.allclose(store['losses'][:,0],2.0 * numpy.arange(5))
+
+    # Views, not copies
+    store['currents'][0,0] = 42.0
+    assert store['currents'][0,0] == 42.0
+
+    df = store.to_dataframe()
+    assert list(df.columns) == ['currents[0]','currents[1]','currents[2]','losses','DO_y']
+
+def test_store_stream_and_resume(tmp_path):
+    """
+    Rows are streamed to disk, can be memory-mapped while running, and appending resumes on reopening.
+    """
+    path = tmp_path / 'database'
+    store = ResultStore(path=path,capacity=2)
+    for i in range(3):
+        store.append(row(i))
+
+    columns = ResultStore.memmap(path=path)
+    assert columns['currents'].shape == (3,3)
+    assert numpy.allclose(columns['currents'],store['currents'])
+
+    # Simulate a row interrupted while being written
+    store._open('currents').write(numpy.zeros(3).tobytes())
+    store.close()
+
+    store = ResultStore(path=path)
+    assert len(store) == 3
+    store.append(row(3))
+    store.close()
+
+    columns = ResultStore.memmap(path=path)
+    assert all(v.shape[0] == 4 for v in columns.values())
+    assert numpy.allclose(columns['DO_y'][:,0],0.01 * numpy.arange(4))
+
+def test_store_schema_and_durability(tmp_path,monkeypatch):
+    """
+    Every row carries the columns of the first one, and each row is synchronized to the disk unless asked not to.
+    """
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os,'fsync',lambda fd : synced.append(fd) or fsync(fd))
+
+    store = ResultStore(path=tmp_path / 'durable')
+    store.append(row(0))
+    assert len(synced) == 1 + 3
+    with pytest.raises(ValueError):
+        store.append({**row(1),'time_record' : 0.0})
+    with pytest.raises(ValueError):
+        store.append({k : v for k,v in row(1).items() if k != 'DO_y'})
+    assert len(store) == 1
+    store.close()
+
+    synced.clear()
+    store = ResultStore(path=tmp_path / 'buffered',durable=False)
+    store.append(row(0))
+    store.close()
+    assert not synced
+
+def test_store_update(tmp_path):
+    """
+    A row already appended can be completed afterwards, in memory and on disk.
+    """
+    store = ResultStore(path=tmp_path)
+    for i in range(3):
+        store.append(row(i))
+    store.update(1,{'losses' : 42.0})
+    store.append(row(3))
+    store.close()
+
+    columns = ResultStore.memmap(path=tmp_path)
+    assert numpy.allclose(columns['losses'][:,0],[0.0,42.0,4.0,6.0])
+    assert numpy.allclose(store['losses'][:,0],columns['losses'][:,0])
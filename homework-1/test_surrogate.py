@@ -0,0 +1,69 @@
+import numpy
+
+from store import ResultStore
+from surrogate import GaussianProcess, SurrogateOptimizer, expected_improvement_abs
+
+class AnalyticProblem(object):
+    """
+    Stand-in for optimization.Problem with smooth analytic currents,
+    the imbalance vanishes on the plane DO_y + DO_a = 0.04.
+    """
+    input_parameters = {
+        "DO_y" : [0.035  , 0.03  , 0.04  ],
+        "DO_a" : [0.0075 , 0.005 , 0.01  ],
+        "DO_b" : [0.004  , 0.002 , 0.006 ],
+    }
+    coef_I_inobj = 2.0
+
+    def __init__(self):
+        self.database = ResultStore()
+
+    def evaluate_many(self,points,workers=None,stop=None,callback=None):
+        currents, stopped = [], False
+        for i,x in enumerate(points):
+            # Points after the one satisfying stop are cancelled
+            if stopped:
+                currents.append(None)
+                continue
+            x = dict(zip(self.input_parameters.keys(),x))
+            center = 62.5 * (1.0 + 20.0 * (x['DO_y'] + x['DO_a'] - 0.04) + 1e3 * x['DO_b']**2)
+            currents.append(numpy.array([187.5, -(187.5 - center), -center]))
+            self.database.append({'currents' : currents[-1],**x})
+            if callback is not None: callback(i,{'currents' : currents[-1],**x})
+            stopped = stop is not None and stop(currents[-1])
+        return currents
+
+    def objective_func_inner(self,*,currents):
+        return numpy.abs(numpy.abs(currents[1]) - self.coef_I_inobj * numpy.abs(currents[2]))
+
+def test_gaussian_process_interpolates():
+    rng = numpy.random.default_rng(0)
+    X = rng.uniform(size=(20,2))
+    y = numpy.sin(3 * X[:,0]) + X[:,1]**2
+    gp = GaussianProcess().fit(X,y)
+    mean, std = gp.predict(X)
+    assert numpy.allclose(mean,y,atol=1e-3)
+    assert numpy.all(std < 1e-2)
+
+    X_test = rng.uniform(size=(10,2))
+    mean, std = gp.predict(X_test)
+    assert numpy.allclose(mean,numpy.sin(3 * X_test[:,0]) + X_test[:,1]**2,atol=5e-2)
+
+def test_expected_improvement_abs():
+    """
+    Compare with Monte Carlo sampling.
+    """
+    rng = numpy.random.default_rng(0)
+    mean, std, best = numpy.array([0.3,-0.2,2.0]), numpy.array([0.5,0.1,0.4]), 0.5
+    samples = rng.normal(mean,std,size=(200000,3))
+    expected = numpy.mean(numpy.clip(best - numpy.abs(samples),0.0,None),axis=0)
+    assert numpy.allclose(expected_improvement_abs(mean,std,best),expected,atol=2e-3)
+
+def test_surrogate_optimizer():
+    problem = AnalyticProblem()
+    result = SurrogateOptimizer(problem=problem,max_evaluations=25,batch_size=3).run()
+
+    assert result['evaluations'] <= 25
+    assert len(problem.database) == result['evaluations']
+    assert result['objective'] < 0.05,result
+    assert result['model_std'] >= 0.0
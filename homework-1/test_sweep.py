@@ -0,0 +1,56 @@
+import numpy
+import pytest
+
+import sweep
+from store import ResultStore
+from test_surrogate import AnalyticProblem
+
+class InterruptedProblem(AnalyticProblem):
+    """
+    Analytic problem interrupted (Ctrl-C) at its n-th point.
+    """
+    def __init__(self,n):
+        super().__init__()
+        self.n = n
+
+    def evaluate_many(self,points,workers=None,stop=None,callback=None):
+        def interrupted(i,row):
+            self.n -= 1
+            if self.n == 0:
+                raise KeyboardInterrupt
+            callback(i,row)
+        return super().evaluate_many(points,workers,stop,interrupted)
+
+def test_sweep_designs():
+    low, high = [0.0,1.0,2.0], [1.0,3.0,6.0]
+    factorial = sweep.design(kind="factorial",size=4,low=low,high=high)
+    assert factorial.shape == (64,3)
+    assert numpy.allclose(factorial[1],[0.0,1.0,2.0 + 4.0 / 3.0])
+    for kind in ["lhs","sobol"]:
+        points = sweep.design(kind=kind,size=32,low=low,high=high)
+        assert points.shape == (32,3)
+        assert numpy.all((points >= low) & (points <= high))
+        assert numpy.allclose(points,sweep.design(kind=kind,size=32,low=low,high=high))
+
+def test_sweep_resume(tmp_path):
+    # Interrupted in the middle of the third batch : the points done before are stored
+    with pytest.raises(KeyboardInterrupt):
+        sweep.Sweep(problem=InterruptedProblem(10),path=tmp_path,kind="lhs",size=20,batch_size=4).run()
+    partial = ResultStore.memmap(path=tmp_path)
+    assert numpy.array_equal(partial['design_index'][:,0],numpy.arange(9))
+
+    # Resume : only the remaining points are evaluated
+    problem = AnalyticProblem()
+    s = sweep.Sweep(problem=problem,path=tmp_path,kind="lhs",size=20,batch_size=4)
+    df = s.run()
+    s.close()
+    assert len(problem.database) == 11
+    assert sorted(df['design_index'].astype(int).tolist()) == list(range(20))
+
+    # Same results as a sweep without interruption
+    reference = sweep.Sweep(problem=AnalyticProblem(),path=tmp_path / 'reference',kind="lhs",size=20).run()
+    assert numpy.allclose(df.sort_values('design_index')['currents[2]'],reference.sort_values('design_index')['currents[2]'])
+
+    # Another design in the same directory is refused
+    with pytest.raises(ValueError):
+        sweep.Sweep(problem=AnalyticProblem(),path=tmp_path,kind="sobol",size=16)